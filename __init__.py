@@ -36,20 +36,10 @@ this package (see the file GPL-3 in the top-level study/ directory).  If not,
 see <http://www.gnu.org/licenses/>.
 """
 
-# Basics:
-import snake
-import cache
-
-# Extensions:
-import crypt
-import maths
-import stats
-import parse
-
-# The Quantity-based universe:
-import value
-import chemy
-import space
+# Sub-packages are imported on first use (see the end of this file):
+Packages = ('snake', 'cache', # basics
+            'crypt', 'maths', 'stats', 'parse', # extensions
+            'value', 'chemy', 'space') # the Quantity-based universe
 
 Advocacy = """I enjoy coding in python.
 
@@ -128,3 +118,9 @@ TODO = """There are many things that could be improved.
    - can no longer use tuple-parameter unpack, e.g. lambda (k, v): k
    - study PEP 3141, a type hierarchy for numbers
 """
+
+# Import sub-packages lazily, so that importing any one of them doesn't cost
+# the time it would take to import all of them:
+from study.cache.module import Package
+Package.install(__name__, Packages)
+del Package
@@ -2,15 +2,18 @@
 
 Provides:
   lockdir -- directory locking used by whole
-  mapping -- a lazily-populated dictionary, LazyDict
+  mapping -- lazily-populated mapping, LazyDict, and function cache, LazyFunc,
+             with bounded cache policies
+  persist -- remembering, on disk, the answers of expensive pure functions
   property -- cached attributes, computed on depand
   weak -- weakly remembering things you can compute at will
   whole -- saving, to disk, data about integer-bounded ranges of the number line
 
 See study.LICENSE for copyright and license information.
 """
-import lockdir
-# import mapping # cycle with study.snake.sequence
-import property
-#import weak # cycle with study.snake.sequence.ReadOnlySeq
-#import whole # not until it's stable ...
+from study.cache.module import Package
+# Imported on demand, so mapping's and weak's cycles with study.snake.sequence
+# are harmless, but whole isn't stable yet:
+Package.install(__name__, ('lockdir', 'mapping', 'module', 'persist',
+                           'property', 'weak'))
+del Package
@@ -2,11 +2,17 @@
 
 Contents:
   LazyDict -- mapping populated with data only when needed
+  Policy -- base for cache-management policies; on its own, unbounded
+  LeastRecent -- bounded policy that forgets the least-recently used (LRU)
+  LeastFrequent -- bounded policy that forgets the least-frequently used (LFU)
+  Cheapest -- bounded policy that forgets what was quickest to compute
+  Expiring -- policy that forgets entries after a fixed time (TTL)
+  Weighed -- policy that bounds the total size, in bytes, of its values
   LazyFunc -- callable that caches responses for an underlying callable
 
 See study.LICENSE for copyright and license information.
 """
-from study.snake.sequence import Dict, List
+from study.snake.sequence import Dict, WrapIterable
 
 class LazyDict (Dict):
     def __init__(self, each=None, fill=None):
@@ -49,31 +55,331 @@ class LazyDict (Dict):
         self[key] = ans = e(key)
         return ans
 
+class Policy (object):
+    """Base class for LazyFunc's cache-management policies.
+
+    A policy is a mapping from LazyFunc's keys to the values it has cached,
+    that may decide to forget some of them.  It records how often a look-up
+    found what it wanted (hits), how often it didn't (misses) and how many
+    entries it has chosen to forget (evictions); see stats().  Derived
+    classes over-ride the methods whose names start with an underscore; each
+    should take amortised O(1) time.
+
+    The base class, with no size limit, is the policy LazyFunc uses when none
+    is specified, so that the cache only gets trimmed by explicit calls to
+    LazyFunc.flush().  Given a size, it evicts arbitrary entries.\n"""
+
+    def __init__(self, size=None):
+        """Set up an empty cache.
+
+        Optional argument, size, is the maximum number of entries to retain,
+        or None (the default) for no bound.  Not all policies honour it.\n"""
+        assert size is None or size > 0, 'Cache of no size is no cache'
+        self.size, self.hits, self.misses, self.evictions = size, 0, 0, 0
+        self._store = self._bok()
+
+    @staticmethod
+    def _bok(D=Dict): return D()
+
+    def __len__(self): return len(self._store)
+    def __contains__(self, key): return key in self._store
+    def __delitem__(self, key): self._forget(key)
+    def iteritems(self, W=WrapIterable): return W(self._items())
+
+    def __getitem__(self, key):
+        try: ans = self._fetch(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return ans
+
+    def store(self, key, value, cost=0):
+        """Record a value just computed.
+
+        Required arguments are the key and value to record; optional third
+        argument, cost, is how long (in seconds) it took to compute the
+        value.  If the cache is full before adding this entry, entries
+        shall first be evicted to make room for it.\n"""
+        if self.size is not None and key not in self._store:
+            while len(self) >= self.size:
+                self._evict()
+                self.evictions += 1
+        self._add(key, value, cost)
+
+    def stats(self):
+        """Returns a mapping describing how well the cache is working."""
+        size = len(self) # first, as it may purge, counting evictions
+        return { 'hits': self.hits, 'misses': self.misses,
+                 'evictions': self.evictions, 'size': size }
+
+    # Derived classes over-ride these:
+    def _fetch(self, key): return self._store[key]
+    def _add(self, key, value, cost): self._store[key] = value
+    def _forget(self, key): del self._store[key]
+    def _items(self): return self._store.iteritems()
+    def _evict(self): self._store.popitem()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.size)
+
+from collections import OrderedDict
+class LeastRecent (Policy):
+    """Bounded cache that forgets whatever it has gone longest without using.
+    """
+    def __init__(self, size=64): Policy.__init__(self, size)
+    @staticmethod
+    def _bok(D=OrderedDict): return D()
+
+    def _fetch(self, key):
+        ans = self._store.pop(key) # raises KeyError if absent
+        self._store[key] = ans # now most recent
+        return ans
+
+    def _evict(self): self._store.popitem(False)
+
+class LeastFrequent (Policy):
+    """Bounded cache that forgets whatever it has been asked for least often.
+
+    Entries are kept in buckets by the number of times they have been used,
+    each bucket in order of last use; the least-used bucket's stalest entry
+    is the one to go, when the cache gets full.  Tracking which bucket is
+    least-used, and moving entries between buckets, each take O(1) time.\n"""
+    def __init__(self, size=64):
+        Policy.__init__(self, size)
+        self.__counts, self.__least = {}, 0
+
+    def _fetch(self, key):
+        pair = self._store[key] # raises KeyError if absent
+        old = pair[1]
+        bucket = self.__counts[old]
+        del bucket[key]
+        if not bucket:
+            del self.__counts[old]
+            if self.__least == old: self.__least = old + 1
+        pair[1] = old + 1
+        self.__bucket(old + 1)[key] = None
+        return pair[0]
+
+    def __bucket(self, count, D=OrderedDict):
+        try: return self.__counts[count]
+        except KeyError: pass
+        ans = self.__counts[count] = D()
+        return ans
+
+    def _add(self, key, value, cost):
+        if key in self._store: self._forget(key)
+        self._store[key] = [value, 1]
+        self.__bucket(1)[key] = None
+        self.__least = 1
+
+    def _forget(self, key):
+        count = self._store.pop(key)[1]
+        bucket = self.__counts[count]
+        del bucket[key]
+        if not bucket:
+            del self.__counts[count]
+            if self.__least == count:
+                self.__least = min(self.__counts) if self.__counts else 0
+
+    def _items(self):
+        for k, v in self._store.iteritems(): yield k, v[0]
+
+    def _evict(self):
+        bucket = self.__counts[self.__least]
+        key = bucket.popitem(False)[0]
+        del self._store[key]
+        if not bucket:
+            del self.__counts[self.__least]
+            # Only happens when adding; _add() promptly resets __least to 1.
+            self.__least = 0
+
+class Cheapest (Policy):
+    """Bounded cache that forgets whatever was quickest to compute.
+
+    Costs are grouped into classes by their order of magnitude (in binary:
+    entries in the same class took between t and 2*t to compute, for some
+    t); when the cache is full, the least-recently used entry in the
+    cheapest class is forgotten.  There are only a few dozen classes, so
+    finding the cheapest non-empty one takes O(1) time.\n"""
+    def __init__(self, size=64, quantum=1e-6):
+        """Set up an empty cost-aware cache.
+
+        Optional arguments:
+          size -- maximum number of entries to retain; default 64
+          quantum -- smallest cost worth distinguishing from zero, in
+                     seconds; default is one micro-second.\n"""
+        Policy.__init__(self, size)
+        self.__quantum, self.__grades = quantum, {}
+
+    def __grade(self, cost): return int(cost / self.__quantum).bit_length()
+
+    def _fetch(self, key):
+        pair = self._store[key] # raises KeyError if absent
+        bucket = self.__grades[pair[1]]
+        del bucket[key]
+        bucket[key] = None # now most recent in its grade
+        return pair[0]
+
+    def _add(self, key, value, cost, D=OrderedDict):
+        if key in self._store: self._forget(key)
+        grade = self.__grade(cost)
+        self._store[key] = (value, grade)
+        try: bucket = self.__grades[grade]
+        except KeyError: bucket = self.__grades[grade] = D()
+        bucket[key] = None
+
+    def _forget(self, key):
+        grade = self._store.pop(key)[1]
+        bucket = self.__grades[grade]
+        del bucket[key]
+        if not bucket: del self.__grades[grade]
+
+    def _items(self):
+        for k, v in self._store.iteritems(): yield k, v[0]
+
+    def _evict(self):
+        grade = min(self.__grades)
+        bucket = self.__grades[grade]
+        del self._store[bucket.popitem(False)[0]]
+        if not bucket: del self.__grades[grade]
+
+import time
+class Expiring (Policy):
+    """Cache that forgets each entry a fixed time after it was computed.
+
+    Since every entry lives equally long, entries expire in the order in
+    which they were added; so checking for expired entries only ever needs to
+    look at the oldest, making the purge amortised O(1).  If a size is also
+    given, the oldest entries are evicted early to stay within it.\n"""
+    def __init__(self, life, size=None, clock=time.time):
+        """Set up an empty expiring cache.
+
+        Required argument, life, is the number of seconds for which each entry
+        shall be remembered.  Optional arguments:
+          size -- maximum number of entries to retain; default None, no limit
+          clock -- function returning the current time, in seconds; default
+                   is time.time\n"""
+        assert life > 0, 'Entries must live long enough to be used'
+        Policy.__init__(self, size)
+        self.__life, self.__clock = life, clock
+
+    @staticmethod
+    def _bok(D=OrderedDict): return D()
+
+    def __purge(self):
+        now, store = self.__clock(), self._store
+        while store:
+            key, pair = next(store.iteritems())
+            if pair[1] > now: break
+            del store[key]
+            self.evictions += 1
+
+    def __len__(self):
+        self.__purge()
+        return len(self._store)
+
+    def _fetch(self, key):
+        self.__purge()
+        return self._store[key][0]
+
+    def _add(self, key, value, cost):
+        self.__purge()
+        self._store.pop(key, None)
+        self._store[key] = (value, self.__clock() + self.__life)
+
+    def _items(self):
+        self.__purge()
+        for k, v in self._store.items(): yield k, v[0]
+
+    def _evict(self): self._store.popitem(False)
+
+import sys
+class Weighed (LeastRecent):
+    """Bounded cache that limits how much memory its values use.
+
+    Where other policies count entries, this one weighs each value (by
+    default, with sys.getsizeof) and keeps the total weight within its size,
+    forgetting the least-recently used entries to make room.  A value heavier
+    than the whole budget is simply not stored.  This suits caches whose
+    values vary wildly in size, such as big integers.\n"""
+    def __init__(self, size=1 << 20, weigh=sys.getsizeof):
+        """Set up an empty weight-bounded cache.
+
+        Optional arguments:
+          size -- maximum total weight of values to retain; default 2**20
+          weigh -- function returning a value's weight; default sys.getsizeof,
+                   which makes size a number of bytes.\n"""
+        LeastRecent.__init__(self, size)
+        self.__weigh, self.load = weigh, 0
+
+    def store(self, key, value, cost=0):
+        """Record a value just computed; see Policy.store().
+
+        Evicts least-recently used entries until value fits; if it doesn't
+        fit even in an empty cache, nothing is stored.\n"""
+        if key in self._store: self._forget(key)
+        weight = self.__weigh(value)
+        if weight > self.size: return
+        while self._store and self.load + weight > self.size:
+            self._evict()
+            self.evictions += 1
+        self._add(key, value, cost)
+
+    def stats(self):
+        """As for Policy.stats(), with 'load', the total weight held."""
+        ans = LeastRecent.stats(self)
+        ans['load'] = self.load
+        return ans
+
+    def _fetch(self, key): return LeastRecent._fetch(self, key)[0]
+    def _add(self, key, value, cost):
+        pair = self._store[key] = (value, self.__weigh(value))
+        self.load += pair[1]
+    def _forget(self, key): self.load -= self._store.pop(key)[1]
+    def _items(self):
+        for k, v in self._store.iteritems(): yield k, v[0]
+    def _evict(self): self.load -= self._store.popitem(False)[1][1]
+del sys
+
+del OrderedDict
+
 class LazyFunc (object):
     """Wrapper for a function, to cache its values.
 
     Use class method wrap() to wrap a function unless you know the function
     isn't already cached; otherwise, you'll duplicate the cache !\n"""
     @classmethod
-    def wrap(cls, func):
-        """Use this in preference to direct construction."""
-        return func if isinstance(func, cls) else cls(func)
+    def wrap(cls, func, policy=None):
+        """Use this in preference to direct construction.
 
-    def __init__(self, func):
-        self.__func = func
-        self.__cache = self.__bok()
+        If func is already a LazyFunc it is returned unchanged (and policy is
+        ignored); otherwise, it is wrapped using the given policy.\n"""
+        return func if isinstance(func, cls) else cls(func, policy)
 
-    @staticmethod
-    def __bok(D=Dict): return D()
-    def __seq(self, S=List): return S(self.__cache.iteritems())
+    def __init__(self, func, policy=None):
+        """Wrap a function to cache its values.
+
+        Required argument, func, is the function to wrap.  Optional argument,
+        policy, is a Policy instance (e.g. LeastRecent(256)) that shall manage
+        the cache; if None (the default) an unbounded Policy() is used, which
+        only forgets values when .flush() is called.\n"""
+        self.__func = func
+        self.__cache = Policy() if policy is None else policy
 
     def __call__(self, *args, **what):
         key = (args, tuple(what.items()))
-        try: ans = self.__cache[key]
-        except KeyError:
-            ans = self.__cache[key] = apply(self.__func, args, what)
+        try: return self.__cache[key]
+        except KeyError: pass
+
+        start = self.__clock()
+        ans = apply(self.__func, args, what)
+        self.__cache.store(key, ans, self.__clock() - start)
         return ans
 
+    @staticmethod
+    def __clock(now=time.time): return now()
+
     def known(self):
         """Returns an iterator over known (key, value) pairs.
 
@@ -84,7 +390,20 @@ class LazyFunc (object):
         method the returned study.snake.sequence.Iterable supports.\n"""
         return self.__cache.iteritems()
 
-    def flush(self, keep=0, are=lambda (k, v), (h, u): cmp(abs(v), abs(u))):
+    def stats(self):
+        """Report how well the cache is working.
+
+        Returns a mapping from 'hits', 'misses', 'evictions' and 'size' to,
+        respectively, the number of calls answered from the cache, the number
+        that had to call the wrapped function, the number of cache entries the
+        cache's policy has discarded and the number currently cached.  Note
+        that entries discarded by .flush() don't count as evictions.\n"""
+        return self.__cache.stats()
+
+    import heapq
+    from functools import cmp_to_key
+    def flush(self, keep=0, are=lambda (k, v), (h, u): cmp(abs(v), abs(u)),
+              best=heapq.nsmallest, key=cmp_to_key):
         """Forget surplus cached values.
 
         Arguments are optional:
@@ -92,12 +411,17 @@ class LazyFunc (object):
           are - comparison function, taking two (input, output) pairs; should
                 return -1 if you'd sooner remeber the first pair, +1 if you'd
                 sooner keep the later pair or 0 if you don't care.
+        Further arguments should not be passed.
 
         After a call to .flush(keep), previously-evaluated calls to the
-        function self packages shall be evaluated again, if needed.\n"""
+        function self packages shall be evaluated again, if needed.  Only the
+        keep best entries are selected, so this takes O(n.log(keep)) time,
+        rather than sorting the whole cache.\n"""
         if len(self.__cache) > keep:
-            for (k, v) in self.__seq().sorted(are):
-                if keep > 0: keep -= 1
-                else: del self.__cache[k]
+            good = set(k for k, v in
+                       best(keep, self.__cache.iteritems(), key(are)))
+            for k in [k for k, v in self.__cache.iteritems() if k not in good]:
+                del self.__cache[k]
+    del heapq, cmp_to_key
 
-del List, Dict
+del time, WrapIterable, Dict
@@ -18,6 +18,14 @@ all the imports done lazily.
 To reload one of these lazily-loaded attributes, e.g. following an update to its
 source file, just del the relevant attribute.  Next time it's accessed, it'll be
 lazily reloaded.
+
+For an ordinary python package, which wants its sub-modules (and maybe some
+names from them) available as attributes without paying the cost of importing
+them until they're actually used, see Package.install(); to find out what
+importing a module costs, importcost(); and, for modules that use numpy when
+it's available but can do without it, numpy().
+
+See study.LICENSE for copyright and license information.
 """
 from __builtin__ import __class__ as modbase
 # module is actually in __builtins__, but we can't reference it as such !
@@ -138,4 +146,133 @@ in %s
 
     del os
 
+class Package (modbase):
+    """A package whose sub-modules are only imported when first used.
+
+    Python 2 has no module-level __getattr__, so a package that wants to
+    defer importing its sub-modules replaces itself, in sys.modules, with an
+    instance of this class; see Package.install().  Accessing an attribute
+    the package doesn't (yet) have then imports the sub-module of that name,
+    or the sub-module from which that name is to be taken, and remembers the
+    result as an attribute of the package, so later look-ups are as cheap as
+    for any other module attribute.\n"""
+
+    import sys
+    @classmethod
+    def install(cls, name, subs=(), names=None, modmap=sys.modules):
+        """Replace a package with a lazy version of itself.
+
+        Required argument, name, is the package's name, as used in
+        sys.modules; a package's __init__.py should pass its __name__.
+        Optional arguments:
+          subs -- sequence of names of sub-modules to import on demand
+          names -- mapping from names to the sub-modules from which to import
+                   them on demand (e.g. { 'Quantity': 'quantity' })
+
+        The original module is retained and attribute look-ups that the
+        replacement can't satisfy are delegated to it, so the package's
+        __init__.py can go on defining (or del-ing) names after calling this.
+        Returns the replacement module.\n"""
+        old = modmap[name]
+        new = cls(name, old.__doc__, subs, names, old)
+        for key in ('__file__', '__path__', '__package__'):
+            try: setattr(new, key, getattr(old, key))
+            except AttributeError: pass
+        modmap[name] = new
+        return new
+    del sys
+
+    __upinit = modbase.__init__
+    def __init__(self, name, doc, subs, names, shadow):
+        """Internal constructor; use install() to create instances."""
+        self.__upinit(name, doc)
+        self.__subs, self.__names = frozenset(subs), dict(names or {})
+        # Keep the original alive: functions defined in it use its globals,
+        # which python clears when a module is garbage-collected.
+        self.__original, self.__shadow = shadow, shadow.__dict__
+
+    import importlib
+    def __getattr__(self, key, load=importlib.import_module):
+        if key.startswith('_Package__'): raise AttributeError(key)
+        try: ans = self.__shadow[key]
+        except KeyError:
+            if key in self.__subs: ans = load(self.__name__ + '.' + key)
+            else:
+                try: mod = self.__names[key]
+                except KeyError:
+                    raise AttributeError('No such attribute or sub-module',
+                                         key, self.__name__)
+                ans = getattr(load(self.__name__ + '.' + mod), key)
+
+        setattr(self, key, ans)
+        return ans
+    del importlib
+
+    def __dir__(self):
+        return sorted(k for k in set(self.__dict__) | set(self.__shadow)
+                      | self.__subs | set(self.__names)
+                      if not k.startswith('_Package__'))
+
+    def __repr__(self):
+        return "<lazily-importing package '%s'>" % self.__name__
+
 del modbase
+
+def importcost(name, python=None):
+    """Measure how long importing a module takes, in a fresh interpreter.
+
+    Required argument, name, is the dotted name of the module to import.
+    Optional argument, python, is the interpreter to use; by default, the one
+    running this function.  A new process is started, so the import is cold
+    (but any compiled .pyc files shall be used, if present); the module's
+    parent directory is taken from this process's sys.path.
+
+    Returns a twople: the total time in seconds the import took and a list of
+    (seconds, module) twoples, most costly first, giving the time spent
+    importing each module, excluding time spent on the modules it imported
+    in turn.\n"""
+    import os, sys, subprocess
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    script = """import sys, time, __builtin__
+orig, stack, cost = __builtin__.__import__, [], {}
+def timed(name, *args, **kw):
+    before, start = set(sys.modules), time.time()
+    stack.append(0.)
+    try: return orig(name, *args, **kw)
+    finally:
+        took, inner = time.time() - start, stack.pop()
+        new = [m for m in set(sys.modules) - before if sys.modules[m] is not None]
+        if new:
+            mine = [m for m in new if m == name or m.endswith('.' + name)]
+            key = min(mine or new, key=len)
+            cost[key] = cost.get(key, 0) + took - inner
+        if stack: stack[-1] += took
+__builtin__.__import__ = timed
+start = time.time()
+__import__(sys.argv[1])
+print repr(time.time() - start)
+for k, v in cost.items(): print repr(v), k
+"""
+    proc = subprocess.Popen([python or sys.executable, '-c', script, name],
+                            stdout=subprocess.PIPE, env=env)
+    out = proc.communicate()[0]
+    if proc.returncode:
+        raise ImportError('Failed to import in a fresh interpreter', name)
+
+    lines = out.splitlines()
+    each = [(float(t), m) for t, m in (l.split(None, 1) for l in lines[1:])]
+    each.sort(reverse=True)
+    return float(lines[0]), each
+
+def numpy(cache=[]):
+    """Returns the numpy module, or None if it isn't available.
+
+    The import is only attempted on the first call; modules that can use
+    numpy, but don't need it, import this (as _numpy) and call it when they
+    have work numpy could help with.  Do not pass any arguments.\n"""
+    if not cache:
+        try: import numpy
+        except ImportError: numpy = None
+        cache.append(numpy)
+    return cache[0]
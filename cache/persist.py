@@ -0,0 +1,250 @@
+"""Remembering, on disk, the answers of expensive pure functions.
+
+Some functions (large factorials, Legendre polynomials' coefficients and the
+like) take long enough to compute, for inputs that get asked for often enough,
+that it's worth remembering their answers not only within a process (as
+study.cache.mapping.LazyFunc does) but across processes, and from one run of
+a program to the next.  This module provides a Store, that remembers pickled
+answers in an sqlite database, and a decorator that consults it.
+
+Provides:
+  Store -- an on-disk cache of function answers, keyed by function and inputs
+  persistent -- decorator that makes a function consult a Store
+
+The database is opened in write-ahead-log mode, so that any number of
+processes can read it while one writes to it; each write is a single
+transaction, so a crash part way through leaves the store as it was before.
+Each Store has a limit on the total size of the pickled answers it holds; when
+adding a new answer takes it over this limit, the oldest answers are
+forgotten.  Any failure to read or write the database is treated as a cache
+miss, so a read-only or missing home directory simply means answers are
+computed afresh, just as they would be without the cache.
+
+See study.LICENSE for copyright and license information.
+"""
+
+import os, sqlite3, cPickle, hashlib, time
+
+class Store (object):
+    """An sqlite file remembering answers of functions.
+
+    Each answer is filed under the name of the function that computed it and
+    a hash of the pickled inputs that were passed to it.  Answers are stored
+    pickled, so must be picklable (other answers are simply not remembered).
+    Methods get() and put() are the interface persistent() uses.\n"""
+
+    def __init__(self, path=None, limit=1 << 28, timeout=30):
+        """Set up access to an on-disk store.
+
+        All arguments are optional:
+          path -- name of the database file; default is taken from environment
+                  variable STUDY_MEMO, if set, else memo.db in ~/.cache/study/
+          limit -- maximum number of bytes of pickled answers to retain;
+                   default is 256 MiB
+          timeout -- number of seconds to wait for another process to finish
+                     writing, before giving up on a write; default, 30.
+
+        The database itself is only opened when first needed (and re-opened
+        in any child process forked after that), so constructing a Store is
+        cheap.\n"""
+        if path is None:
+            path = os.environ.get('STUDY_MEMO') or os.path.join(
+                os.path.expanduser('~'), '.cache', 'study', 'memo.db')
+        self.path, self.limit, self.__timeout = path, limit, timeout
+        self.__db = self.__pid = None
+
+    __schema = ('CREATE TABLE IF NOT EXISTS memo (func TEXT, hash TEXT,'
+                ' value BLOB, size INTEGER, stamp REAL,'
+                ' PRIMARY KEY (func, hash))',
+                'CREATE INDEX IF NOT EXISTS memo_stamp ON memo (stamp)',
+                'CREATE TABLE IF NOT EXISTS total (bytes INTEGER)')
+    def __connect(self):
+        # Connections mustn't be shared across fork(), so key on process ID:
+        if self.__db is not None and self.__pid == os.getpid():
+            return self.__db
+
+        dir = os.path.dirname(self.path)
+        if dir and not os.path.isdir(dir): os.makedirs(dir)
+        db = sqlite3.connect(self.path, timeout=self.__timeout,
+                             isolation_level='IMMEDIATE')
+        db.text_factory = str
+        db.execute('PRAGMA journal_mode=WAL')
+        with db:
+            for sql in self.__schema: db.execute(sql)
+            if db.execute('SELECT COUNT(*) FROM total').fetchone()[0] == 0:
+                db.execute('INSERT INTO total VALUES (0)')
+
+        self.__db, self.__pid = db, os.getpid()
+        return db
+
+    @staticmethod
+    def key(args, kw, hasher=hashlib.sha1, dump=cPickle.dumps):
+        """Hash the inputs of a function call.
+
+        Takes a tuple args and a mapping kw, as passed to func(*args, **kw),
+        and returns a hex string digest of them.  Raises whatever pickling
+        does if any argument can't be pickled.\n"""
+        return hasher(dump((args, sorted(kw.items())), 2)).hexdigest()
+
+    def get(self, func, hash, load=cPickle.loads,
+            bad=(cPickle.UnpicklingError, EOFError, AttributeError,
+                 ImportError, ValueError, IndexError, TypeError)):
+        """Look up a remembered answer.
+
+        Takes the name of a function and a hash as returned by .key(); returns
+        the answer remembered for these, or raises KeyError if there isn't
+        one.  An answer that can't be unpickled (e.g. because the class it's
+        an instance of has since moved, or the row is corrupt) is forgotten
+        and treated as missing.\n"""
+        try:
+            row = self.__connect().execute(
+                'SELECT value FROM memo WHERE func = ? AND hash = ?',
+                (func, hash)).fetchone()
+        except (sqlite3.Error, EnvironmentError): row = None
+        if row is None: raise KeyError(func, hash)
+        try: return load(str(row[0]))
+        except bad: pass
+        self.__forget(func, hash)
+        raise KeyError(func, hash)
+
+    def __forget(self, func, hash):
+        try:
+            db = self.__connect()
+            with db:
+                row = db.execute('SELECT size FROM memo'
+                                 ' WHERE func = ? AND hash = ?',
+                                 (func, hash)).fetchone()
+                if row is not None:
+                    db.execute('DELETE FROM memo WHERE func = ? AND hash = ?',
+                               (func, hash))
+                    db.execute('UPDATE total SET bytes = MAX(bytes - ?, 0)',
+                               row)
+        except (sqlite3.Error, EnvironmentError): pass
+
+    def put(self, func, hash, value, dump=cPickle.dumps, now=time.time,
+            bad=(cPickle.PicklingError, TypeError)):
+        """Remember an answer.
+
+        Takes the name of a function, a hash as returned by .key() and the
+        answer to remember for them.  If the answer can't be pickled, or the
+        database can't be written, nothing is remembered.  If remembering it
+        takes the store over its limit, the oldest answers are forgotten until
+        only three quarters of the limit is in use.\n"""
+        try: blob = dump(value, 2)
+        except bad: return
+        size = len(blob)
+        if size > self.limit: return
+
+        try:
+            db = self.__connect()
+            with db:
+                if db.execute(
+                    'INSERT OR IGNORE INTO memo VALUES (?, ?, ?, ?, ?)',
+                    (func, hash, buffer(blob), size, now())).rowcount:
+                    db.execute('UPDATE total SET bytes = bytes + ?', (size,))
+                    self.__trim(db)
+        except (sqlite3.Error, EnvironmentError): pass
+
+    def __trim(self, db, batch=32):
+        total = db.execute('SELECT bytes FROM total').fetchone()[0]
+        if total <= self.limit: return
+        goal = self.limit * 3 // 4
+        while total > goal:
+            rows = db.execute('SELECT rowid, size FROM memo'
+                              ' ORDER BY stamp LIMIT ?', (batch,)).fetchall()
+            if not rows: break
+            for rowid, size in rows:
+                db.execute('DELETE FROM memo WHERE rowid = ?', (rowid,))
+                total -= size
+                if total <= goal: break
+        db.execute('UPDATE total SET bytes = ?', (max(total, 0),))
+
+    def clear(self):
+        """Forget everything this store has remembered."""
+        try:
+            db = self.__connect()
+            with db:
+                db.execute('DELETE FROM memo')
+                db.execute('UPDATE total SET bytes = 0')
+        except (sqlite3.Error, EnvironmentError): pass
+
+    @classmethod
+    def default(cls, cache=[]):
+        """Returns the Store used by persistent() when none is specified.
+
+        Do not pass any arguments.\n"""
+        if not cache: cache.append(cls())
+        return cache[0]
+
+del hashlib, time
+
+def _canonical(func, top=os.path.dirname(os.path.dirname(
+            os.path.realpath(__file__)))):
+    """Fully-qualified name of the module a function comes from.
+
+    A module imported both relatively and as study.whatever has two names; for
+    modules within this package, the study. one is returned, so that answers
+    are filed under the same name whichever way the function was imported.
+    Other modules' names are returned as they are.\n"""
+    import sys
+    try: path = os.path.realpath(sys.modules[func.__module__].__file__)
+    except (KeyError, AttributeError): return func.__module__
+    path = os.path.splitext(path)[0]
+    if not path.startswith(top + os.sep): return func.__module__
+    bits = path[len(top) + 1:].split(os.sep)
+    if bits[-1] == '__init__': bits.pop()
+    return '.'.join(['study'] + bits)
+
+from study.snake.decorate import aliasing
+def persistent(select=None, store=None, version=0,
+               alias=aliasing, bad=(cPickle.PicklingError, TypeError)):
+    """Decorator to remember a pure function's answers on disk.
+
+    All arguments are optional:
+      select -- function called with the same arguments as the decorated
+                function; should return None if this call isn't worth
+                remembering, else a (picklable) value that determines the
+                answer.  By default, all calls are remembered and keyed on all
+                their arguments.
+      store -- the Store to use; default is Store.default()
+      version -- included in the function's identity, so that changing it
+                 (when the function's implementation changes what it
+                 returns) discards answers remembered by earlier versions.
+    No further arguments should be passed.
+
+    The decorated function is identified by its module's fully-qualified name
+    and its own name (so the same whether its module was imported relatively
+    or as part of the study package); it must be
+    pure (its return must only depend on its arguments), since its answers
+    shall be reused by later calls with the same arguments, possibly in other
+    processes.  Where a function is cheap for some inputs, select can exclude
+    them, to save the (modest) cost of consulting the disk.  Likewise, where
+    a function takes some arguments that don't affect its answer (e.g. tunnelled
+    defaults), select should exclude them from what it returns.\n"""
+
+    @alias
+    def decor(func, pick=select, keep=store, tag=version, bad=bad,
+              home=_canonical):
+        name = '%s.%s/%s' % (home(func), func.__name__, tag)
+        def ans(*args, **kw):
+            if pick is None: what = args, kw
+            else:
+                what = pick(*args, **kw)
+                if what is None: return func(*args, **kw)
+                what = (what,), {}
+
+            try: hash = Store.key(*what)
+            except bad: return func(*args, **kw)
+            bok = Store.default() if keep is None else keep
+            try: return bok.get(name, hash)
+            except KeyError: pass
+
+            val = func(*args, **kw)
+            bok.put(name, hash, val)
+            return val
+
+        return ans
+    return decor
+
+
+del aliasing, cPickle
@@ -40,12 +40,11 @@ class OrdBok:
 
 from study.maths.permute import Permutation
 
-def anagrams(text, dict=OrdBok(), trawl=Permutation.all):
-    jam = ''.join(text.split())
-    loop, ans = trawl(len(jam)), []
-    loop.next() # discard identity, i.e. given text
-    for it in loop:
-        dict.parse(''.join(it.permute(jam)), ans)
+def anagrams(text, dict=OrdBok(), trawl=Permutation.rows):
+    jam, ans = ''.join(text.split()), []
+    # Start from rank 1, to skip the identity, i.e. given text:
+    for it in trawl(len(jam), 1):
+        dict.parse(''.join([jam[i] for i in it]), ans)
 
     return ans
 
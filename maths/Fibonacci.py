@@ -221,7 +221,11 @@ class Fibpair (tuple):
         return (cls(zero, one) * cls(1, 0)**n)[0]
 
 class Fibonacci (object):
-    """Cached computation of Fibonacci's sequence."""
+    """Cached computation of Fibonacci's sequence.
+
+    Entries near those already computed are found by extending the cache;
+    those further away are computed directly, by study.maths.recur.lucas()'s
+    doubling, without filling in the cache up to them.\n"""
     def __init__(self, zero=0, one=1):
         self.__natural, self.__negative = [ zero, one ], [ one - zero, 2 * zero - one ]
 
@@ -231,20 +235,33 @@ class Fibonacci (object):
             yield self[i]
             i += 1
 
-    def __up(self, n):
+    from study.maths.recur import lucas
+    def __far(self, n, pair=lucas):
+        """Computes entry n without using (or filling) the cache.
+
+        Every entry is f(n) = f(1) * F(n) +f(0) * F(n-1), where F is the
+        usual Fibonacci sequence, F(n) = U(1, -1) at n, which is the first
+        entry in pair(n, 1, -1); and F(n-1) = (V(1, -1) at n -F(n)) / 2.\n"""
+        u, v = pair(n, 1, -1)
+        return self.__natural[1] * u + self.__natural[0] * ((v - u) / 2)
+    del lucas
+
+    def __up(self, n, near=64):
         assert n >= 0
         row = self.__natural
         todo = n + 1 - len(row)
+        if todo > near: return self.__far(n)
         while todo > 0:
             row.append(row[-1] + row[-2])
             todo -= 1
 
         return row[n]
 
-    def __down(self, n):
+    def __down(self, n, near=64):
         assert n > 0
         row = self.__negative
         todo = n - len(row)
+        if todo > near: return self.__far(-n)
         while todo > 0:
             row.append(row[-2] - row[-1])
             todo -= 1
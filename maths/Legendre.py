@@ -1,44 +1,220 @@
 """Legendre polynomials and spherical harmonics.
 
+Provides:
+  Legendre(b, q) -- associated Legendre polynomial, as a Polynomial
+  Spherical(l, j) -- a spherical harmonic, callable on longitude and latitude
+  associated(L, sines [, cosines]) -- every normalised associated Legendre
+                    function of degree up to L, at many points at once
+  Grid -- every spherical harmonic of degree up to L, over a grid of points;
+          see Spherical.grid()
+
+Building each Legendre polynomial exactly is fine for a few of them, but far
+too slow for all of high degree; and evaluating them one at a time, at one
+point at a time, is slower yet.  Instead, associated() runs the three-term
+recurrences satisfied by the normalised functions: starting from the diagonal
+P[m][m], which is just a multiple of cos(latitude)**m, each P[l][m] follows
+from P[l-1][m] and P[l-2][m].  All terms involved are of modest size, so this
+is numerically stable (until cos(latitude)**m underflows, near the poles, for
+degrees of many hundreds).  Given numpy, each step acts on whole arrays of
+points at once.
+
 See http://www.chaos.org.uk/~eddy/math/smooth/harmony.html
 See study.LICENSE for copyright and license information.
 """
 from polynomial import Polynomial
 
+from study.cache.persist import persistent
+from natural import hcf
+from Pascal import factorial
+@persistent(lambda b, q, *ignored: (b, q) if b > 40 else None)
+def coefficients(b, q, hcf=hcf, pling=factorial):
+    """Coefficients of the Legendre polynomial, as a tuple.
+
+    Only for use by Legendre, which does its own validation of its inputs.
+    Answers for large b are remembered on disk (see study.cache.persist), so
+    later processes don't have to compute them again; for small b, computing
+    is quicker than looking up.\n"""
+
+    # solve k(j+2).(j+2).(j+1) = k(j).((q+j).(q+j+1) -b.(1+b)) for q+j = b-2, b-4, ...
+    # k(b-q-2.j) is non-zero for b-q >= 2.j > 0
+    j, L = b - q, b * (1+b)
+    k, last, j = [ 0 ] * j, pling(j), j % 2
+    if ((b-q-j)/2) % 2: last = -last
+    while q + j < b:
+        k[j] = last
+        last, j = last * ((q + j) * (q + j + 1) - L), j + 2
+        last = last // ((j - 1) * j)
+
+    assert q + j == b
+    k.append(last)
+
+    e = hcf(*k)
+    return tuple(x // e for x in k)
+del persistent, hcf, factorial
+
 class Legendre (Polynomial):
     __upinit = Polynomial.__init__
-    from natural import hcf
-    from Pascal import factorial
-
-    def __init__(self, b, q, hcf=hcf, pling=factorial):
+    def __init__(self, b, q, coefficients=coefficients):
         if b < 0 or q > b or q < -b or b != int(b) or q != int(q):
             raise ValueError("Legendre(b, q) is defined for natural b and integers q between -b and +b", b, q)
         if q < 0: q = -q
         self.__q = q
+        self.__upinit(enumerate(coefficients(int(b), int(q))))
+
+    # The factor of sqrt(2.pi) actually belongs to the longitude.
+    def _lazy_get_scale_(self, ig, cosp=Polynomial.fromSeq((1,0,-1))):
+        return (self**2 * cosp**self.__q).integral(-1, 0)(1) ** .5
 
-        # solve k(j+2).(j+2).(j+1) = k(j).((q+j).(q+j+1) -b.(1+b)) for q+j = b-2, b-4, ...
-        # k(b-q-2.j) is non-zero for b-q >= 2.j > 0
-        j, L = b - q, b * (1+b)
-        k, last, j = [ 0 ] * j, pling(j), j % 2
-        if ((b-q-j)/2) % 2: last = -last
-        while q + j < b:
-            k[j] = last
-            last, j = last * ((q + j) * (q + j + 1) - L), j + 2
-            last = last // ((j - 1) * j)
+del Polynomial, coefficients
 
-        assert q + j == b
-        k.append(last)
+from math import sqrt
+from study.cache.mapping import LeastRecent
+def _steps(L, cache=LeastRecent(8), root=sqrt):
+    """Coefficients of the recurrences for normalised Legendre functions.
 
-        e = hcf(*k)
-        self.__upinit(enumerate(x // e for x in k))
+    Returns a list, with an entry for each m in range(L+1), of triples (d, e,
+    ab); with s = cos(latitude) and x = sin(latitude), P[m][m] = d * s *
+    P[m-1][m-1] (or just d, when m is 0), P[m+1][m] = e * x * P[m][m] and, for
+    each (a, b) in ab, in turn for l = m+2 up to L, P[l][m] = a * (x *
+    P[l-1][m] - b * P[l-2][m]).  Results are cached, as they depend only on
+    L; as each takes O(L**2) space, only the eight most recently used are
+    kept.  Do not pass more than one argument.\n"""
+    try: return cache[L]
+    except KeyError: pass
+    ans = []
+    for m in range(L + 1):
+        d = root((2. * m + 1) / (2 * m)) if m else root(.5)
+        ab = [ (root((4. * l * l - 1) / (l * l - m * m)),
+                root(((l - 1.)**2 - m * m) / (4 * (l - 1.)**2 - 1)))
+               for l in range(m + 2, L + 1) ]
+        ans.append((d, root(2 * m + 3.), ab))
+    cache.store(L, ans)
+    return ans
+del LeastRecent
 
-    del hcf, factorial
+def _table(L, x, s):
+    """P[l][m] for 0 <= m <= l <= L, at x = sin and s = cos of latitude.
 
-    # The factor of sqrt(2.pi) actually belongs to the longitude.
-    def _lazy_get_scale_(self, ig, cosp=Polynomial.fromSeq((1,0,-1))):
-        return (self**2 * cosp**self.__q).integral(-1, 0)(1) ** .5
+    Works equally on single numbers and on numpy arrays (element-wise); see
+    associated().\n"""
+    rows = [ [] for l in range(L + 1) ]
+    top = 0 * x
+    for m, (d, e, ab) in enumerate(_steps(L)):
+        top = top * s * d if m else top + d
+        rows[m].append(top)
+        if m < L:
+            last, now = top, x * top * e
+            rows[m + 1].append(now)
+            for l, (a, b) in enumerate(ab, m + 2):
+                last, now = now, a * (x * now - b * last)
+                rows[l].append(now)
+    return rows
+
+def associated(L, sines, cosines=None, root=sqrt):
+    """Every normalised associated Legendre function of degree up to L.
+
+    Required arguments are the maximum degree, L, and a sequence of values of
+    x, the sine of latitude, at which to evaluate the functions.  Optional
+    argument cosines is the matching sequence of cosines of latitude; if
+    omitted, sqrt(1 - x * x) is used for each x.  Returns a list P with L+1
+    entries, each P[l] being a list of l+1 entries; each P[l][m] gives, for
+    each x, the value of
+
+        Legendre(l, m)(x) * cosine**m / Legendre(l, m).scale
+
+    whose square has integral 1 over x from -1 to +1.  Each P[l][m] is a numpy
+    array if numpy is available; otherwise, a list.\n"""
+    np = _numpy()
+    if np is not None:
+        x = np.asarray(sines, float)
+        if cosines is None: s = np.sqrt(np.maximum(0, 1 - x * x))
+        else: s = np.asarray(cosines, float)
+        return _table(L, x, s)
+
+    xs = list(sines)
+    if cosines is None: cosines = [ root(max(0, 1 - x * x)) for x in xs ]
+    each = [ _table(L, x, s) for x, s in zip(xs, cosines) ]
+    return [ [ [ t[l][m] for t in each ] for m in range(l + 1) ]
+             for l in range(L + 1) ]
 
-del Polynomial
+class Grid (object):
+    """Every spherical harmonic of degree up to L, over a grid of points.
+
+    Constructed by Spherical.grid(L, phis, thetas), q.v.  Each harmonic is the
+    product of a function of longitude and one of latitude; these factors are
+    computed once, for all harmonics, and multiplied together only on demand:
+      self[l, j] -- Spherical(l, j)'s values at each (phi, theta), as a
+                    two-dimensional array, indexed by phi then theta
+      azimuth(j) -- factor exp(i.j.phi) / sqrt(2.pi), at each phi
+      latitude(l, j) -- normalised Legendre factor, at each theta
+      sum(coefficients) -- total of c * self[l, j], for each (l, j): c in a
+                           mapping, as a two-dimensional array as for self[l, j]
+    Arrays are numpy arrays, if numpy is available; else lists (of lists, for
+    two-dimensional arrays).  Attribute L is the maximum degree.\n"""
+
+    from math import pi
+    def __init__(self, L, phis, thetas, tp=(2 * pi)**.5):
+        self.L, np = L, _numpy()
+        if np is None:
+            from cmath import exp
+            from math import sin, cos
+            thetas, phis = list(thetas), list(phis)
+            self.__legendre = associated(L, [ sin(t) for t in thetas ],
+                                         [ cos(t) for t in thetas ])
+            self.__azimuth = [ [ exp(1j * j * f) / tp for f in phis ]
+                               for j in range(-L, L + 1) ]
+        else:
+            thetas, phis = np.asarray(thetas, float), np.asarray(phis, float)
+            self.__legendre = associated(L, np.sin(thetas), np.cos(thetas))
+            self.__azimuth = np.exp(1j * np.outer(np.arange(-L, L + 1),
+                                                  phis)) / tp
+    del pi
+
+    def __check(self, l, j):
+        if not 0 <= abs(j) <= l <= self.L:
+            raise IndexError('Need 0 <= abs(j) <= l <= L', l, j, self.L)
+
+    def azimuth(self, j):
+        self.__check(abs(j), j)
+        return self.__azimuth[j + self.L]
+
+    def latitude(self, l, j):
+        self.__check(l, j)
+        return self.__legendre[l][abs(j)]
+
+    def __getitem__(self, (l, j)):
+        row, col = self.azimuth(j), self.latitude(l, j)
+        np = _numpy()
+        if np is not None: return np.outer(row, col)
+        return [ [ e * t for t in col ] for e in row ]
+
+    def sum(self, coefficients):
+        """Combines harmonics, with given coefficients, at every point.
+
+        Single argument is a mapping from pairs (l, j), with 0 <= abs(j) <= l
+        <= L, to coefficients.  Harmonics with the same j are first combined
+        along latitude, before being multiplied by their common azimuth
+        factor, so the cost is only proportional to the number of grid points
+        times the number of distinct j.\n"""
+        np, rows = _numpy(), {}
+        for (l, j), k in coefficients.items():
+            col = self.latitude(l, j)
+            if np is not None: rows[j] = rows.get(j, 0) + k * col
+            elif j in rows: rows[j] = [ a + k * t for a, t in zip(rows[j], col) ]
+            else: rows[j] = [ k * t for t in col ]
+
+        js, wide = sorted(rows), len(self.__legendre[0][0])
+        if np is not None:
+            if not js: return np.zeros((self.__azimuth.shape[1], wide), complex)
+            longs = self.__azimuth[np.array(js) + self.L]
+            return np.dot(longs.T, np.array([ rows[j] for j in js ]))
+
+        ans = [ [ 0j ] * wide for e in self.__azimuth[0] ]
+        for j in js:
+            col = rows[j]
+            for row, e in zip(ans, self.__azimuth[j + self.L]):
+                for i, t in enumerate(col): row[i] += e * t
+        return ans
 
 class Spherical:
     """A spherical harmonic.
@@ -46,19 +222,19 @@ class Spherical:
     Attributes l and j correspond to total spin and its component parallel to
     the co-ordinate axis.  Supports being called as a function of two
     parameters, longitude and latitude, both of which must be Quantity()s with
-    units of angle."""
-
-    def azimuth(b, q, cache={}): # local tool function to cache Legendre results
-        try: ans = cache[(b,q)]
-        except KeyError: cache[(b,q)] = ans = Legendre(b, q)
-        return ans
+    units of angle.  To evaluate many harmonics at many points, use grid(),
+    q.v., instead."""
 
-    def __init__(self, l=0, j=0, Legendre=azimuth):
+    # Recently used Legendre polynomials are shared; their coefficients are
+    # remembered on disk, for large l, by coefficients() above.
+    from study.cache.mapping import LazyFunc, LeastRecent
+    def __init__(self, l=0, j=0,
+                 Legendre=LazyFunc(Legendre, LeastRecent(64))):
         self.l, self.j = l, j
         if j < 0: j = -j
         self.__poly, self.__q = Legendre(l, j), j
 
-    del azimuth
+    del LazyFunc, LeastRecent
     from math import pi
 
     def __call__(self, phi, theta, tp=(2*pi)**.5):
@@ -66,3 +242,19 @@ class Spherical:
                theta.Cos**self.__q / self.__poly.scale / tp
 
     del pi
+
+    @staticmethod
+    def grid(L, phis, thetas):
+        """All harmonics of degree up to L, at every longitude and latitude.
+
+        Required arguments are the maximum degree, L, and sequences of
+        longitudes, phis, and latitudes, thetas, as plain numbers in radians.
+        Returns a Grid, q.v., whose [l, j] entry holds Spherical(l, j)'s value
+        at each (phi, theta) combining an entry in phis with one in thetas.
+        The Legendre factors, for all (l, j), are computed by associated(),
+        q.v.; the longitude factors, once per j.\n"""
+        return Grid(L, phis, thetas)
+
+del sqrt
+
+from study.cache.module import numpy as _numpy
@@ -1,151 +1,243 @@
 """Combinatorics.
 
+Provides:
+  factorial(n) -- n!, computed by the prime-swing method
+  chose(N, i) -- the binomial coefficient N! / (N-i)! / i!
+  chosemod(N, i, p [, power]) -- chose(N, i) modulo p**power, for prime p
+  Pascal(n [, scale]) -- a row of Pascal's triangle
+  c2nno4n(n) -- chose(2*n, n) / 4**n, as a float
+
+Neither factorial() nor chose() multiplies its way up one step at a time:
+n! = (n/2)!**2 * swing(n), where swing(n) = n! / (n/2)!**2 is a product of
+primes no bigger than n, each with an exponent read off from n's digits in
+that prime's base; and chose(N, i) is likewise a product of primes, the
+exponent of each being the number of carries when adding i to N-i in its base
+(Kummer's theorem).  The products are formed by binary splitting, so that the
+big multiplications are between numbers of similar size.  Results are
+remembered in a cache bounded by its total size in bytes, so big answers don't
+crowd out memory; factorials of 4096 and more are also remembered on disk
+(see study.cache.persist), so later processes needn't compute them again.
+The table of primes is only remembered up to 2**22 (about ten megabytes),
+bigger tables being sieved afresh when needed.
+
 See study.LICENSE for copyright and license information.
 """
 
-def factorial(num, cache=[1], maxcache=0x4000):
+def _sieve(top, cache=[], keep=1 << 22):
+    """Returns a list of the primes, in order, including all up to top.
+
+    Only for use within this module; the list may be shared, so callers must
+    not modify it.  Uses a bytearray sieve, which is far quicker than
+    study.maths.primes for the ranges needed here.  Lists up to keep are
+    remembered, for reuse; bigger ones are not.  Pass no other arguments.\n"""
+    if cache and cache[0] >= top: return cache[1]
+    want = max(top, 2 * cache[0] if cache else 1 << 10)
+    if top <= keep: top = min(want, keep)
+    else: top = want
+    flags = bytearray([1]) * (top + 1)
+    flags[:2] = '\0\0'
+    p = 2
+    while p * p <= top:
+        if flags[p]:
+            flags[p * p::p] = bytearray(len(xrange(p * p, top + 1, p)))
+        p += 1
+    ans = [i for i, f in enumerate(flags) if f]
+    if top <= keep: cache[:] = [top, ans]
+    return ans
+
+def _product(seq, lo=0, hi=None):
+    """Product of seq[lo:hi], by binary splitting.
+
+    Multiplying many factors one at a time makes each step multiply a big
+    number by a small one; splitting the sequence in halves and multiplying
+    their products instead makes the big multiplications balanced, which
+    python's (Karatsuba) multiplication handles much better.\n"""
+    if hi is None: hi = len(seq)
+    if hi - lo < 16:
+        ans = 1
+        for i in xrange(lo, hi): ans *= seq[i]
+        return ans
+    mid = (lo + hi) / 2
+    return _product(seq, lo, mid) * _product(seq, mid, hi)
+
+def _span(lo, hi):
+    """Product of the integers from lo up to (but excluding) hi."""
+    return _product(xrange(lo, hi))
+
+from bisect import bisect_right
+def _swing(n, primes, index=bisect_right):
+    """Returns n! / (n/2)!**2, given primes including all up to n.
+
+    The exponent of prime p in this is the number of odd digits among n/p,
+    n/p**2, ..., so it is 1 for n/2 < p <= n, 0 for n/3 < p <= n/2 and
+    (n/p) % 2 for larger p whose square exceeds n.\n"""
+    root = int(n ** .5)
+    while root * root > n: root -= 1
+    while (root + 1) ** 2 <= n: root += 1
+    factors = []
+    for p in primes[:index(primes, root)]:
+        q, e = n, 0
+        while q >= p:
+            q /= p
+            e += q & 1
+        if e: factors.append(p ** e)
+    for i in xrange(index(primes, root), index(primes, n / 3)):
+        p = primes[i]
+        if (n / p) & 1: factors.append(p)
+    return _product(factors) * _product(primes, index(primes, n / 2),
+                                        index(primes, n))
+
+from study.cache.mapping import Weighed
+_small = (1, 1, 2, 6, 24, 120, 720, 5040, 40320, 362880, 3628800)
+def factorial(num, cache=Weighed(1 << 22), small=_small):
     """Returns the factorial of any natural number.
 
-    Required argument, num, is the natural number.  Can also be passed
-    (although this is not recommended), as a keyword, maxcache as a limit on
-    how big a cache this should maintain.  Defaults to 0x4000, which shall use
-    up plenty of your computer's memory as it is.  Only relevant if num
-    exceeds it (or would exceed the default).
+    Required argument, num, is the natural number (an integer-valued float
+    is also accepted); raises ValueError if it is negative or TypeError if it
+    isn't a whole number.  For non-integers, see study.stats.stirling's
+    gamma() and gactorial(), which approximate Gamma(1+num), the
+    generalisation of num! to the complex plane.
 
     Return value is equivalent to reduce(lambda a,b:a*(1+b), range(num), 1),
-    except that it degrades gracefully when given invalid input and caches
-    answers, so may give you an answer sooner.
-
-    For agrguments < 0 this raises a ValueError.  For other arguments < 1,
-    you'll get the answer 1, as this is correct if your argument is valid and
-    resolves the problem of what to do with invalid input.  For other
-    non-integer non-negative values, you'll get a computed positive value
-    which probably isn't far off the Gamma function's value at about one more
-    than that non-integer.  For valid input, i.e. non-negative integers,
-    factorial(num) = Gamma(1+num), wherein
+    but computed as factorial(num/2)**2 times the prime-swing of num (see
+    _swing()), recursively; this takes time comparable to a few
+    multiplications of numbers the size of the answer.  Answers are cached
+    (do not pass a second argument), in a cache limited to four megabytes,
+    and big ones on disk (see study.cache.persist); the intermediate results
+    the recursion needs are cached too, so nearby factorials are cheap to
+    compute.\n"""
+    if num < 0: raise ValueError, "I only do naturals"
+    n = int(num)
+    if n != num: raise TypeError('Factorial of a non-integer', num)
+    if n < len(small): return small[n]
+    try: return cache[n]
+    except KeyError: pass
+
+    if n < 64: ans = _span(len(small), n + 1) * small[-1]
+    else: ans = _factorial(n)
+    cache.store(n, ans)
+    return ans
 
-       Gamma(1+a) = integral(: exp(-t).power(a, t) &larr;t :{positive reals})
+from study.cache.persist import persistent
+@persistent(lambda n: n if n >= 1 << 12 else None)
+def _factorial(n):
+    """Computes n!, for n >= 64, when factorial()'s cache hasn't got it.
 
-    for arbitrary a in the complex plane, with a pole (of order 1) at each
-    negative integer and a real humdinger of a singularity at infinity.\n"""
+    Answers for n of 4096 or more, that take over a millisecond to compute,
+    are remembered on disk, where reading one back takes a fraction of
+    that.\n"""
+    half = factorial(n / 2)
+    return half * half * _swing(n, _sieve(n))
+del persistent
 
-    if num < 0: raise ValueError, "I only do naturals"
-    try: return cache[num]
-    except IndexError: pass
-
-    result, i = cache[-1], len(cache)
-    while num >= i:
-        result *= i
-        i += 1
-        if len(cache) < maxcache:
-            cache.append(result)
-            assert i == len(cache)
-
-    return result
-
-class Pascal:
-    """A dictionary describing Pascal's triangle.
-
-    Keys are pairs of naturals; value for (n,m) is (n+m)! / n! / m!
-
-    Given the symmetry, no value is actually stored for key (n,m) when m >
-    n. Given the nature of Pascal's triangle, computing the value for a given
-    (n,m) involves computing the values for all (i,j) with i<=n and j<=m.
-
-    Representation depicts Pascal's triangle with one side as the top line,
-    the other as the left column; a `row' of Pascal's triangle is thus a
-    diagonal stripe.  Only values we've actually needed are shown, so there's
-    nothing above the diagonal; except on the top line, where a 1 is displayed
-    above the last digit of the diagonal entry in each column.
-
-    Note that neither this class nor its one instance is any part of this
-    module's export: it is over-ridden by a curried form of chose(), below.\n"""
-
-    __values = {}
-    def __getitem__(self, (n, m)): # keys to this object should be pairs of naturals
-        try: val = self.__lookup(n, m)
-        except RuntimeError, what:
-            print what
-            if what.args[0] != 'maximum recursion depth exceeded': raise
-            val = factorial(n+m) / factorial(n) / factorial(m)
-            if n < m: n, m = m, n   # exploit symmetry
-            self.__values[n, m] = val
-
-        return val
-
-    def __lookup(self, n, m):
-        if n < m: n, m = m, n   # exploit symmetry
-        assert n >= m
-        if m < 0: return 0 # silly input
-        if m == 0: return 1 # no sense cacheing
-        if m == 1: return n+1 # likewise
-
-        try: val = self.__values[n, m]
-        except KeyError: # ho hum, need to compute it ...
-            up, left = self.__lookup(n-1, m), self.__lookup(n, m-1)
-            self.__values[n, m] = val = left + up
-
-        return val
-
-    def __str__(self):
-        keys = self.__values.keys()
-        if not keys: return '1, 1, ...\n1,'
-        keys.sort()
-        # the following may be broken by __getitem__'s RuntimeError fallback ...
-
-        row = []
-        for n, m in keys:
-            while n > len(row):
-                row.append(['1', `len(row) + 2`])
-            assert len(row[n-1]) == m
-            row[n-1].append(`self.__values[n,m]`)
-
-        # Now turn each line into a single string:
-        n = len(row) + 1
-        while n > 1:
-            n = n - 1
-            here = row[n-1]
-            if len(here) < n + 1: here.append('...')
-            row[n-1] = ', '.join(here)
-
-        head = '1, 1'
-        # now put a 1 above the last digit of each diagonal entry:
-        off, m, n = len(head), 1, len(row) + 1
-        while m < n:
-            try: new = len(row[m])
-            except IndexError:
-                raise IndexError(row, m, n)
-
-            gap = new - off - 1
-            if gap < 2: break # last row brought us to our last column
-            head, off, m = head + ',%*d' % (gap, 1), new, 1+m
-
-        return head + ', ...\n' + ',\n'.join(row) + ',\n...'
-
-    __repr__ = __str__
-
-    def check(self):
-        """Uses factorial() to verify results of chose(). """
-        result = []
-        for (n, m), val in self.__values.items():
-            check = factorial(n+m) / factorial(n) / factorial(m)
-            if val != check:
-                result.append('%d, %d ->' % (n,m) + `val` + ' != ' + `check`)
-
-        if result:
-            return '\n'.joinfields(result)
-
-Pascal = Pascal()
-
-def chose(total, part, rack=Pascal):
+def chose(total, part, primes=_sieve, whole=factorial, direct=1 << 22,
+          index=bisect_right):
     """chose(N,i) -> N! / (N-i)! / i!
 
     This is the number of ways of chosing i items from among N, ignoring order
-    of choice.  Computed using a cached form of Pascal's triangle. """
-
-    return rack[total-part, part]
-
-def check(rack=Pascal): rack.check()
+    of choice; it is zero if i < 0 or i > N.  Computed as a product of prime
+    powers, never forming any of the big factorials: for each prime p, the
+    number of times it divides the answer is the sum, over powers q of p, of
+    N/q -i/q -(N-i)/q.  Primes bigger than N-i (or i, if smaller) appear once
+    and ones bigger than N/2 (but not that) don't appear at all.  When i (or
+    N-i) is small, or N is too big to sieve primes up to it cheaply (over
+    2**22), the answer is computed directly as N!/(N-i)! divided by i!.\n"""
+    if part < 0 or part > total: return 0
+    small = min(part, total - part)
+    if small < 2: return total if small else 1
+    if small < 64 or total > direct:
+        return _span(total + 1 - small, total + 1) / whole(small)
+
+    ps, factors = primes(total), []
+    for p in ps:
+        if p > total / 2: break
+        if p * p > total:
+            if total / p - part / p - (total - part) / p: factors.append(p)
+            continue
+        q, e = p, 0
+        while q <= total:
+            e += total / q - part / q - (total - part) / q
+            q *= p
+        if e: factors.append(p ** e)
+
+    return _product(factors) * _product(ps, index(ps, total - small),
+                                        index(ps, total))
+del bisect_right
+
+from study.maths.natural import Euclid
+def _inverse(a, mod, solve=Euclid): return solve(a % mod, mod)[0] % mod
+del Euclid
+
+def _units(p, mod, cache=Weighed(1 << 22)):
+    """Products of the units modulo mod, a power of prime p.
+
+    Returns a list t of length mod with t[i] the product, modulo mod, of
+    those j in range(1, 1+i) that p doesn't divide; when mod is p, t[i] is
+    simply i! % mod.  Do not pass a third argument.\n"""
+    try: return cache[mod]
+    except KeyError: pass
+    t, ans = [1] * mod, 1
+    for i in xrange(1, mod):
+        if i % p: ans = ans * i % mod
+        t[i] = ans
+    cache.store(mod, t)
+    return t
+
+def chosemod(total, part, p, power=1, inverse=_inverse):
+    """chose(total, part) % p**power, for prime p, without computing chose.
+
+    Required arguments are total and part, as for chose(), and a prime p;
+    optional fourth argument, power, defaults to 1.  Works with a table of
+    p**power entries, so is only practical when that is of modest size; it
+    doesn't check that p is prime.
+
+    For power 1, uses Lucas's theorem: chose(total, part) is congruent, mod
+    p, to the product of chose(n, m) over corresponding digits n of total and
+    m of part, in base p.  Otherwise, follows Granville: by Kummer's theorem,
+    the power of p dividing chose(total, part) is the number of carries when
+    adding part to total-part in base p; if there are at least power of them,
+    the answer is 0; otherwise, it is that power of p times the ratio of the
+    p-free parts of the three factorials, each computed from a table of
+    products of units modulo p**power.\n"""
+    if part < 0 or part > total: return 0
+    mod = p ** power
+    if mod == 1: return 0
+    t = _units(p, mod)
+    if power == 1:
+        ans = 1
+        while part:
+            (total, n), (part, m) = divmod(total, p), divmod(part, p)
+            if m > n: return 0
+            ans = ans * t[n] * inverse(t[m] * t[n - m], p) % p
+        return ans
+
+    def free(n, full=t[-1]):
+        # n! with all factors of p removed, modulo mod:
+        ans = 1
+        while n:
+            ans = ans * pow(full, n / mod, mod) * t[n % mod] % mod
+            n /= p
+        return ans
+
+    rest, carry, q = total - part, 0, p
+    while q <= total:
+        carry += total / q - part / q - rest / q
+        q *= p
+    if carry >= power: return 0
+    return p ** carry * free(total) * inverse(free(part) * free(rest),
+                                              mod) % mod
+del Weighed, _inverse, _small
+
+def check(top=64):
+    """Verifies chose() against Pascal's rule for the first top rows.
+
+    Returns a string describing any discrepancies, else None.\n"""
+    result = []
+    for n in range(1, top):
+        for m in range(n + 1):
+            a, b = chose(n, m), chose(n - 1, m - 1) + chose(n - 1, m)
+            if a != b: result.append('%d, %d -> %d != %d' % (n, m, a, b))
+    if result: return '\n'.join(result)
 
 def Pascal(tot, scale=1):
     """A row of Pascal's triangle, optionally scaled, as a tuple.
@@ -153,10 +245,15 @@ def Pascal(tot, scale=1):
     Required argument, tot, is the row index: Pascal(1+i)[1+j] = Pascal(i)[j] +
     Pascal(i)[1+j] give-or-take missing entries being presumed zero, with
     Pascal[0] = (1,).  Optional second argument is an over-all scaling to apply
-    to all entries in the row; thus sum(Pascal(n, .5**n)) == 1.\n"""
+    to all entries in the row; thus sum(Pascal(n, .5**n)) == 1.  The entries
+    are computed each from the one before, as chose(tot, i+1) = chose(tot, i)
+    * (tot-i) / (i+1).\n"""
+    row, val = [], 1
+    for i in range(1 + tot):
+        row.append(val)
+        val = val * (tot - i) / (i + 1)
+    return tuple(v * scale for v in row)
 
-    return tuple(chose(tot, i) * scale for i in range(1 + tot))
-
 def c2nno4n(n):
     """n => chose(2n, n)/4**n
 
@@ -4,6 +4,9 @@ For the theory, see
 http://www.solipsys.co.uk/new/FindingPerrinPseudoPrimes_Part1.html
 http://www.chaos.org.uk/~eddy/math/Perrin.html
 
+Single entries are computed by study.maths.recur's doubling; Perrin.primals()
+scans a range for primes and pseudo-primes, in a pool of processes.
+
 See study.LICENSE for copyright and license information.
 """
 
@@ -50,7 +53,7 @@ class Perrin (tuple):
     def successor(self, n=1, mod=None, step=(0, 0, 1)):
         if n < 0:
             # Implement negative power as positive power of inverse:
-            n, step = -n, self._perrin_(step).__invert()
+            n, step = -n, self._perrin_(*step).__invert()
 
         step = self._perrin_(*step)
         if mod: step %= mod
@@ -133,15 +136,29 @@ class Perrin (tuple):
         if self[0] != 1: return self._perrin_(ratio(i, self[0]) for i in inv)
         return inv
 
-    del Rational hcf
+    del Rational, hcf
 
+    from study.maths.recur import Recurrence
     @classmethod
-    def entry(cls, n, mod=None, start=(3, 0, 2), step=(0, 0, 1)):
+    def entry(cls, n, mod=None, start=(3, 0, 2), step=(0, 0, 1),
+              seq=Recurrence((1, 1, 0), (3, 0, 2)), grow=Recurrence):
+        """Returns k[n], or k[n] % mod if mod is given.
+
+        Optional arguments start and step select a different sequence: start
+        is its first three entries; step is the triple whose multiplication
+        advances by one entry.  For the default step, the Perrin iteration,
+        the entry is computed by study.maths.recur.Recurrence; else by
+        .successor().\n"""
+        if tuple(step) == (0, 0, 1):
+            if tuple(start) != (3, 0, 2): seq = grow((1, 1, 0), start)
+            return seq.entry(n, mod)
+
         if n > 2: return cls._perrin_(*start).successor(n - 2, mod, step)[2]
         elif n < 0: return cls._perrin_(*start).successor(n, mod, step)[0]
         return start[n]
+    del Recurrence
 
-    # Support for .primal():
+    # Support for .primal() and .primals():
 
     class CycleCache (dict): # tool
         """Lazy cache dictionary for cycles modulo chosen primes.
@@ -259,10 +276,11 @@ class Perrin (tuple):
 
                 yield bits[tuple(ws)]
 
+    _cycles_ = CycleCache() # shared with _primals()
     @staticmethod
     def __primal(n,
                  prods=[Factors],
-                 cache=CycleCache()):
+                 cache=_cycles_):
         """Pre-test easy factors of n for evidence that n is not primal.
 
         If any divisor p of n has .entry(n, p) non-zero, then p doesn't divide
@@ -290,4 +308,47 @@ class Perrin (tuple):
     def primal(cls, n):
         """True precisely if .entry(n) is a multiple of n."""
         return cls.__primal(n) and cls.entry(n, n) == 0
+
+    @staticmethod
+    def primals(start, stop, processes=None, chunk=1 << 12):
+        """Iterates the n in range(start, stop) for which .primal(n) is true.
+
+        Required arguments, start and stop, bound the range to scan.  Yields
+        the primes in this range and the Perrin pseudo-primes, in increasing
+        order.  Optional arguments:
+          processes -- number of worker processes; default None uses one per
+                       CPU; 1 does all the work in this process
+          chunk -- how many naturals each task tests; default 4096.
+
+        The range is split into chunks, that are tested in a pool of worker
+        processes.  Rather than use the table .primal() consults, which takes
+        longer to build than it saves on a modest range, each n is pre-tested
+        by taking its remainder by each small prime.\n"""
+        chunks = ((lo, min(lo + chunk, stop)) for lo in xrange(start, stop, chunk))
+        if processes == 1:
+            for bounds in chunks:
+                for n in _primals(bounds): yield n
+            return
+
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try:
+            for row in pool.imap(_primals, chunks):
+                for n in row: yield n
+        finally:
+            pool.terminate()
+            pool.join()
+
+# Worker for Perrin.primals(); it has to be a module global so that the pool's
+# processes can find it.
+def _primals((lo, hi), ps=(2, 3, 5, 7, 9, 11, 13, 17), entry=Perrin.entry):
+    """Lists the n in range(lo, hi) for which Perrin.primal(n) is true.
+
+    Only the entries in ps that divide n can be used to rule it out: see
+    Perrin.__primal(), whose cycles (modulo each entry in ps) this shares.\n"""
+    cycles = Perrin._cycles_
+    pats = [ (p, cycles[p], len(cycles[p])) for p in ps ]
+    return [ n for n in xrange(lo, hi)
+             if not any(n % p == 0 and pat[n % m] for p, pat, m in pats)
+             and entry(n, n) == 0 ]
 
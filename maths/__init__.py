@@ -9,6 +9,8 @@ Polynomials (see also cardan):
 
 Combinatorics (see also stats.stirling):
   Fibonacci -- computing the eponymous sequence
+  Perrin -- the Perrin sequence and its pseudo-primes
+  recur -- linear recurrences (and Lucas sequences), computed by doubling
   Pascal -- factorials and the eponymous triangle (see also permute)
 
 Permutations:
@@ -25,6 +27,8 @@ Solving equations:
 
 Numeric types:
   buffersize -- how many bytes does it take to print an int in base ten ?
+  contract -- summing products of tensors' entries, without forming the product
+  dense -- vectors and tensors held in numpy arrays (when numpy is available)
   natural -- the natural numbers, and tools to work with types kindred to them
   primes -- factorisation and a disk-cached lazy list of all primes
   ratio -- exact fractions and approximating numbers with them
@@ -36,6 +40,7 @@ Miscellaneous:
   integrate -- perform adequate approximations to integrating a function
   interpolator -- approximating a distribution piecewise
   music -- exploring the theory of chords, scales and keys
+  quantile -- selection, quantiles and a streaming quantile sketch
   voronoi -- finding which of a set of points is closest within a space
 
 See study.LICENSE for copyright and license information.
@@ -175,6 +175,7 @@ class Continued (object):
 
         if iter(ns) is ns: self.__ds = self.__IterStore(ns)
         else: self.__ds = self.__digest(ns)
+        self.__memo = None # see __grind()
 
     class __IterStore (list):
         __upinit = list.__init__
@@ -315,6 +316,8 @@ class Continued (object):
             while b > 0:
                 b -= 1
                 self.__step(b)
+            # next() shall __prune() before it does anything else:
+            self.__dirty, self.__big = True, 0
 
         @classmethod
         def __show(G, it):
@@ -342,44 +345,61 @@ class Continued (object):
 
             return ds, [n - p * d for n, d in zip(ns, ds)]
 
-        def edges(i, bit): # tool used by other tools and __prune
-            """Yields naturals < i in pairs, without and with the given bit.
+        def edges(i, bit, cache={}): # tool used by other tools, __prune and __corners
+            """Returns the naturals < i in pairs, without and with the given bit.
 
             Both integers should be powers of two; the first is the length of
             an array of coefficients; it should be greater than the second,
-            which is the bit 1<<b associated with a variable X[b].  Result
-            iterates over pairs of indices into the array, in strictly
-            decreasing order (of each member of the pair separately); each
-            pair (i, j) yielded has i ^ j == bit and i == j | bit.\n"""
-
-            while i > bit:
-                i -= 1
-                if i & bit:
-                    yield i ^ bit, i
+            which is the bit 1<<b associated with a variable X[b].  Result is
+            a tuple of pairs of indices into the array, in strictly decreasing
+            order (of each member of the pair separately); each pair (i, j) in
+            it has i ^ j == bit and j == i | bit.  Every step of a Grinder
+            walks these pairs, so they are remembered (in cache, which callers
+            should not pass) rather than worked out afresh each time.\n"""
+
+            try: return cache[i, bit]
+            except KeyError: pass
+            ans, j = [], i
+            while j > bit:
+                j -= 1
+                if j & bit:
+                    ans.append((j ^ bit, j))
+
+            ans = cache[i, bit] = tuple(ans)
+            return ans
 
         from natural import hcf
-        def __prune(self, gcd=hcf, pairs=edges):
+        def __prune(self, full=True, gcd=hcf, pairs=edges):
             """Simplifies self, in so far as practical.
 
             If .__n and .__d are parallel, self can be reduced to a simple
             rational.  If any bit has all associated coefficients zero, we can
-            eliminate the variable associated with that bit.\n"""
+            eliminate the variable associated with that bit.  Either can only
+            come about initially or when some x[b] runs out; stepping an X[b]
+            and emitting a term are invertible, so can't make either happen.
+            When optional argument full is false, these checks are skipped.
+
+            Likewise, the highest common factor of all coefficients is only
+            changed by running out or (for Digits) by emitting a digit; so
+            next() only calls this, with full false, when the coefficients'
+            bit-lengths have grown past .__big, which is set here to allow
+            some growth before the next call.\n"""
 
             ns, ds = self.__n, self.__d
 
-            n, d = sum(abs(n) for n in ns), sum(abs(d) for d in ds)
-            if all(n * e == d * i for i, e in zip(self.__n, self.__d)):
-                # self just represents the rational n/d.
-                i = gcd(n, d) or 1
-                ns[:], ds[:] = [ n/i ], [ d/i ]
-                del self.__x[:], self.__p[:]
-                return
-
-            # Which bits aren't set in any index with a non-zero coefficient ?
-            zs = ~ reduce(lambda x, y: x | y,
-                          (i for i in range(1, len(ns)) if not (ns[i] == 0 == ds[i])),
-                          0)
-            if zs:
+            if full:
+                n, d = ([(n, d) for n, d in zip(ns, ds) if n or d] or [(0, 0)])[0]
+                if all(n * e == d * i for i, e in zip(ns, ds)):
+                    # self just represents the rational n/d.
+                    i = gcd(n, d) or 1
+                    ns[:], ds[:] = [ n/i ], [ d/i ]
+                    del self.__x[:], self.__p[:]
+                    return
+
+                # Which bits aren't set in any index with a non-zero coefficient ?
+                zs = ~ reduce(lambda x, y: x | y,
+                              (i for i in range(1, len(ns)) if not (ns[i] == 0 == ds[i])),
+                              0)
                 b, bit = len(self.__x), len(ns)
                 assert bit == 1<<b
                 while b > 0: # It's crucial to start with highest bit and work down.
@@ -399,6 +419,7 @@ class Continued (object):
                 ns[:] = [n / i for n in ns]
                 ds[:] = [d / i for d in ds]
 
+            self.__big = max(abs(c) for c in ns + ds).bit_length() + 64
             # TODO: any special magic we can do when len(self.__x) == 1 ?
         del hcf
 
@@ -459,8 +480,6 @@ class Continued (object):
                 ns[i], ds[i] = ns[j], ds[j]
                 del ns[j], ds[j]
 
-        del edges
-
         def __step(self, b, fix=clear, mix=stir):
             """Advance .__x[b], if not yet exhausted.
 
@@ -494,6 +513,7 @@ class Continued (object):
             except StopIteration:
                 fix(bit, self.__n, self.__d)
                 del self.__x[b], self.__p[b]
+                self.__dirty = True
             else:
                 while isinstance(p, Token):
                     if isinstance(p, Cycle):
@@ -506,19 +526,52 @@ class Continued (object):
 
         del clear, stir
 
-        def worst(cs, wide=span): # tool used by __shrink
+        def rough(cs, pairs=edges, window=64): # tool used by worst
+            """Approximates span() for all bits at once.
+
+            Takes the same tuple of corner values as span() and returns a
+            tuple of the bits whose edges see the biggest difference in F's
+            values, estimated in floating point from just the leading window
+            (default: 64) bits of each value.  As the coefficients grow, the
+            exact comparisons span() does get steadily more expensive, while
+            which X[b] to step next hardly needs such care.  Returns None if
+            any denominator's sign differs from the rest or is too near zero,
+            at this precision, to be sure it doesn't; exact span() must then
+            decide.\n"""
+
+            s = max(max(abs(n), abs(d)) for n, d in cs).bit_length() - window
+            if s < 0: s = 0
+            fs, sign = [], cs[0][1]
+            for n, d in cs:
+                d >>= s
+                if d * sign <= 0 or abs(d) < 1 << 16: return None
+                fs.append(float(n >> s) / d)
+
+            size = bit = len(cs)
+            bad, m = (), -1.
+            while bit > 1:
+                bit >>= 1
+                w = max(abs(fs[i] - fs[j]) for i, j in pairs(size, bit))
+                if w > m: bad, m = (bit,), w
+                elif w == m: bad += (bit,)
+            return bad
+
+        def worst(cs, wide=span, guess=rough): # tool used by __shrink
+            bad = guess(cs)
+            if bad: return bad
             bit, bad, bent, m, e = len(cs), [], [], 0, 1
             while bit > 1:
                 bit >>= 1
                 try: n, d = wide(cs, bit)
                 except ValueError: bent.append(bit)
                 else:
-                    if n * e > m * n: bad, m, e = [ bit ], n, d
-                    elif n * e == m * n: bad.append(bit)
+                    if n * e > m * d: bad, m, e = [ bit ], n, d
+                    elif n * e == m * d: bad.append(bit)
 
             assert bent or bad
             if bent: return tuple(bent)
             return tuple(bad)
+        del rough
 
         def __shrink(self, cs, judge=worst):
             b = len(self.__x)
@@ -558,11 +611,26 @@ class Continued (object):
             numerator isn't also zero in all the same places - but __prune()
             deals with this possibility), then the range of values F may take
             is unbounded and, in particular, not restricted to any interval
-            from p-.5 to p+.5 with p natural.\n"""
+            from p-.5 to p+.5 with p natural.
+
+            Stepping an X[b] and emitting a term are both invertible, with
+            integer inverses, so the coefficients never acquire a common
+            factor and never become parallel by doing so; only running out of
+            some x[b] can do that.  So the full __prune() only happens after
+            that (or construction); otherwise, the common factor is only
+            checked when the coefficients have grown by more than a few words
+            since last it was.  Likewise, after emitting a term, the updated
+            coefficients are checked for another before any further x[b] is
+            stepped, so a run of terms may be emitted without stepping.\n"""
 
             while True:
                 # First, see if we can simplify our expression:
-                if len(self.__x): self.__prune()
+                if self.__dirty:
+                    self.__dirty = False
+                    if len(self.__x): self.__prune()
+                elif max(abs(c) for c in self.__n + self.__d
+                         ).bit_length() > self.__big:
+                    self.__prune(False)
                 # If it's really simple, life's easy:
                 if len(self.__x) == 0:
                     if self.__d[0] == 0:
@@ -627,7 +695,7 @@ class Continued (object):
             else: j, n, d = -1, -n, -d
             ok = nice(n, d)
 
-            i = len(cs),
+            i = len(cs)
             while i > 1 and ok:
                 i -= 1
                 n, d = cs[i]
@@ -643,7 +711,7 @@ class Continued (object):
 
             return ok[0]
 
-        def __corners(self):
+        def __corners(self, pairs=edges):
             """Returns F's values at the corners of X's range of values.
 
             At each corner, each X[b] is either -2 or 2; each corner can be
@@ -652,30 +720,34 @@ class Continued (object):
             variables in X.  The return is a tuple of twoples, (n, d), giving
             the values of numerator and denominator; its entry at index i is
             for the corner at which each X[b] is 2 if bit b of i is set, else
-            -2.\n"""
-
-            ns, ds, ans, i = self.__n, self.__d, [], 0
-            assert len(ds) == len(ns) == 1 << len(self.__x)
-            while i < len(ns):
-                tn = td = 0 # accumulators
-                j = len(ns)
-                while j > 0:
-                    j -= 1
-                    # First, compute product({ X[b]: bit b of j is set}):
-                    bit, xs = len(ns), 1
-                    while bit > 1:
-                        bit >>= 1
-                        if bit & j:
-                            xs *= 2
-                            if bit & i == 0: xs = -xs
-
-                    tn += xs * ns[j]
-                    td += xs * ds[j]
-
-                ans.append((tn, td))
-                i += 1
+            -2.
+
+            The values given are those of numerator and denominator after
+            dividing each by product(X) and multiplying by 2**len(X), i.e. as
+            functions of the Y[b] = 1/X[b] (see next()), so that their ratio
+            is F but the denominator only changes sign between corners if it
+            has a zero in between; P(.__d, X) itself changes sign with
+            product(X), without F having any pole.  For each bit, the values
+            for the two ends of each edge along it are worked out from the
+            pair of coefficients whose indices differ only in that bit; doing
+            this for each bit in turn takes len(X) passes over the
+            coefficients, rather than one per corner.\n"""
+
+            ns, ds = list(self.__n), list(self.__d)
+            size = bit = len(ns)
+            assert size == len(ds) == 1 << len(self.__x)
+            while bit > 1:
+                bit >>= 1
+                for i, j in pairs(size, bit):
+                    # [i] has a factor of Y[b], [j] hasn't; Y[b] = -1/2 at i, 1/2 at j
+                    n, m = ns[i], 2 * ns[j]
+                    ns[i], ns[j] = m - n, m + n
+                    n, m = ds[i], 2 * ds[j]
+                    ds[i], ds[j] = m - n, m + n
+
+            return tuple(zip(ns, ds))
 
-            return tuple(ans)
+        del edges
         # </Grinder>
 
     @property
@@ -695,36 +767,50 @@ class Continued (object):
         except AttributeError: pass
         return real_continued(val)
 
-    def __add__(self, other, get=ingest, grind=Grinder):
-        return Continued(grind((iter(self.__ds), get(other)),
-                               (0, 1, 1, 0),
-                               (1, 0, 0, 0)))
+    from study.cache.mapping import LeastRecent
+    def __grind(self, other, op, ns, ds, get=ingest, grind=Grinder,
+                memo=LeastRecent):
+        """Combine self with other, remembering the result.
+
+        Required arguments are the other operand, a key naming the operation
+        and the numerator and denominator coefficients (see Grinder) that
+        implement it, with self as X[0] and other as X[1].  Each Continued
+        remembers the results of its arithmetic, keyed on the operation and
+        the other operand, so that a sub-expression used more than once in
+        an expression shares one Grinder, and one record of the terms it has
+        worked out, instead of each use working them out afresh.  Only the
+        sixteen most recently used results are remembered.\n"""
+
+        if self.__memo is None: self.__memo = memo(16)
+        key = op, (id(other) if isinstance(other, Continued) else other)
+        try: return self.__memo[key][1]
+        except KeyError: pass
+        except TypeError: key = None # unhashable
+
+        ans = Continued(grind((iter(self.__ds), get(other)), ns, ds))
+        # Remember other along with ans, so that its id() isn't recycled:
+        if key is not None: self.__memo.store(key, (other, ans))
+        return ans
+    del LeastRecent
+
+    def __add__(self, other):
+        return self.__grind(other, '+', (0, 1, 1, 0), (1, 0, 0, 0))
     __radd__ = __add__
-    def __sub__(self, other, get=ingest, grind=Grinder):
-        return Continued(grind((iter(self.__ds), get(other)),
-                               (0, -1, 1, 0),
-                               (1, 0, 0, 0)))
-
-    def __rsub__(self, other, get=ingest, grind=Grinder):
-        return Continued(grind((iter(self.__ds), get(other)),
-                               (0, 1, -1, 0),
-                               (1, 0, 0, 0)))
-
-    def __mul__(self, other, get=ingest, grind=Grinder):
-        return Continued(grind((iter(self.__ds), get(other)),
-                               (0, 0, 0, 1),
-                               (1, 0, 0, 0)))
+    def __sub__(self, other):
+        return self.__grind(other, '-', (0, 1, -1, 0), (1, 0, 0, 0))
+
+    def __rsub__(self, other):
+        return self.__grind(other, 'r-', (0, -1, 1, 0), (1, 0, 0, 0))
+
+    def __mul__(self, other):
+        return self.__grind(other, '*', (0, 0, 0, 1), (1, 0, 0, 0))
     __rmul__ = __mul__
 
-    def __truediv__(self, other, get=ingest, grind=Grinder):
-        return Continued(grind((iter(self.__ds), get(other)),
-                               (0, 0, 1, 0),
-                               (0, 1, 0, 0)))
+    def __truediv__(self, other):
+        return self.__grind(other, '/', (0, 1, 0, 0), (0, 0, 1, 0))
 
-    def __rtruediv__(self, other, get=ingest, grind=Grinder):
-        return Continued(grind((iter(self.__ds), get(other)),
-                               (0, 1, 0, 0),
-                               (0, 0, 1, 0)))
+    def __rtruediv__(self, other):
+        return self.__grind(other, 'r/', (0, 0, 1, 0), (0, 1, 0, 0))
 
     class Digits (Grinder):
         """Iterator over a continued fraction's sequence of digits.
@@ -787,8 +873,8 @@ class Continued (object):
             """Round n/d towards zero.
 
             See Grinder._nice for details.\n"""
-            if d * n < 0: d, n = -d, -n
-            q, r = divmod(n, d)
+            q = abs(n) / abs(d)
+            if (n < 0) != (d < 0): q = -q
             return ( q, )
 
         @staticmethod
@@ -797,11 +883,11 @@ class Continued (object):
 
             See Grinder._match for details.\n"""
             if d < 0: n, d = -n, -d
-            if w > 0: return n <= w * d < n + d
-            elif w < 0: return n - d < w * d <= n
+            if w > 0: return w * d <= n < w * d + d
+            elif w < 0: return w * d - d < n <= w * d
             else: return -d < n < d
 
-    def digits(self, base, D=Digits):
+    def digits(self, base, D=Digits, span=1 << 64):
         """Emit self's digits to a given base.
 
         Takes one argument, base: this should either be the number base to be
@@ -809,10 +895,49 @@ class Continued (object):
         number.  Returns an iterator yielding: first, the whole-number part of
         self; then, after each yield, the whole number part that results when
         the fractional part left over by the previous yield is multiplied by
-        the base or its .next(), if it's an iterator.\n"""
-
+        the base or its .next(), if it's an iterator.
+
+        When base is a whole number, at least two, the digits are worked out
+        in blocks: the fractional part is multiplied by the largest power of
+        base not exceeding span (default: 2**64), instead of by base, and the
+        resulting whole-number part is split into digits.  This spares the
+        Grinder its per-digit bookkeeping, for the same digits.\n"""
+
+        if isinstance(base, (int, long)) and base > 1:
+            n, b = 1, base
+            while b * base <= span: n, b = n + 1, b * base
+            if n > 1: return self.__blocks(D(iter(self.__ds), b), base, n)
         return D(iter(self.__ds), base)
 
+    @staticmethod
+    def __blocks(digits, base, count):
+        """Split blocks of digits into single digits.
+
+        Passes on the first yield of digits, the whole-number part, as it
+        is; splits each later yield into count digits to the given base, most
+        significant first, each with the same sign as the block.  Zero digits
+        are held back until a non-zero digit follows them, so that (as when
+        emitting one digit at a time) the digits end with the last non-zero
+        one, if they end at all.\n"""
+
+        yield digits.next()
+        held = 0
+        for block in digits:
+            sign, block, row = -1 if block < 0 else 1, abs(block), []
+            for i in range(count):
+                block, d = divmod(block, base)
+                row.append(sign * int(d))
+            assert block == 0
+
+            while row:
+                d = row.pop()
+                if d:
+                    while held:
+                        yield 0
+                        held -= 1
+                    yield d
+                else: held += 1
+
     # any more ?
     del Grinder, Digits
 
@@ -0,0 +1,259 @@
+"""Contracting tensors without forming their full product.
+
+Contraction of tensors - summing, over some shared indices, products of their
+entries - is easy to describe as a trace of their outer product; but computing
+it that way materialises every entry of the product, most of which are then
+summed away.  For two n-by-n matrices, that's n**4 entries built to compute
+the n**2 entries of their product.  This module works with each tensor's
+leaves laid out as a flat list, in row-major order, and only ever computes the
+entries of the result (and, when contracting more than two tensors, of the
+intermediate results).
+
+Each tensor's ranks are labelled; a label that appears on two ranks (of one
+tensor, or of two) says those ranks are to be contracted with one another.
+The remaining labels say where, among the result's ranks, each surviving rank
+goes.  When more than two tensors are involved, they are contracted two at a
+time, each time choosing the pair whose contraction yields the smallest
+intermediate result (preferring pairs that do share a label over ones that
+would need an outer product).
+
+Provides:
+  Table -- a tensor's leaves, as a flat list, with labels for its ranks
+  contract -- computes the contraction described by a sequence of Tables
+
+When numpy is available and all leaves are float or complex, big enough
+contractions are delegated to numpy.einsum; otherwise, the work is done in
+pure python, so any leaf type supporting + and * (such as
+study.maths.ratio.Rational or study.value.quantity.Quantity) works, with exact
+results where its arithmetic is exact.  Sums are always started from their
+first term, rather than from zero, so leaves with units are fine.
+
+See study.LICENSE for copyright and license information.
+"""
+import operator
+from itertools import imap
+
+class Table (object):
+    """A tensor's leaves, as a flat list, with labelled ranks.
+
+    Attributes:
+      labels -- tuple of hashable labels, one per rank
+      dims -- tuple of dimensions, one per rank
+      leaves -- list of the tensor's leaf values, last index varying fastest
+
+    A Table of rank zero has a single leaf.\n"""
+    __slots__ = ('labels', 'dims', 'leaves')
+    def __init__(self, labels, dims, leaves):
+        assert len(labels) == len(dims)
+        self.labels, self.dims, self.leaves = tuple(labels), tuple(dims), leaves
+
+    @classmethod
+    def nested(cls, labels, seq):
+        """Flatten a nested sequence.
+
+        Required arguments are the labels of the ranks of the sequence and the
+        sequence itself.  The latter's depth of nesting, to be flattened, is
+        the number of labels; at each depth, all entries must have the same
+        length.\n"""
+        dims, row = [], [seq]
+        for it in labels:
+            dims.append(len(row[0]))
+            row = [x for s in row for x in s]
+        return cls(labels, dims, row)
+
+    def unflat(self, wrap=list):
+        """Returns self's leaves as a nested sequence.
+
+        Optional argument, wrap, is called on each list of entries, at each
+        depth, to package it as a sequence; default is list.  For a Table of
+        rank zero, the leaf itself is returned.\n"""
+        row = self.leaves
+        if not self.dims: return row[0]
+        for d in reversed(self.dims[1:]):
+            row = [ wrap(row[i:i+d]) for i in range(0, len(row), d) ]
+        return wrap(row)
+
+    def axes(self):
+        """Returns a mapping from each label to its (dim, stride) pairs."""
+        bok, step = {}, 1
+        for label, dim in reversed(zip(self.labels, self.dims)):
+            bok.setdefault(label, []).append((dim, step))
+            step *= dim
+        return bok
+
+    @staticmethod
+    def offsets(axes):
+        """Offsets into leaves of all entries along the given axes.
+
+        Single argument is a sequence of (dim, stride) pairs; returns the list
+        of offsets, varying the last axis fastest.\n"""
+        offs = [0]
+        for dim, step in axes:
+            offs = [o + k for o in offs for k in range(0, dim * step, step)]
+        return offs
+
+    def size(self, skip=()):
+        """Number of entries in self, ignoring ranks with labels in skip."""
+        return reduce(operator.mul,
+                      (d for l, d in zip(self.labels, self.dims)
+                       if l not in skip), 1)
+
+    def settle(self, keep, add=operator.add):
+        """Sum away the ranks not needed by anything else.
+
+        Single argument, keep, is a collection of the labels still wanted:
+        either by the final result or by some other table.  Any label of self
+        not in keep, or appearing more than once in self, is summed over (for
+        the latter, along the diagonal).  Returns a Table whose labels are the
+        remaining ones, in the order in which they first appear in self; this
+        is self if there was nothing to do.\n"""
+        bok, free, gone = self.axes(), [], []
+        for label in self.labels:
+            if label in free or label in gone: continue
+            if label in keep and len(bok[label]) == 1: free.append(label)
+            else: gone.append(label)
+        if not gone: return self
+
+        leaves, inner = self.leaves, self.offsets(
+            [ (bok[l][0][0], sum(s for d, s in bok[l])) for l in gone ])
+        return Table(free, [bok[l][0][0] for l in free],
+                     [ reduce(add, [leaves[r + k] for k in inner])
+                       for r in self.offsets([bok[l][0] for l in free]) ])
+
+    def permute(self, labels):
+        """Returns a Table with self's leaves re-ordered to the given labels.
+        """
+        labels = tuple(labels)
+        if labels == self.labels: return self
+        bok, leaves = self.axes(), self.leaves
+        axes = [ bok[l][0] for l in labels ]
+        return Table(labels, [d for d, s in axes],
+                     [ leaves[o] for o in self.offsets(axes) ])
+
+    def pair(self, other, add=operator.add, mul=operator.mul, imap=imap):
+        """Contract self with other over the labels they share.
+
+        Both self and other should be settled (see .settle()), so that no
+        label appears twice in either.  The result's labels are those of self
+        not shared with other, followed by those of other not shared with
+        self.  Each leaf is computed as the sum of products of a leaf of self
+        times a leaf of other.\n"""
+        mine, yours = self.axes(), other.axes()
+        shared = [ l for l in self.labels if l in yours ]
+        left = [ l for l in self.labels if l not in yours ]
+        right = [ l for l in other.labels if l not in mine ]
+        assert all(mine[l][0][0] == yours[l][0][0] for l in shared)
+
+        mid, head = self.offsets([mine[l][0] for l in shared]), self.leaves
+        rows = [ [head[r + k] for k in mid]
+                 for r in self.offsets([mine[l][0] for l in left]) ]
+        mid, tail = self.offsets([yours[l][0] for l in shared]), other.leaves
+        cols = [ [tail[c + k] for k in mid]
+                 for c in self.offsets([yours[l][0] for l in right]) ]
+
+        return Table(left + right,
+                     [mine[l][0][0] for l in left] +
+                     [yours[l][0][0] for l in right],
+                     [ reduce(add, imap(mul, row, col))
+                       for row in rows for col in cols ])
+
+from study.cache.module import numpy as _numpy
+
+def _kind(leaves, numeric=(float, complex)):
+    """Classify a Table's leaves for _einsum.
+
+    Returns 'f' if all leaves are float, 'c' if all are float or complex, with
+    at least one complex, else None.  When leaves is itself a numpy array (as
+    it may be for a Table made by study.maths.dense.Array), its dtype
+    answers.\n"""
+    try: kind = leaves.dtype.kind
+    except AttributeError:
+        kinds = set(type(x) for x in leaves)
+        if not kinds.issubset(numeric): return None
+        return 'c' if complex in kinds else 'f'
+    return kind if kind in 'fc' else None
+
+import string
+def _einsum(tables, out, np, letters=string.ascii_letters):
+    """Delegates contract's work to numpy.einsum.
+
+    Returns None if the labels can't be mapped to einsum's single letters.\n"""
+    bok = {}
+    for t in tables:
+        for l in t.labels:
+            if l not in bok: bok[l] = len(bok)
+    if len(bok) > len(letters): return None
+
+    spec = '%s->%s' % (','.join(''.join(letters[bok[l]] for l in t.labels)
+                                for t in tables),
+                       ''.join(letters[bok[l]] for l in out))
+    kind = complex if any(_kind(t.leaves) == 'c' for t in tables) else float
+    arrays = [ np.asarray(t.leaves, dtype=kind).reshape(t.dims)
+               for t in tables ]
+    try: ans = np.einsum(spec, *arrays, optimize=True)
+    except TypeError: ans = np.einsum(spec, *arrays) # old numpy
+    return np.ravel(ans).tolist()
+del string
+
+def contract(tables, out, numeric=(float, complex), least=1 << 12):
+    """Sum products of tables' leaves over their shared labels.
+
+    Required arguments:
+      tables -- a sequence of Table objects
+      out -- sequence of labels for the result's ranks
+
+    Each label in out must appear exactly once among the tables' labels; each
+    other label must appear exactly twice and its two ranks must have equal
+    dimension.  Returns a Table, with labels out, whose entry at any index is
+    the sum, over all indices agreeing with it on out's labels and giving
+    equal values to each pair of ranks sharing any other label, of the product
+    of the tables' entries at that index.  For two tables, each product is
+    taken in the order given; with more, multiplication of leaves is presumed
+    commutative.
+
+    Optional arguments, numeric and least, control the use of numpy (when it
+    is available): if all leaves are of types in numeric and the product of
+    the dimensions of all distinct labels is at least least, the work is
+    delegated to numpy.einsum.  Pass numeric=() to suppress this.  For small
+    tensors, converting to and from numpy arrays costs more than it saves;
+    for Rational or int leaves, numpy would lose exactness or overflow.  A
+    Table's leaves may also be a one-dimensional numpy array; if any is, and
+    all are float or complex, numpy is used regardless of size.\n"""
+    tables, out = list(tables), tuple(out)
+    dims, count = {}, {}
+    for t in tables:
+        for l, d in zip(t.labels, t.dims):
+            count[l] = count.get(l, 0) + 1
+            assert dims.setdefault(l, d) == d, 'Mismatched dimensions'
+    assert all(count.get(l) == 1 for l in out), 'Output labels must be unique'
+    assert all(n == 2 for l, n in count.items() if l not in out)
+
+    if numeric and (any(hasattr(t.leaves, 'dtype') for t in tables) or
+                    reduce(operator.mul, dims.values(), 1) >= least):
+        np = _numpy()
+        if np is not None and all(_kind(t.leaves, numeric) for t in tables):
+            leaves = _einsum(tables, out, np)
+            if leaves is not None:
+                return Table(out, [dims[l] for l in out], leaves)
+
+    # Trace out any labels repeated within a single table:
+    tables = [ t.settle(out + tuple(l for u in tables if u is not t
+                                    for l in u.labels))
+               for t in tables ]
+    while len(tables) > 1:
+        # Greedily pick the pair whose product is smallest:
+        best = None
+        for j, b in enumerate(tables):
+            for i, a in enumerate(tables[:j]):
+                shared = set(a.labels).intersection(b.labels)
+                key = (not shared, a.size(shared) * b.size(shared),
+                       a.size() * b.size(shared))
+                if best is None or key < best[0]: best = key, i, j
+
+        key, i, j = best
+        tables[i] = tables[i].pair(tables[j])
+        del tables[j]
+
+    return tables[0].permute(out)
+
+del imap
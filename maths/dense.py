@@ -0,0 +1,220 @@
+"""Vectors and tensors whose entries are held in numpy arrays.
+
+A study.maths.vector.Vector is a tuple of its entries, with tensors as tuples
+of tuples; its arithmetic is done entry by entry, in python, building each new
+tensor a tuple at a time.  For big tensors of floating-point (or complex)
+values, that's slow.  This module provides Vector types that also hold their
+entries in a numpy.ndarray, so that their arithmetic can be done by numpy.
+
+Provides:
+  Array -- a Vector backed by a numpy array
+  Namely -- a study.maths.vector.Namely backed by a numpy array
+
+An Array is still a tuple of its entries, so it can be used anywhere a Vector
+can; it is simply built from its array, instead of the other way round.  Its
+arithmetic with other Array objects, with sequences of floats and with plain
+numbers is done by numpy; contraction (dot(), tau() and the like) uses
+numpy.einsum; anything else falls back on what Vector does.  Only float and
+complex entries are held in arrays: numpy would silently overflow int entries
+and can't do exact arithmetic on study.maths.ratio.Rational or
+study.maths.polynomial.Polynomial entries, so anything that would produce an
+Array with such entries produces a plain Vector (in tuple form) instead.
+
+This module needs numpy; importing it raises ImportError if numpy is not
+available.  Code that merely wants to go faster when it can should try to
+import it, falling back on study.maths.vector if that fails.
+
+See study.LICENSE for copyright and license information.
+"""
+import numpy
+from study.maths import vector
+from study.cache.property import lazyprop
+
+class Array (vector.Vector):
+    """A Vector whose entries are held in a numpy array.
+
+    Construct from a sequence of numbers or of Vector objects of equal
+    .dimension, as for Vector, or from a numpy.ndarray (which is copied); all
+    leaf values must be float or complex (int values are accepted alongside
+    these, but not on their own), else ValueError is raised.  Pseudo-constructor
+    fromSeq() is more forgiving: it returns a plain Vector when it can't return
+    an Array.
+
+    Attribute array is the numpy.ndarray holding the entries; it is read-only,
+    since the Array is (as a tuple) immutable.  Each entry of an Array of rank
+    greater than one is an Array of one rank less, whose array is a view on
+    part of its parent's; the entries of an Array of rank one are python
+    numbers, so that comparison and hashing work as for a Vector.\n"""
+
+    def __new__(cls, seq):
+        arr = cls._array_(seq)
+        if arr is None:
+            raise ValueError('Entries should be float or complex', seq)
+        return cls._wrap_(arr)
+
+    @classmethod
+    def _wrap_(cls, arr, base=tuple):
+        """Package a numpy array as an instance of cls.
+
+        Takes an ndarray, of rank at least one, whose entries are float or
+        complex, and marks it read-only, since the instance's tuple entries
+        are a snapshot of it.\n"""
+        arr.flags.writeable = False
+        if arr.ndim > 1: rows = [ Array._wrap_(row) for row in arr ]
+        else: rows = arr.tolist()
+        ans = base.__new__(cls, rows)
+        ans.array = arr
+        return ans
+
+    @classmethod
+    def _array_(cls, seq, np=numpy):
+        """Returns a read-only numpy array of seq's entries.
+
+        Returns None if seq's leaves aren't all float or complex (save that
+        some may be int) or its entries at some depth have mismatched
+        dimensions.\n"""
+        if isinstance(seq, Array): return seq.array
+        if isinstance(seq, np.ndarray): arr = np.array(seq)
+        else: arr = cls.__stack(seq)
+        if arr is None or arr.ndim < 1 or arr.dtype.kind not in 'fc':
+            return None
+        arr.flags.writeable = False
+        return arr
+
+    @classmethod
+    def __stack(cls, seq, np=numpy,
+                num=(float, complex, int, long, numpy.number)):
+        if isinstance(seq, Array): return seq.array
+        if isinstance(seq, np.ndarray): return seq
+        seq = list(seq)
+        if not seq: return None
+        if all(isinstance(x, num) and not isinstance(x, bool) for x in seq):
+            return np.array(seq)
+        if all(isinstance(x, (tuple, list, np.ndarray)) for x in seq):
+            seq = [ cls.__stack(x) for x in seq ]
+            if any(x is None for x in seq): return None
+            if len(set(x.shape for x in seq)) == 1: return np.array(seq)
+        return None
+
+    @classmethod
+    def _vector_(cls, seq, plain=vector.Vector):
+        seq = tuple(seq)
+        arr = cls._array_(seq)
+        if arr is None: return plain._vector_(seq)
+        return cls._wrap_(arr)
+
+    @classmethod
+    def _tuple_(cls, val, plain=vector.Vector):
+        # What .map() and friends return needn't be numeric:
+        return plain(val)
+
+    @classmethod
+    def fromSeq(cls, seq, form=None, plain=vector.Vector):
+        """Construct an Array, if possible; else a plain Vector.
+
+        Takes the same arguments as Vector.fromSeq(); if form is None and seq
+        is suitable (see _array_) an Array is returned; otherwise, the result
+        is as for Vector.fromSeq().\n"""
+        if form is None:
+            arr = cls._array_(seq)
+            if arr is not None: return cls._wrap_(arr)
+        return plain.fromSeq(seq, form)
+
+    def _table_(self, labels):
+        from study.maths.contract import Table
+        return Table(labels, self.array.shape, self.array.ravel())
+
+    # Properties:
+    @lazyprop
+    def rank(self):
+        """The rank of self, as a tensor; see Vector."""
+        return self.array.ndim
+
+    @lazyprop
+    def dimension(self):
+        """The sequence of dimensions at different ranks; see Vector."""
+        return self.array.shape
+
+    @lazyprop
+    def squaresum(self, np=numpy):
+        """The sum of squares of (the absolute values of) self's entries."""
+        return (np.absolute(self.array) ** 2).sum().item()
+
+    @lazyprop
+    def biggest(self, np=numpy):
+        """The index of a maximal co-ordinate of self; see Vector."""
+        return tuple(int(i) for i in np.unravel_index(
+                np.argmax(np.absolute(self.array)), self.array.shape))
+
+    # Arithmetic:
+    __scalar = (float, complex, int, long, numpy.number)
+    def __other(self, other):
+        """Returns other's array, if it matches self's shape, else None."""
+        if isinstance(other, (tuple, list, numpy.ndarray)):
+            arr = self._array_(other)
+            if arr is not None and arr.shape == self.array.shape: return arr
+        return None
+
+    def __add__(self, other):
+        arr = self.__other(other)
+        if arr is None: return vector.Vector.__add__(self, other)
+        return self._wrap_(self.array + arr)
+
+    __radd__ = __add__
+    def __neg__(self): return self._wrap_(-self.array)
+
+    def __sub__(self, other):
+        arr = self.__other(other)
+        if arr is None: return vector.Vector.__sub__(self, other)
+        return self._wrap_(self.array - arr)
+
+    def __rsub__(self, other):
+        arr = self.__other(other)
+        if arr is None: return vector.Vector.__rsub__(self, other)
+        return self._wrap_(arr - self.array)
+
+    from study.maths.ratio import Rational
+    def __mul__(self, other, outer=numpy.multiply.outer, exact=Rational):
+        if isinstance(other, exact):
+            # Our entries are inexact anyway, so lose nothing by:
+            other = float(other)
+        if isinstance(other, self.__scalar) and not isinstance(other, bool):
+            return self._wrap_(self.array * other)
+        if isinstance(other, (tuple, list, numpy.ndarray)):
+            arr = self._array_(other)
+            if arr is not None: return self._wrap_(outer(self.array, arr))
+        return vector.Vector.__mul__(self, other)
+
+    def __rmul__(self, other, outer=numpy.multiply.outer, exact=Rational):
+        if isinstance(other, exact): other = float(other)
+        if isinstance(other, self.__scalar) and not isinstance(other, bool):
+            return self._wrap_(other * self.array)
+        if isinstance(other, (tuple, list, numpy.ndarray)):
+            arr = self._array_(other)
+            if arr is not None: return self._wrap_(outer(arr, self.array))
+        return vector.Vector.__rmul__(self, other)
+    del Rational
+
+    # General methods:
+    def transpose(self, n=1, swap=numpy.swapaxes):
+        """Transpose a tensor; see Vector.transpose()."""
+        if n < 0 or n != int(n):
+            raise ValueError("Should be a natural number", n)
+        elif n >= self.rank:
+            raise ValueError("Should be less than rank", n, self.rank)
+        elif n == 0: return self
+        return self._wrap_(swap(self.array, 0, n))
+
+class Namely (Array, vector.Namely):
+    """A study.maths.vector.Namely whose entries are held in a numpy array.
+
+    Derived classes should set _component_names_ and, optionally,
+    _component_aliases_ as for vector.Namely; construction is likewise as for
+    it, save that the components must be float or complex (or Array objects
+    of equal dimension).  Arithmetic is as for Array, with the results
+    (when they are Array) of the same class as self.\n"""
+
+    def __new__(cls, *args, **kw):
+        return Array.__new__(cls, cls._components_(args, kw))
+
+del lazyprop
@@ -1,8 +1,25 @@
 """Differentiation by brute force, to tolerable accuracy.
 
+Real derivatives are estimated by Ridders' method: central differences, over a
+shrinking sequence of steps, fill a Richardson extrapolation table, each of
+whose entries cancels one more even power of step from the error in those it
+combines; the entry that best agrees with its neighbours is used.  Complex
+derivatives of holomorphic functions are read off Cauchy's integral formula,
+applying the trapezium rule on circles, of shrinking radii, about the input;
+this converges geometrically, so is as accurate as rounding allows, as soon as
+the circle encloses no singularity.  A real function that is the restriction
+to the real line of a holomorphic one (so accepts complex inputs, as
+polynomials and exp do) can use the complex step: its derivative is the
+imaginary part of its value a tiny imaginary step from its input, divided by
+that step, without any cancellation.
+
+In each case, all the points at which the function is needed are known in
+advance; so a function that accepts numpy arrays can be evaluated at all of
+them (for many inputs at once, even) in a single call.
+
 See study.LICENSE for copyright and license information.
 """
-
+
 class Single (object):
     """Function of one (real or complex) variable.
 
@@ -12,7 +29,8 @@ class Single (object):
     reals.  This class is not suitable for such a case: use a vector
     derivative class instead.\n"""
 
-    def __init__(self, func, complex=False, scale=1):
+    def __init__(self, func, complex=False, scale=1,
+                 vector=False, analytic=False, size=256):
         """Prepare for differentiation.
 
         Required argument, func, is the function to differentiate.  Optional
@@ -20,142 +38,149 @@ class Single (object):
           complex -- False, the default, for real differentiation; true for
                      complex differentiation.
           scale -- size of zone, around an input, to explore (see below)
+          vector -- true if func accepts numpy arrays (default: False)
+          analytic -- true if real func accepts complex inputs, on which it is
+                      holomorphic (default: False); ignored if complex is true
+          size -- number of values of func, and of derivatives, to remember
+
+        When called on an input, values of func within scale of the given
+        input, mostly closer to it, shall be evaluated and used to compute the
+        derivative; if analytic is true, only one value, a tiny imaginary step
+        away from the input, is needed.  If vector is true and numpy is
+        available, all values needed are computed in a single call to func,
+        passing it a numpy array of inputs; the answer should be the array of
+        func's values at these.  Otherwise, func is called on each input in
+        turn and its results are cached (unless func is already a
+        study.cache.mapping.LazyFunc, in which case its own cache is used).
+        Either way, up to size derivatives are remembered, least recently used
+        first forgotten.\n"""
+        self.__scale, self.__kind = scale, (
+            self.__cauchy if complex else
+            self.__step if analytic else self.__ridders)
+        self.__vector = _numpy() if vector else None
+        self.__func, self.__f = func, self.__lazy(func, size)
+        self.__known = self.__cache(size)
+
+    from study.cache.mapping import LazyFunc, LeastRecent
+    @staticmethod
+    def __lazy(f, size, w=LazyFunc.wrap, b=LeastRecent): return w(f, b(size))
+    @staticmethod
+    def __cache(size, b=LeastRecent): return b(size)
+    del LazyFunc, LeastRecent
 
-        When called on an input, assorted values of func within scale of the
-        given input, mostly closer to it, shall be evaluated and used to
-        compute estimates at the derivative.\n"""
-        self.__f, self.__scale = self.__lazy(func), scale
-        self.__dust, self.__variance = (
-            tuple(self.__swirly()), self.__messy) if complex else (
-            tuple(self.__dusty()), self.__simple)
+    def __call__(self, val, scale=None):
+        """Derivative at val.
 
-    from study.cache.mapping import LazyFunc
-    @staticmethod
-    def __lazy(f, w=LazyFunc.wrap): return w(f)
-    del LazyFunc
-    def __known(self):
-        """Unpack LazyFunc's generic key to obtain our simple input"""
-        return self.__f.known().map(lambda (k, v): (k[0][0], v))
+        Optional argument, scale, over-rides the constructor's for this
+        call.\n"""
+        if scale is None: scale = self.__scale
+        try: return self.__known[val, scale]
+        except KeyError: pass
+
+        if self.__vector is None:
+            offs, combine = self.__kind(scale)
+            f = self.__f
+            ans = combine([f(val + x) for x in offs], self.__plain)
+        else: ans = self.many((val,), scale)[0].item()
+
+        self.__known.store((val, scale), ans)
+        return ans
+
+    def many(self, vals, scale=None):
+        """Derivatives at each of a sequence of inputs.
+
+        Required argument, vals, is a sequence of inputs; optional scale is as
+        for calling self.  If self was constructed with vector true (and numpy
+        is available), returns a numpy array of derivatives, having computed
+        all the values it needed by a single call to the function; otherwise,
+        returns a list of derivatives, computed as for calling self on each
+        entry in vals.  Results are not remembered.\n"""
+        if scale is None: scale = self.__scale
+        np = self.__vector
+        if np is None: return [ self(v, scale) for v in vals ]
+
+        offs, combine = self.__kind(scale)
+        vals, offs = np.asarray(vals), np.array(offs)
+        grid = (vals[:, None] + offs[None, :]).ravel()
+        data = np.asarray(self.__func(grid)).reshape(len(vals), len(offs))
+        return combine(list(data.T), (np.maximum, np.where, np.any))
+
+    # Each of __ridders, __step and __cauchy takes a scale and returns a
+    # sequence of offsets, from the input, at which func is needed, and a
+    # function to combine func's values there into the derivative.  Its second
+    # argument is a triple (max, where, any) of tools that work either on
+    # single values (__plain) or, element-wise, on numpy arrays.
+    __plain = (max, lambda c, a, b: a if c else b, bool)
 
     @staticmethod
-    def __dusty(scale=1, count=15, step=-.5):
-        # See __swirly
-        yield scale
-        while count > 0:
-            count -= 1
-            scale *= step
-            yield scale
+    def __ridders(scale, shrink=1.4, count=10, safe=2.):
+        """Richardson extrapolation on central differences.
+
+        Central differences are taken with steps scale / shrink**i for i in
+        range(count); each new one adds a row to the table, in which each entry
+        extrapolates the one before it, in the same row, and the one above
+        that.  The error estimate of each entry is the larger of its
+        differences from these; the entry of least estimated error is used.
+        Once the diagonal entries start moving by much more (safe times) than
+        that least error, rounding is taking over, so later rows are
+        ignored.\n"""
+        steps = [ scale * shrink**-i for i in range(count) ]
+        offs = [ s * h for h in steps for s in (1, -1) ]
+        def combine(vals, (most, where, any), rate=shrink**2):
+            cols = [ (vals[2 * i] - vals[2 * i + 1]) / (2 * h)
+                     for i, h in enumerate(steps) ]
+            row, best, err, live = [cols[0]], cols[0], None, True
+            for col in cols[1:]:
+                new, fac = [col], rate
+                for j in range(1, len(row) + 1):
+                    new.append((new[j - 1] * fac - row[j - 1]) / (fac - 1))
+                    fac *= rate
+                    e = most(abs(new[j] - new[j - 1]), abs(new[j] - row[j - 1]))
+                    if err is None: best, err = new[j], e
+                    else:
+                        good = live & (e <= err)
+                        best, err = where(good, new[j], best), where(good, e, err)
+                live = live & (abs(new[-1] - row[-1]) < safe * err)
+                if not any(live): break
+                row = new
+            return best
+        return offs, combine
 
     @staticmethod
-    def __simple(vals):
-        # See __messy
-        return vals.map(lambda v, m=vals.mean(): v-m).map(
-            lambda v: v*v).sum() / (len(vals) - 1.)
+    def __step(scale, tiny=1e-20):
+        """The complex step: the derivative is f(x + i.h).imag / h."""
+        h = scale * tiny
+        return (1j * h,), lambda (val,), tools: val.imag / h
 
     import cmath
-    ninth = 2j * cmath.pi / 9
-    @staticmethod
-    def __swirly(star=tuple(cmath.exp(x) for x in (ninth, 4*ninth, 7*ninth)),
-                 count=10, step=.4j-.3):
-        """A bunch of points near zero, denser the nearer they get.
-
-        The instance's .__dust is a set of offsets, of scale up to 1, that can
-        be scaled by the radius, and added to the centre-point, of a
-        neighbourhood so as to get a good sampling of points within the
-        neighbourhood, at which to evaluate our function in order to look at
-        chords to infer a gradient.  Either this method, for complex, or
-        .__dusty() for reals, is used to compute .__dust.\n"""
-
-        for x in star: yield x
-        while count > 0:
-            count -= 1
-            star = [x * step for x in star]
-            for x in star: yield x
-    del ninth, cmath
-
-    from study.maths.vector import Vector
-    @staticmethod
-    def __messy(vals, V=Vector, zero=Vector.xerox((2, 2))):
-        """Compute (real) variance of vals.
-
-        The instance's .__variance() takes a list of candidate derivatives and
-        returns its variance.  For the real case, this is trivial, see
-        .__simple(); for the complex case, since we want a real variance and
-        (in any case) the usual variance doesn't make so much sense, I treat
-        the complex values as real 2-vectors, compute their covariance matrix
-        and return the square root of its determinant (i.e. the geometric mean
-        of the two diagonal entries, when it's put into diagonal form).\n"""
-        mean = vals.mean()
-        vary = vals.map(lambda z, m=mean: z-m).map(
-            lambda z, vec=V: vec((z.real, z.imag))).map(
-            lambda v: v*v).sum(zero) * (1. / (len(vals) - 1))
-
-        return (vary[0][0] * vary[1][1] -vary[0][1] * vary[1][0])**.5
-
-    from study.snake.sequence import List
-    @staticmethod
-    def __gradients(val, near, Seq=List):
-        """Return a list of gradients from an iterable over data.
-
-        Requires (exactly) two arguments:
-          val -- an input to self.__f
-          near -- an iterable over (x, self.__f(x)) pairs
-
-        The latter should include plenty of x values near val.  Constructs all
-        chords between points therein, sorted by closeness of each chord's end
-        furthest from val and returns a list of gradients of chords.\n"""
-
-        data = Seq(near)
-        return Seq(Seq(data.enumerate().map(
-            # For each pair of a point in data and an earlier point in data:
-            lambda (i, p), d=data, m=val: d[:i].map(
-                # Compute chord between points, along with max distance from val:
-                lambda (q, r), (k, v)=p, m=m: (max(abs(k-m), abs(q-m)), q-k, r-v)
-                # Join sub-lists (one per point and list-of-earlier-points):
-                )).sum(Seq()).filter(
-            # Filter out empty chords, convert each to its gradient:
-            lambda (m, x, y): x).map(lambda (m, x, y): (m, y/x))).sorted(
-            # Sort by closeness of chords about val:
-            lambda (m, w), (n, z): cmp(m, n)
-            # and discard the closeness data, that we no longer need:
-            ).map(lambda (m, z): z))
-    del List
+    __roots = tuple([ cmath.exp(2j * cmath.pi * i / 16) for i in range(16) ])
+    del cmath
 
-    def __call__(self, val, scale=None):
-        if scale is None: scale = self.__scale
-        # Populate cache with data near val:
-        self.__f(val)
-        [self.__f(val + x * scale) for x in self.__dust]
-
-        # Get available chord-gradients near val:
-        data = self.__gradients(val, self.__known().filter(
-                # All cached data within scale of val:
-                lambda (k, v), a=val, s=abs(scale): abs(k -a) <= s))
-
-        # Now select a good gradient from data, preferring gradients obtained
-        # from chords close about val but mistrusting those too close if
-        # they're wildly different from those similarly close, as this may
-        # indicate numerical instability.
-        while len(data) > 15: # we start with over 100
-            n = min(5, len(data) / 5)
-            cuts = [(i * len(data) + n / 2) / n for i in range(1 + n)]
-            part = [data[i:j] for i, j in zip(cuts[:-1], cuts[1:])]
-            assert len(part) == n
-
-            # Find the part with smallest variance:
-            score = [self.__variance(p) for p in part]
-            best = score.index(min(score)) # favour earlier parts over later, if equal
-            data = part[best]
-
-            # but retain adjacent thirds of its neighbours:
-            third = (len(data) + 1) / 3
-            if best > 0: data = part[best-1][-third:] + data
-            try: data += part[best+1][:third]
-            except IndexError: pass
-
-            # So each iteration reduces len(data) by a factor of 3 or, if best
-            # was a boundary value, a factor of 15/4 < 4.
-            assert len(data) > 3
-
-        # Now select the mean of the low-variance sub-list we settled on:
-        return data.mean()
+    @staticmethod
+    def __cauchy(scale, roots=__roots, shrink=.25, count=5):
+        """Cauchy's integral formula, on circles of shrinking radius.
+
+        The derivative at z is the integral, around a circle of radius r about
+        z, of f(w).dw / (w -z)**2 / (2.pi.i); with w = z + r.exp(i.t) that's
+        the average of f(w) / (w -z) over the circle.  The trapezium rule,
+        using len(roots) points evenly spaced round the circle, gives this with
+        an error of order (r/R)**len(roots), if f's nearest singularity is at
+        distance R.  Radii scale * shrink**i, for i in range(count), are used;
+        of the estimates so obtained, the later of the two successive ones that
+        agree best is returned.\n"""
+        radii, n = [ scale * shrink**i for i in range(count) ], len(roots)
+        offs = [ r * w for r in radii for w in roots ]
+        def combine(vals, (most, where, any)):
+            ests = [ reduce(lambda x, y: x + y,
+                            [ v / w for v, w in zip(vals[i * n:], roots) ]) / (n * r)
+                     for i, r in enumerate(radii) ]
+            best, err = ests[1], abs(ests[1] - ests[0])
+            for was, now in zip(ests[1:], ests[2:]):
+                e = abs(now - was)
+                good = e < err
+                best, err = where(good, now, best), where(good, e, err)
+            return best
+        return offs, combine
+    del __roots
+
+from study.cache.module import numpy as _numpy
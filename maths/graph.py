@@ -2,7 +2,8 @@
 
 Contents:
   Partition, Find, Unite, FindUnite -- a graph-partitioning algorithm
-  Graph -- a simple (undirected) graph representation
+  components(size, heads, tails) -- labels nodes by connected component
+  Graph -- a simple (undirected) graph representation, with adjacency lists
 
 See also graphviz (http://www.graphviz.org/ and man pages for: twopi, dotty,
 lefty, acyclic, lneato, nop, tred, gc, sccmap, unflatten, gvgpr, dot, neato,
@@ -32,6 +33,8 @@ class Partition:
     Partitions support len(); a new node may be added by calling append(len()).
     It is presumed that the caller had some prior knowledge of len()'s value;
     the argument to append() is asserted to be len() when __debug__ is true.
+    Several nodes may be added at once by calling extend(n), to grow len() to
+    n.
 
     Each new node will be in a new part when created: thus initialisation of the
     nodes creates a `discrete' partition in which each node is a part and each
@@ -64,6 +67,10 @@ class Partition:
         """Returns true iff all the given nodes are in one connected component."""
         raise NotImplementedError
 
+from array import array
+
+from study.cache.module import numpy as _numpy
+
 class Unite (Partition):
     """Keeps track of the parts of a partition.
 
@@ -74,14 +81,18 @@ class Unite (Partition):
 
     def __init__(self, size=0):
         """Initialise internal datastructures."""
-        self.__forward = range(size)
-        self.__backward = range(size)
+        self.__forward = array('l', xrange(size))
+        self.__backward = array('l', xrange(size))
 
         # Chasing i->forward[i] leads round a loop;
         # likewise  backward, traversing the same loop in reverse.
         # Each such loop is a connected component of self.
         # assert i == backward[forward[i]] for each 0 < i < len(self)
 
+    def _loops_(self, forward, backward):
+        """Replace the loops wholesale; see FindUnite.fromLabels()."""
+        self.__forward, self.__backward = forward, backward
+
     def __len__(self): return len(self.__forward)
     # assert: equal to len(self.__backward)
 
@@ -96,7 +107,7 @@ class Unite (Partition):
         while True:
             yield n
             n = f[n]
-            if n is node: break
+            if n == node: break
 
     def append(self, ind):
         assert len(self.__forward) == ind == len(self.__backward), \
@@ -106,6 +117,12 @@ class Unite (Partition):
         self.__forward.append(ind)
         self.__backward.append(ind)
 
+    def extend(self, size):
+        """Adds nodes, each in a new part, to make len(self) == size."""
+        new = xrange(len(self.__forward), size)
+        self.__forward.extend(new)
+        self.__backward.extend(new)
+
     def join(self, nod, ver):
         """Joins two *disjoint* components.
 
@@ -116,11 +133,11 @@ class Unite (Partition):
 
         f, b = self.__forward, self.__backward
         pod, wer = f[nod], f[ver]
-        assert b[pod] is nod and b[wer] is ver
+        assert b[pod] == nod and b[wer] == ver
         # Do the swaps:
         b[pod], b[wer] = ver, nod
         f[nod], f[ver] = wer, pod
-
+
 class Find (Partition):
     """Keeps track of `in same part' truths for a partition.
 
@@ -130,22 +147,35 @@ class Find (Partition):
     Methods:
       joined(node, ...) -- true if all given nodes are in one part
       join(this, that) -- ensures two nodes are joined
+      join_many(pairs) -- joins each pair in a sequence
+      find(node) -- the representative member of node's part
+      find_many(nodes) -- array of find(node) for each of several nodes
       disjoint() -- returns a list of nodes, one from each part
       peercount(node) -- size of given node's connected component
-    """
+
+    Each node's parent and each part's size are held in arrays of machine
+    integers, which take a fraction of the memory of lists of python ints.
+    Joining hangs the smaller part's tree below the bigger's root (union by
+    size) and each look-up points every node it passes directly at the root
+    it finds (path compression); together these keep the trees so shallow
+    that each operation takes, in practice, constant time.\n"""
 
     def __init__(self, size=0):
-        self.__up = range(size)
-        self.__count = [ 1 ] * size
+        self.__up = array('l', xrange(size))
+        self.__count = array('l', [1]) * size
 
         # self.__up[i] is a member of the same connected component as i; i is
         # the representative member of the component iff i is self.__up[i], in
         # which case self.__count[i] is the size of the connected component.
 
+    def _roots_(self, up, count):
+        """Replace the trees wholesale; see FindUnite.fromLabels()."""
+        self.__up, self.__count = up, count
+
     def __len__(self): return len(self.__up)
     # assert: always equal to len(self.__count)
 
-    def __chase(self, node):
+    def find(self, node):
         """Returns the representative member of node's connected component.
 
         Single argument is a node (index): returns the node reached from this by
@@ -153,18 +183,24 @@ class Find (Partition):
         __up[] of all nodes it visits on the way to point at the answer
         returned, so as to speed this chase next time around.\n"""
 
-        trail = []
-        while True:
-            n = self.__up[node]
-            if n is node: break
-            trail.append(node)
-            node = n
+        up, root = self.__up, node
+        while up[root] != root: root = up[root]
+        while up[node] != root: up[node], node = root, up[node]
+        return root
 
-        # self.__up[node] is node, as is self.__up[trail[-1]] if len(trail) > 0.
+    __chase = find
 
-        # All but the last item in trail need to point __up at node:
-        for n in trail[:-1]: self.__up[n] = node
-        return node
+    def find_many(self, nodes):
+        """Returns an array of the representative members of given nodes.
+
+        Equivalent to array('l', map(self.find, nodes)), but faster.\n"""
+        up, ans = self.__up, array('l')
+        for node in nodes:
+            root = node
+            while up[root] != root: root = up[root]
+            while up[node] != root: up[node], node = root, up[node]
+            ans.append(root)
+        return ans
 
     def peercount(self, node): return self.__count[self.__chase(node)]
 
@@ -191,6 +227,12 @@ class Find (Partition):
         # New node's sub-tree contains only one node: itself.
         self.__count.append(1) # and self.__count[ind] is 1.
 
+    def extend(self, size):
+        """Adds nodes, each in a new part, to make len(self) == size."""
+        old = len(self.__up)
+        self.__up.extend(xrange(old, size))
+        self.__count.extend(array('l', [1]) * (size - old))
+
     def join(self, node, vertex):
         """Joins two nodes.
 
@@ -198,7 +240,7 @@ class Find (Partition):
         i.e. what `not self.joined()' would have returned previously."""
 
         nod, ver = self.__chase(node), self.__chase(vertex)
-        if nod is ver: return # nothing to do
+        if nod == ver: return # nothing to do
 
         # Who has the bigger sub-tree ?
         count = self.__count
@@ -209,13 +251,40 @@ class Find (Partition):
         self.__up[ver], count[nod] = nod, n + v
         return True
 
+    def join_many(self, pairs, merged=None):
+        """Joins each pair of nodes in a sequence.
+
+        Required argument, pairs, is an iterable over (node, vertex) pairs;
+        the result is as if .join(node, vertex) were called on each.
+        Optional argument, merged, is a function to call as merged(node,
+        vertex) on each pair that was in disjoint parts until joined.
+        Returns the number of such pairs.\n"""
+        up, count, joins = self.__up, self.__count, 0
+        for node, vertex in pairs:
+            nod = node
+            while up[nod] != nod: nod = up[nod]
+            i = node
+            while up[i] != nod: up[i], i = nod, up[i]
+            ver = vertex
+            while up[ver] != ver: ver = up[ver]
+            i = vertex
+            while up[i] != ver: up[i], i = ver, up[i]
+            if nod == ver: continue
+
+            n, v = count[nod], count[ver]
+            if n < v: nod, ver = ver, nod
+            up[ver], count[nod] = nod, n + v
+            joins += 1
+            if merged is not None: merged(node, vertex)
+        return joins
+
     def disjoint(self):
         """Iterates one sample member from each connected component.\n"""
         # the sample members being the fixed-points of __up
 
         for i, x in enumerate(self.__up):
             if i == x: yield i
-
+
 class FindUnite (Find, Unite):
     """An implementation of the find-unite algorithm.
 
@@ -225,9 +294,11 @@ class FindUnite (Find, Unite):
     packaging for a graph with arbitrary python objects as nodes.
 
     Create an instance of FindUnite(); for each edge in a graph, identify the
-    two ends and invoke the instance's .join(thisend, thatend).  At any stage,
-    invoke .peers(node) to get a list of all nodes in the given one's connected
-    component.\n"""
+    two ends and invoke the instance's .join(thisend, thatend), or pass all
+    the edges to .join_many().  At any stage, invoke .peers(node) to get a
+    list of all nodes in the given one's connected component.  Given a
+    labelling of nodes by component (see components(), below), .fromLabels()
+    can build the same state directly.\n"""
 
     def __init__(self, size=0):
         """Initialises an empty FindUnite."""
@@ -235,10 +306,61 @@ class FindUnite (Find, Unite):
         Find.__init__(self, size)
         Unite.__init__(self, size)
 
+    @classmethod
+    def fromLabels(cls, labels):
+        """Construct from a labelling of nodes by connected component.
+
+        Single argument is a sequence of labels, one per node, in which each
+        node's label is the least node in its component (as components()
+        returns); the result has the partition the labels describe.  Uses
+        numpy, if available and labels is a numpy array.\n"""
+        ans, size = cls(), len(labels)
+        np = _numpy() if hasattr(labels, 'dtype') else None
+        if np is None:
+            first, last, count = {}, {}, array('l', [0]) * size
+            forward = array('l', xrange(size))
+            for i, r in enumerate(labels):
+                count[r] += 1
+                if r in last: forward[last[r]] = i
+                else: first[r] = i
+                last[r] = i
+            for r, i in last.iteritems(): forward[i] = first[r]
+            up = array('l', labels)
+            backward = array('l', [0]) * size
+            for i, j in enumerate(forward): backward[j] = i
+        else:
+            def pack(a, np=np): return array('l', a.astype(np.int_).tostring())
+            labels = np.asarray(labels)
+            order = np.argsort(labels, kind='mergesort')
+            ordered = labels[order]
+            ends = np.ones(size, dtype=bool)
+            ends[:-1] = ordered[1:] != ordered[:-1]
+            # Each node's successor in its loop is the next in order, save
+            # that the last of each component wraps round to the first:
+            succ = np.roll(order, -1)
+            begins = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+            succ[ends] = order[begins]
+            forward = np.empty(size, dtype=np.int_)
+            forward[order] = succ
+            backward = np.empty(size, dtype=np.int_)
+            backward[forward] = np.arange(size)
+            forward, backward, up = pack(forward), pack(backward), pack(labels)
+            count = pack(np.bincount(labels, minlength=size))
+        ans._roots_(up, count)
+        ans._loops_(forward, backward)
+        return ans
+
+    # Partition's stub would otherwise hide Unite's, via Find:
+    peers = Unite.peers
+
     def append(self, ind):
         Find.append(self, ind)
         Unite.append(self, ind)
 
+    def extend(self, size):
+        Find.extend(self, size)
+        Unite.extend(self, size)
+
     def join(self, node, vertex):
         """Joins a given pair of nodes.
 
@@ -252,6 +374,12 @@ class FindUnite (Find, Unite):
             # Find did something: get Unite in on the act.
             Unite.join(self, node, vertex)
 
+    def join_many(self, pairs):
+        """Joins each pair of nodes in a sequence; see Find.join_many()."""
+        return Find.join_many(self, pairs, self.__unite)
+
+    def __unite(self, node, vertex): Unite.join(self, node, vertex)
+
     def partition(self):
         """Iterates the connected components of the graph.
 
@@ -260,7 +388,47 @@ class FindUnite (Find, Unite):
 
         for i in self.disjoint():
             yield tuple(self.peers(i))
-
+
+def components(size, heads, tails):
+    """Labels each node by the connected component it is in.
+
+    Required arguments are the number of nodes and two sequences of equal
+    length, giving the two ends of each edge (as node indices).  Returns a
+    sequence of size labels, each node's label being the least node in its
+    connected component.
+
+    When numpy is available, this is a numpy array, computed by alternately
+    hooking, for each edge whose ends have different labels, the bigger label
+    onto the smaller and then jumping each node's label to its label's label
+    until nothing changes; each round of this takes a few array operations
+    over all edges and labels, and few rounds are needed.  Otherwise, it is
+    an array('l') computed by Find.join_many().\n"""
+    np = _numpy()
+    if np is None:
+        find = Find(size)
+        find.join_many(zip(heads, tails))
+        up = find.find_many(xrange(size))
+        # Relabel by least member:
+        least = {}
+        for i, r in enumerate(up): least.setdefault(r, i)
+        return array('l', (least[r] for r in up))
+
+    label = np.arange(size)
+    heads = np.asarray(heads, dtype=np.int_)
+    tails = np.asarray(tails, dtype=np.int_)
+    while True:
+        a, b = label[heads], label[tails]
+        differ = a != b
+        if not differ.any(): return label
+        a, b = a[differ], b[differ]
+        # Every label is a root (its own label), so hooking the bigger of
+        # each pair onto the smaller never makes a cycle:
+        label[np.maximum(a, b)] = np.minimum(a, b)
+        while True:
+            jump = label[label]
+            if (jump == label).all(): break
+            label = jump
+
 class Graph:
     """Represents a network of nodes joined by edges.
 
@@ -269,11 +437,17 @@ class Graph:
       Graph([node, ...]) -- creates a new graph with, optionally, the given
                             objects as (initially) unconnected nodes.
 
-    Command:
+    Nodes may be any hashable objects; each is recorded, in a dictionary, with
+    the index at which it appears in .nodes; edges are recorded as the
+    indices of their ends.
+
+    Commands:
 
       join(this, that) -- adds an edge from this to that, optionally adding each
                           as a node in the process.
 
+      join_many(edges) -- joins each (this, that) pair in a sequence of edges.
+
     None of the following modifies the graph: whereas join() will add any
     unfamiliar arguments as nodes of the graph, the queries (below) will
     interprete any unrecognised node as being outside the graph and connected to
@@ -306,6 +480,12 @@ class Graph:
       joined(node, ...) -- tests whether given nodes are all in one connected
                            component.
 
+      neighbours(node) -- returns a tuple of the nodes joined to node by an
+                          edge.
+
+      breadth(node, ...) -- iterates the nodes reachable from the given ones,
+                            nearest first.
+
       span(node, ...) -- returns a Graph consisting of all nodes and arcs in the
                          same connected component as at least one of the given
                          nodes.
@@ -315,21 +495,36 @@ class Graph:
 
     Note that .span() provides a sub-graph `grown outwards from' its given
     nodes, while .chop() provides a sub-graph `stripped down to only' the given
-    nodes.\n"""
+    nodes.
+
+    The connected components are maintained as edges are added, by a
+    FindUnite, so .joined(), .peers() and .partition need never look at the
+    edges.  The other queries walk the graph's adjacency, which is held in
+    compressed sparse row form: for the node with index i, the entries of
+    .__adj[.__row[i]:.__row[i+1]] are the indices of its neighbours and the
+    matching entries of .__via are the indices of the edges that join it to
+    them.  This is built, in time proportional to the number of edges, when
+    first needed after any change to the graph.\n"""
 
     # Creation:
     def __init__(self, *nodes):
-        self.__edges, self.__nodes, self.__connect = [], list(nodes), FindUnite(len(nodes))
+        self.__nodes, self.__index, self.__connect = [], {}, FindUnite()
+        self.__heads, self.__tails = array('l'), array('l')
+        self.__csr = None
+        for node in nodes: self.__node(node)
 
     # Read-only access to private members:
     @property
     def nodes(self): return tuple(self.__nodes)
     @property
-    def edges(self): return tuple(self.__edges)
+    def edges(self):
+        nodes = self.__nodes
+        return tuple((nodes[a], nodes[b])
+                     for a, b in zip(self.__heads, self.__tails))
     @property
     def partition(self): return tuple(self.__peers(i) for i in self.__connect.disjoint())
 
-    # Command: .join() with support from .__node()
+    # Commands: .join() and .join_many() with support from .__node()
 
     def __node(self, node):
         """Returns internal index of node, adding node to graph if needed.
@@ -338,37 +533,118 @@ class Graph:
         returned.  Otherwise, the node is added to internal datastructures with
         a previously-unused index, which is returned.  For internal use only.\n"""
 
-        # Could be more efficient using an inverse-lookup here.
-        try: return self.__nodes.index(node)
-        except ValueError: pass
+        try: return self.__index[node]
+        except KeyError: pass
 
-        ind = len(self.__nodes)
+        ind = self.__index[node] = len(self.__nodes)
         self.__nodes.append(node)
-
         self.__connect.append(ind)
+        self.__csr = None
         return ind
 
     def join(self, start, stop):
         """Connects two nodes in the present graph, adding the nodes if necessary.\n"""
 
-        self.__edges.append((start, stop))
-        self.__connect.join(self.__node(start), self.__node(stop))
+        a, b = self.__node(start), self.__node(stop)
+        self.__heads.append(a)
+        self.__tails.append(b)
+        self.__connect.join(a, b)
+        self.__csr = None
+
+    def join_many(self, edges):
+        """Connects each pair of nodes in a sequence, adding nodes as needed.
+
+        Single argument is an iterable over (start, stop) pairs; the result is
+        as if .join(start, stop) were called on each, but faster.  When numpy
+        is available and most of the graph's edges arrive in one call (of
+        more than 2**16 edges), the partition into connected components is
+        worked out afresh by components(), instead of one edge at a time.\n"""
+
+        index, nodes = self.__index, self.__nodes
+        heads, tails, old = self.__heads, self.__tails, len(self.__heads)
+        for start, stop in edges:
+            try: a = index[start]
+            except KeyError:
+                a = index[start] = len(nodes)
+                nodes.append(start)
+            try: b = index[stop]
+            except KeyError:
+                b = index[stop] = len(nodes)
+                nodes.append(stop)
+            heads.append(a)
+            tails.append(b)
+        self.__csr = None
+
+        new, np = len(heads) - old, _numpy()
+        if np is not None and new > 1 << 16 and 2 * new > len(heads):
+            # Most edges are new: cheaper to label components afresh.
+            self.__connect = FindUnite.fromLabels(components(
+                    len(nodes), np.frombuffer(heads, dtype=np.int_),
+                    np.frombuffer(tails, dtype=np.int_)))
+        else:
+            self.__connect.extend(len(nodes))
+            self.__connect.join_many(zip(heads[old:], tails[old:]))
+
+    # Adjacency, in compressed sparse row form:
+
+    def __adjacency(self):
+        """Returns (row, adj, via), building them if needed; see class doc."""
+        if self.__csr is None:
+            size, heads, tails = len(self.__nodes), self.__heads, self.__tails
+            row = array('l', [0]) * (size + 1)
+            for a in heads: row[a + 1] += 1
+            for b in tails: row[b + 1] += 1
+            for i in xrange(size): row[i + 1] += row[i]
+
+            adj, via = array('l', [0]) * row[size], array('l', [0]) * row[size]
+            fill = row[:size]
+            for e in xrange(len(heads)):
+                a, b = heads[e], tails[e]
+                i = fill[a]
+                adj[i], via[i], fill[a] = b, e, i + 1
+                i = fill[b]
+                adj[i], via[i], fill[b] = a, e, i + 1
+
+            self.__csr = row, adj, via
+        return self.__csr
+
+    def __reach(self, starts):
+        """Breadth-first traversal from some node indices.
+
+        Yields (index, edges) pairs: each node index reachable from starts,
+        nearest first, with the list of indices of its edges.\n"""
+        row, adj, via = self.__adjacency()
+        seen, todo = set(starts), list(starts)
+        for i in todo: # todo grows as we go
+            lo, hi = row[i], row[i + 1]
+            yield i, via[lo:hi]
+            for j in adj[lo:hi]:
+                if j not in seen:
+                    seen.add(j)
+                    todo.append(j)
+
+    def __sub(self, nodes, edges):
+        """A Graph with the given nodes and the edges with given indices."""
+        ans, mine = Graph(*nodes), self.__nodes
+        ans.join_many((mine[self.__heads[e]], mine[self.__tails[e]])
+                      for e in sorted(edges))
+        return ans
 
-    # Queries: joined(), peers() and sub-Graph()s.
+    # Queries: joined(), peers(), neighbours(), breadth() and sub-Graph()s.
 
     def joined(self, *nodes): # requires at least one node, in fact
         if len(nodes) < 1:
             raise ValueError('no nodes provided: how can I check whether they are joined ?')
         if len(nodes) < 2: return True # every node is implicitly connected to itself
 
-        try: indices = [self.__nodes.index(n) for n in nodes]
-        except ValueError: return False
+        try: indices = [self.__index[n] for n in nodes]
+        except KeyError: return False
 
         return self.__connect.joined(*indices)
 
     def peercount(self, node):
-        try: nod = self.__nodes.index(node)
-        except ValueError: return True
+        try: nod = self.__index[node]
+        except KeyError: return 1
 
         return self.__connect.peercount(nod)
 
@@ -377,42 +653,72 @@ class Graph:
 
     def peers(self, node):
         # NB: does not add node to graph if it wasn't in it previously
-        try: nod = self.__nodes.index(node)
-        except ValueError: return [ node ]
+        try: nod = self.__index[node]
+        except KeyError: return [ node ]
 
         return self.__peers(nod)
 
+    def neighbours(self, node):
+        """Returns a tuple of the nodes joined to the given one by edges.
+
+        Each appears once, in the order of the first edge joining it to node;
+        node itself is included if some edge joins it to itself.\n"""
+        try: i = self.__index[node]
+        except KeyError: return ()
+        row, adj, via = self.__adjacency()
+        seen, ans = set(), []
+        for j in adj[row[i]:row[i + 1]]:
+            if j not in seen:
+                seen.add(j)
+                ans.append(self.__nodes[j])
+        return tuple(ans)
+
+    def breadth(self, *nodes):
+        """Iterates the nodes reachable from the given ones, nearest first.
+
+        Yields each given node (once, even if repeated, whether or not it is
+        in the graph) followed by its neighbours, their neighbours and so on,
+        each node being yielded only once.\n"""
+        index, mine, starts = self.__index, self.__nodes, []
+        for node in nodes:
+            if node not in index:
+                yield node
+            elif index[node] not in starts:
+                starts.append(index[node])
+        for i, es in self.__reach(starts): yield mine[i]
+
     # sub-Graph()s: span(), chop()
 
     def span(self, *nodes):
-        """Returns the sub-graph of everything reached from the given nodes.\n"""
+        """Returns the sub-graph of everything reached from the given nodes.
 
-        # collect the union of the connected components of the given nodes:
-        full = []
+        Found by breadth-first traversal of the graph, so only the nodes and
+        edges of the result are ever looked at.\n"""
+
+        index, mine = self.__index, self.__nodes
+        full, edges, extra = [], set(), []
         for node in nodes:
-            if node not in full:
-                full = full + self.peers(node)
+            if node not in index:
+                if node not in extra: extra.append(node)
+            elif index[node] not in full: full.append(index[node])
 
-        # build a graph out of them:
-        ans = Graph(*full)
-        for a, b in self.__edges:
-            assert (a in full) == (b in full), 'I thought we had a partition here !'
-            if a in full: ans.join(a, b)
+        reached = []
+        for i, es in self.__reach(full):
+            reached.append(mine[i])
+            edges.update(es)
 
-        # return that graph:
-        return ans
+        return self.__sub(reached + extra, edges)
 
     def chop(self, *nodes):
         """Returns a restriction sub-graph containing only the given nodes.
 
         Includes each edge of self whose ends are both in the restriction.  In
         particular, doesn't include linkage via nodes omitted (see .span() for
-        that).\n"""
-
-        # build a graph using only the given nodes:
-        ans = Graph(*nodes)
-        for a, b in self.__edges:
-            if a in nodes and b in nodes: ans.join(a, b)
-
-        # return that graph:
-        return ans
+        that).  Only the edges at the given nodes are examined.\n"""
+
+        index = self.__index
+        keep = set(index[n] for n in nodes if n in index)
+        row, adj, via = self.__adjacency()
+        edges = set(via[k] for i in keep for k in xrange(row[i], row[i + 1])
+                    if adj[k] in keep)
+        return self.__sub(nodes, edges)
@@ -7,13 +7,23 @@ integral(: f(x).dx &larr;x; a &le;x&le;b :)
         &larr;n :{naturals})*(b-a)
 
 See: http://en.wikipedia.org/wiki/Method_of_exhaustion
+
+Integrator itself, however, uses adaptive Gauss-Kronrod quadrature: on each
+sub-interval, the 15-point Kronrod rule estimates the integral and its
+difference from the 7-point Gauss rule, whose nodes are among its own,
+estimates the error.  The sub-interval with the largest error is then bisected,
+until the sum of errors is small enough; infinite ranges are first mapped onto
+a finite one.  Rather than being called once per point, an integrand may
+accept a numpy array of abscissae and return the array of its values.
+
+See: http://en.wikipedia.org/wiki/Gauss-Kronrod_quadrature_formula
 See study.LICENSE for copyright and license information.
 """
 class Integrator:
     """Base class for integrators.
 
-    Provides crude trapezium rule integrator, which derived classes might wish
-    to over-ride.  More importantly, defines an API for integrators:
+    Provides an adaptive Gauss-Kronrod integrator, which derived classes might
+    wish to over-ride.  More importantly, defines an API for integrators:
         measure(func) -- integrator scaling self.integrand by func
         between(start, stop) -- integrates over an interval
         before(stop) -- as between, but with minus infinity as start
@@ -29,12 +39,14 @@ class Integrator:
     All three integrator methods take an optional argument, test, following the
     given required arguments; and an optional keyword argument, offset, after
     that.  These are used in deciding when the integral has been determined
-    accurately enough: after each iteration, the integrator calls test with the
-    change in its estimate of the integral as first argument and, as second
-    argument, the new estimate, with offset (if supplied) added to it.  If the
-    change is small enough that further refinement is a waste of time, test
-    should return true.  The integrator will then return the given estimate
-    (without offset) added to an error bar whose width is the last change.
+    accurately enough: after each iteration, the integrator calls test with its
+    estimate of the error in the integral as first argument and, as second
+    argument, its estimate of the integral, with offset (if supplied) added to
+    it.  If the error is small enough that further refinement is a waste of
+    time, test should return true.  The integrator will then return the given
+    estimate (without offset) added to an error bar whose width is the error
+    estimate.  Refinement also stops, regardless of test, once the range has
+    been split into a thousand or so sub-intervals.
 
     By default, the code is geared up to deal with values of class Quantity (see
     study.value.quantity) and, in that case, the integrators return
@@ -48,9 +60,13 @@ class Integrator:
     the absence of an offset, this last test will work poorly if the integral
     should yield zero.  Supplying an offset saves the test for an integral from
     demanding pointless precision when the result is going to be added to
-    something bigger than it, or with a large error bar.\n"""
+    something bigger than it, or with a large error bar.
 
-    def __init__(self, func, lower=None, upper=None, width=None):
+    Infinite ranges are mapped onto [0, 1) by x = bound +/- width * t / (1 - t),
+    where width is the constructor's, if given, else abs(bound); each is
+    integrated as a single range, with the same test and offset.\n"""
+
+    def __init__(self, func, lower=None, upper=None, width=None, vector=False):
         """Initialises an integrator.
 
         Required first argument is the function to be integrated.  This will be
@@ -61,17 +77,25 @@ class Integrator:
            lower -- a strict lower bound on func's domain
            upper -- a strict upper bound on func's domain
            width -- indicates scale of func's domain
+           vector -- true if func accepts arrays (default: False)
 
-        Each defaults to None, in which case it is ignored.  If both lower and
+        Each of the first three defaults to None, in which case it is ignored.  If both lower and
         upper are supplied (and not None), width should normally be None; if it
         is, in this case, it shall be inferred from lower and upper.  It is only
         needed if .beyond() or .before() is liable to be called with bound
         zero.  It should ideally be approximately the difference between highest
         and lowest inputs for which the integrand differs significantly from 0;
         e.g., if func is the density of a random variate, 5 standard deviations
-        would be prudent.\n"""
+        would be prudent.
+
+        If vector is true and numpy is available, func shall be called with a
+        numpy array of (float) abscissae and should return the array of its
+        values at them; each step of refinement then evaluates it at all the
+        new points in one call, so that numpy does the arithmetic.  Otherwise,
+        func is called on one input at a time.\n"""
 
         self.__integrand = func
+        self.__vector = _numpy() if vector else None
         if lower is not None:
             if upper is not None: assert upper > lower
             self.__lo = lower
@@ -79,19 +103,28 @@ class Integrator:
         if width is not None: self.__unit = abs(width) * 1.
 
     def integrand(self, val):
+        np = self.__vector
+        if np is not None and isinstance(val, np.ndarray):
+            ans = self.__integrand(val)
+            try: ans = np.where(val < self.__lo, 0 * ans, ans)
+            except AttributeError: pass
+            try: ans = np.where(val > self.__hi, 0 * ans, ans)
+            except AttributeError: pass
+            return ans
+
         lo, hi = self.__span(val, val)
         if lo is not val or hi is not val: scale = 0 # clipped
         else: scale = 1
         return self.__integrand(val) * scale
 
     @staticmethod
-    def _integrator_(func, lower=None, upper=None, width=None):
+    def _integrator_(func, lower=None, upper=None, width=None, vector=False):
         """Indirection for instantiating derived integrators.
 
         Takes the same parameters as Integrator.  Derived classes should
         over-ride this method if they want measure() to return something other
-        than a plain Integrator.\n"""
-        return Integrator(func, lower, upper, width)
+        than a plain Integrator; measure() only passes vector when true.\n"""
+        return Integrator(func, lower, upper, width, vector)
 
     def measure(self, func, lower=None, upper=None, width=None):
         """New integrator scaling self.integrand pointwise by a given function.
@@ -103,6 +136,9 @@ class Integrator:
         the intersection of the implied range with that of self is used to infer
         bounds.
 
+        If self was constructed with vector true, func must likewise accept
+        arrays; the Integrator returned then calls it with them.
+
         Returns an Integrator whose integrand is (: func(x) * self.integrand(x)
         &larr;x :) which can be construed as integrating func using self as
         measure; or as integrating self using func as measure.  If self is a
@@ -116,8 +152,10 @@ class Integrator:
         except AttributeError: pass # no helpful hints on anything !
         else:
             if width is None: width = wide
-        return self._integrator_(lambda x, f=func, i=self.integrand: f(x) * i(x),
-                                 lower, upper, width)
+        func = lambda x, f=func, i=self.integrand: f(x) * i(x)
+        if self.__vector is None:
+            return self._integrator_(func, lower, upper, width)
+        return self._integrator_(func, lower, upper, width, vector=True)
 
     def total(self, cut=None, test=None, offset=None):
         """Total integral, from minus infinity to plus infinity.
@@ -174,7 +212,7 @@ class Integrator:
 
         lo, hi, wide = self.__clip(None, stop)
         assert hi is not None
-        if lo is None: return -self.__outwards(lo, -wide, test, offset)
+        if lo is None: return self.__outwards(hi, -wide, test, offset)
         return self.__interval(lo, hi, wide, test, offset)
 
     def beyond(self, start, test=None, offset=None):
@@ -224,53 +262,164 @@ class Integrator:
         return microclose
     del bywidth
 
-    def __interval(self, lo, hi, wide, test, offset):
-        return self.__between(lo, wide,
-                              (self.integrand(lo) + self.integrand(hi)) * .5,
-                              test, offset)
+    # Gauss-Kronrod G7-K15 rule; nodes in [-1, 1], as offsets either side of the
+    # middle, with the middle last.  The Gauss nodes are those at odd indices
+    # (and the middle); __gauss has their weights, in the same order.
+    __nodes = (0.991455371120812639206854697526329,
+               0.949107912342758524526189684047851,
+               0.864864423359769072789712788640926,
+               0.741531185599394439863864773280788,
+               0.586087235467691130294144845693013,
+               0.405845151377397166906606412076961,
+               0.207784955007898467600689403773245, 0.)
+    __kronrod = (0.022935322010529224963732008058970,
+                 0.063092092629978553290700663189204,
+                 0.104790010322250183839876322541518,
+                 0.140653259715525918745189590510238,
+                 0.169004726639267902826583426598550,
+                 0.190350578064785409913256402421014,
+                 0.204432940075298892414161999234649,
+                 0.209482141084727828012999174891714)
+    __gauss = (0.129484966168869693270611432679082,
+               0.279705391489276667901467771423780,
+               0.381830050505118944950369775488975,
+               0.417959183673469387755102040816327)
+
+    def __rule(self, func, spans):
+        """Applies the G7-K15 rule to each of a list of intervals.
+
+        Required arguments are the function to integrate and a list of (start,
+        stop) pairs.  Returns a list of (integral, error) pairs, one per
+        interval, in which integral is the Kronrod estimate and error is the
+        absolute value of its difference from the Gauss estimate.\n"""
+        np, xs, ks, gs = self.__vector, self.__nodes, self.__kronrod, self.__gauss
+        if np is not None: return self.__rules(func, spans, np)
+
+        ans = []
+        for a, b in spans:
+            h = (b - a) * .5
+            mid = a + h
+            f = func(mid)
+            k, g = ks[-1] * f, gs[-1] * f
+            for i, x in enumerate(xs[:-1]):
+                f = func(mid - h * x) + func(mid + h * x)
+                k = k + ks[i] * f
+                if i % 2: g = g + gs[i // 2] * f
+            ans.append((k * h, abs((k - g) * h)))
+        return ans
 
-    def __between(self, start, gap, edge, test, offset,
-                  blur=__blur, gettest=__gettest):
+    def __rules(self, func, spans, np):
+        """As __rule, but calling func once, on an array of all abscissae."""
+        xs, ks, gs = self.__nodes, self.__kronrod, self.__gauss
+        nodes = np.array([-x for x in xs[:-1]] + list(xs[::-1]))
+        kron = np.array(ks[:-1] + ks[::-1])
+        gauss = np.zeros(len(kron))
+        gauss[1:7:2] = gauss[-2:-8:-2] = gs[:-1]
+        gauss[7] = gs[-1]
+
+        a, b = np.array(spans, dtype=float).T
+        h = (b - a) * .5
+        fs = np.asarray(func(((a + h)[:, None] + h[:, None] * nodes).ravel()))
+        fs = fs.reshape(len(spans), len(nodes))
+        k, g = fs.dot(kron) * h, fs.dot(gauss) * h
+        return zip(k.tolist(), abs(k - g).tolist())
 
-        now = edge * gap # first crude estimate
+    def __interval(self, lo, hi, wide, test, offset):
+        return self.__adapt(self.__integrand, lo, hi, test, offset)
+
+    def __outwards(self, bound, step, test, offset):
+        """Integrates from bound to infinity, in the direction of step.
+
+        Maps [0, 1) onto the range, via x = bound + step * t / (1 - t), with
+        dx = abs(step) * dt / (1 - t)**2; as t runs up from 0 to 1 either way,
+        before() (with negative step) gets the integral from minus infinity up
+        to bound, not its negation.
+
+        Floating point can't resolve t much closer to 1 than 2**-40 (bisecting
+        there soon yields nodes that round to 1), so the adaptive integration
+        stops at cut = 1 - 2**-40 and the rest is extrapolated: the integrals
+        over the last few halvings of distance from 1 before cut are taken to
+        continue as a geometric series, whose sum is added to the result.
+        This is exact for power-law tails; as the ratio between successive
+        halvings may still be drifting, the error is taken to be twice how
+        much the sum changes when the ratio of the two halvings before the
+        last is used instead of that of the last two.  If the integrals don't shrink
+        geometrically, no sum is added but all their sizes count as error.\n"""
+        wide = abs(step)
+        if self.__vector is None:
+            def func(t, f=self.__integrand):
+                u = 1 - t
+                return f(bound + step * t / u) * wide / (u * u)
+        else:
+            def func(t, f=self.__integrand):
+                u = 1 - t
+                return f(bound + step * t / u) * (wide / (u * u))
+
+        ts = [ 1 - 2.**-i for i in range(37, 41) ]
+        (back, b), (near, n), (last, e) = self.__rule(func, zip(ts, ts[1:]))
+        try: early, ratio = near / back, last / near
+        except ZeroDivisionError: tail = () # nothing there: nothing to add
+        else:
+            if 0 < early < 1 and 0 < ratio < 1:
+                more = last * ratio / (1 - ratio)
+                tail = (more, 2 * abs(more - last * early / (1 - early)) + e),
+            else: tail = (last * 0, abs(back) + abs(near) + abs(last)),
+        return self.__adapt(func, 0., ts[-1], test, offset, tail)
+
+    from heapq import heappush, heappop
+    def __adapt(self, func, lo, hi, test, offset, extra=(), limit=1000,
+                blur=__blur, gettest=__gettest, push=heappush, pop=heappop):
+        """Adaptive integration of func from lo to hi.
+
+        Keeps a heap of sub-intervals, worst error first, each with its
+        integral and error; bisects the worst (or, in vector mode, each of the
+        worst few, in one batch) until test is satisfied, limit sub-intervals
+        have been made or no sub-interval can be bisected further.  A
+        sub-interval too narrow to bisect can't be checked, so its whole
+        integral counts towards the error.  Optional extra is a sequence of
+        (integral, error) pairs, for parts of the range handled otherwise,
+        that are included in the result.\n"""
+        (now, err), = self.__rule(func, [(lo, hi)])
 
         # get advertised default for offset:
         if offset is None:
             try: offset = now - now.best
             except AttributeError: offset = now * 0
-
         # get advertised default test:
         if test is None: test = gettest(offset + now)
 
-        n = 1
-        while True:
-            n, was = 3 * n, now
-            h = gap / n
-            now = (sum(self.__integrand(start + i * h) for i in range(1, n)) +
-                   edge) * h
-
-            dif = now - was
-            if test(dif, now + offset): return blur(now, dif)
-
-    def __outwards(self, bound, step, test, offset,
-                   blur=__blur, gettest=__gettest):
-        small = abs(self.__integrand(bound)) / 1e3
-        while self.__probe(bound, step) < small: step = step / 7.
-        while self.__probe(bound, step) > small: step = step * 7
-        if test is None: test = gettest(small * step)
-
-        next = bound + step
-        total, bound = self.__interval(bound, next, step, test, offset), next
-        if offset is None:
-            try: offset = total - total.best
-            except AttributeError: offset = 0 * total
-
-        while True:
-            step = step * 3
-            next = bound + step
-            more = self.__interval(bound, next, step, test, total + offset)
-            total, bound = total + more, next
-            if test(more, total + offset): return blur(total, more)
+        batch = 1 if self.__vector is None else 64
+        heap, count = [(False, -err, 0, lo, hi, now, err)], 1
+        while count < limit and not heap[0][0] and not test(err, now + offset):
+            worst = [pop(heap)]
+            while (len(worst) < batch and heap and not heap[0][0]
+                   and heap[0][1] * 2 <= worst[0][1]):
+                worst.append(pop(heap))
+
+            spans = []
+            for key in worst:
+                a, b, k, e = key[3:]
+                mid = (a + b) * .5
+                if a < mid < b:
+                    now, err = now - k, err - e
+                    spans += [(a, mid), (mid, b)]
+                else: # can't split further; so can't vouch for it at all
+                    e = key[6] + abs(k)
+                    err += e - key[6]
+                    push(heap, (True, -e) + key[2:6] + (e,))
+
+            for (a, b), (k, e) in zip(spans, self.__rule(func, spans)):
+                now, err = now + k, err + e
+                push(heap, (False, -e, count, a, b, k, e))
+                count += 1
+
+        # Re-sum, to shed rounding errors accumulated in the running totals:
+        now = reduce(lambda x, y: x + y, [key[5] for key in heap] +
+                     [k for k, e in extra])
+        err = reduce(lambda x, y: x + y, [key[6] for key in heap] +
+                     [e for k, e in extra])
+        return blur(now, err)
+    del heappush, heappop
 
     del __blur, __gettest
 
@@ -308,9 +457,4 @@ class Integrator:
               'Integrator needs a width parameter for .before(0) or .beyond(0)'
         return ans
 
-    import math
-    def __probe(self, base, scale,
-                samples=[1, math.exp(1/math.pi), math.sqrt(2.0), 2, math.e, 3, math.pi]):
-        """Scale of integrand's values for inputs base + of order scale."""
-        return max(abs(self.integrand(base + x * scale)) for x in samples)
-    del math
+from study.cache.module import numpy as _numpy
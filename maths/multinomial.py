@@ -1,5 +1,17 @@
 """Multinomials - polynomials in several free variables.
 
+Each term's powers of the variables - its exponent vector - serves as key, in
+a dictionary, to the term's coefficient.  For multiplication, exponent vectors
+are packed into single integers, each variable's power in a field wide enough
+to hold the largest power of it in the product; adding packed keys then adds
+their exponent vectors, so a product of sparse multinomials costs one integer
+addition and one dictionary update per pair of terms.  Powers are computed by
+repeated squaring, remembering the squares for later use; squaring only
+computes each cross term once.  Evaluation uses Horner's scheme in each
+variable in turn, compiled (once per multinomial) into a python function
+that only uses arithmetic; so it can be called on numpy arrays of values (or
+on anything else supporting + and *) to evaluate at many points at once.
+
 c.f. polynomial, using only one free variable.
 See study.LICENSE for copyright and license information.
 """
@@ -58,58 +70,110 @@ class Multinomial (Lazy):
 
         return Multinomial(tot)
 
-    def addboks(key, cle): # tool func for __mul__
-        tot = [0] * max(len(key), len(cle))
+    @classmethod
+    def __fresh(cls, bok):
+        """Package a dictionary already in canonical form.
+
+        Skips the checking __init__ does; bok's keys must be tuples of
+        naturals, each with non-zero last entry (if any), and its values must
+        all be non-zero.\n"""
+        ans = cls.__new__(cls)
+        ans.__coefs = bok
+        return ans
+
+    @staticmethod
+    def __width(*profiles):
+        """Bits per field, to pack exponents of a product of multinomials.
+
+        Each argument is the .profile of a factor; for each variable, the
+        field must hold the sum of their highest powers of it.\n"""
+        tops = [ sum(e or 0 for e in es) for es in map(None, *profiles) ]
+        return max([1] + [ t.bit_length() for t in tops ])
+
+    @staticmethod
+    def __pack(key, width):
+        ans = 0
+        for e in reversed(key): ans = (ans << width) | e
+        return ans
+
+    @staticmethod
+    def __unpack(num, width):
+        mask, row = (1 << width) - 1, []
+        while num:
+            row.append(num & mask)
+            num >>= width
+        return tuple(row)
 
-        i = len(key)
-        while i > 0:
-            i = i - 1
-            tot[i] = key[i]
+    def __packed(self, width):
+        return [ (self.__pack(k, width), v) for k, v in self.__coefs.iteritems() ]
 
-        i = len(cle)
-        while i > 0:
-            i = i - 1
-            tot[i] = tot[i] + cle[i]
-
-        while tot and tot[-1] == 0: tot = tot[:-1]
-        return tuple(tot)
+    def __fromPacked(self, term, width):
+        unpack = self.__unpack
+        return self.__fresh(dict((unpack(k, width), v)
+                                 for k, v in term.iteritems() if v))
 
-    def __mul__(self, whom, add=addboks):
+    def __mul__(self, whom):
         term = {}
         try: bok = whom.__coefs
         except AttributeError:
             for key, val in self.__coefs.items():
                 term[key] = val * whom
-        else:
-            zero = self._zero * whom._zero
-            for key, val in self.__coefs.items():
-                for cle, lue in bok.items():
-                    tot = add(key, cle)
-                    term[tot] = term.get(tot, zero) + val * lue
+            return Multinomial(term)
 
-        return Multinomial(term)
+        if whom is self: return self.__square()
+        width = self.__width(self.profile, whom.profile)
+        zero, get = self._zero * whom._zero, term.get
+        mine, yours = self.__packed(width), whom.__packed(width)
+        if len(mine) > len(yours): mine, yours = yours, mine
+        for key, val in mine:
+            for cle, lue in yours:
+                tot = key + cle
+                term[tot] = get(tot, zero) + val * lue
+
+        return self.__fromPacked(term, width)
 
-    del addboks
     __rmul__ = __mul__
 
+    def __square(self):
+        width = self.__width(self.profile, self.profile)
+        term, zero = {}, self._zero * self._zero
+        get, mine = term.get, self.__packed(width)
+        for i, (key, val) in enumerate(mine):
+            tot = key + key
+            term[tot] = get(tot, zero) + val * val
+            val = val + val
+            for cle, lue in mine[i + 1:]:
+                tot = key + cle
+                term[tot] = get(tot, zero) + val * lue
+
+        return self.__fromPacked(term, width)
+
     def __pow__(self, n, mod=None):
-        result = 1
+        """Raise to a natural power, optionally modulo something.
+
+        Without mod, squares of self are remembered, so later powers of self
+        can reuse them.\n"""
+        if n != long(n) or n < 0: raise unNaturalPower
         if mod is None:
-            x = self
-            def step(b, x, r):
-                if b: r *= x
-                return x * x, r
+            try: squares = self.__squares
+            except AttributeError: squares = self.__squares = [ self ]
+            def step(i, r):
+                while len(squares) <= i: squares.append(squares[-1].__square())
+                return squares[i] if r is None else r * squares[i]
         else:
-            x = self % mod
-            def step(b, x, r, m=mod):
-                if b: r = (r * x) % m
-                return (x * x) % m, r
+            x = [ self % mod ]
+            def step(i, r, m=mod):
+                while len(x) <= i: x.append((x[-1] * x[-1]) % m)
+                return x[i] if r is None else (r * x[i]) % m
 
-        while n >= 1:
+        i, r = 0, None
+        while n:
             n, b = divmod(n, 2)
-            x, r = step(b, x, r)
+            if b: r = step(i, r)
+            i += 1
 
-        return result
+        if r is None: return Multinomial({(): self._zero + 1})
+        return r
 
     def __divmod__(self, whom):
         # solve self = q * whom + r with r `suitably less than (?)' whom
@@ -141,7 +205,7 @@ class Multinomial (Lazy):
         while key and key[-1] == 0: key = key[:-1]
 
         for k, v in self.__coefs.items():
-            q, s = subboks(k, key)
+            q, s = sub(k, key)
             if q is not None: bok[q] = s * v
 
         return Multinomial(bok)
@@ -151,19 +215,57 @@ class Multinomial (Lazy):
     def __call__(self, *args):
         if len(args) != len(self.profile):
             raise TypeError('Multinomial in n variables needs n values', len(self.profile))
-
-        result = self._zero
-        for key in self._powers:
-            val, i = self.__coefs[key], len(args)
-            while i > 0:
-                i = i - 1
-                try: p = key[i]
-                except IndexError: pass
-                else: val = val * args[i]**p
-
-            result = result + val
-
-        return result
+        if not self.__coefs: return self._zero
+        return self._horner(*args)
+
+    def _lazy_get__horner_(self, ig):
+        """Compiles Horner's scheme for evaluating self.
+
+        Groups terms by their power of the last variable, evaluates each group
+        (recursively, as a multinomial in the other variables) and combines
+        these by Horner's scheme in the last variable; the result is a python
+        function, taking one argument per variable, whose body is a sequence
+        of assignments of products and sums to temporary variables, with
+        self's coefficients looked up in a tuple.\n"""
+        n = len(self.profile)
+        names = [ 'x%d' % i for i in range(n) ]
+        coefs, lines, count = [], [], [0]
+
+        def power(x, e): return x if e == 1 else '%s**%d' % (x, e)
+        def emit(bok, n):
+            """Emit lines to evaluate bok in the first n variables.
+
+            Returns an expression, either a coefficient or a temporary, for
+            the value.\n"""
+            if n == 0:
+                coefs.append(bok[()])
+                return 'c[%d]' % (len(coefs) - 1)
+
+            groups = {}
+            for k, v in bok.items():
+                e, k = (k[n - 1], k[:n - 1]) if len(k) >= n else (0, k)
+                while k and k[-1] == 0: k = k[:-1]
+                groups.setdefault(e, {})[k] = v
+            if groups.keys() == [0]: return emit(groups[0], n - 1)
+
+            top = sorted(groups, reverse=True)
+            low = top[1:] + ([0] if top[-1] else [])
+            t = 't%d' % count[0]
+            count[0] += 1
+            lines.append('%s = %s' % (t, emit(groups[top[0]], n - 1)))
+            for hi, lo in zip(top, low):
+                step = '%s * %s' % (t, power(names[n - 1], hi - lo))
+                if lo in groups: step += ' + ' + emit(groups[lo], n - 1)
+                lines.append('%s = %s' % (t, step))
+            return t
+
+        value = emit(self.__coefs, n)
+        src = 'def horner(%s):\n' % ', '.join(names)
+        src += ''.join('    %s\n' % line for line in lines)
+        src += '    return %s\n' % value
+        space = { 'c': tuple(coefs) }
+        exec src in space
+        return space['horner']
 
     def __nonzero__(self): return self.rank >= 0
     def __eq__(self, whom): return (self - whom).rank < 0
@@ -182,7 +284,8 @@ class Multinomial (Lazy):
 
     def _lazy_get_profile_(self, ig, top=lambda *x: max([0] + [e for e in x if e])):
         # For each variable, the highest power of it in any term of self:
-        return tuple(map(top, *self.__coefs.keys()))
+        keys = self.__coefs.keys()
+        return tuple(map(top, *keys)) if keys else ()
     # NB: need map(), to pad short keys with None instead of zip()'s truncation;
     # top() takes out the None entries for us.
 
@@ -26,6 +26,7 @@ See study.LICENSE for copyright and license information.
 from study.cache.property import Cached, lazyprop
 from study.cache.weak import weakprop
 from study.snake.sequence import Tuple, iterable
+from study.maths.Pascal import factorial
 class Permutation (Tuple, Cached):
     """Immutable sequence type representing a permutation.
 
@@ -33,6 +34,7 @@ class Permutation (Tuple, Cached):
       .inverse -- the inverse of the permutation
       .sign -- the signature, +1 for an even permutation, -1 for an odd one
       .period -- number of times you must repeat self to get back where you started
+      .rank -- index of self in the lexicographic order all() iterates
 
     (Permutation also inherits lazy attributes .order and .sorted via Tuple; the
     former is a synonym for .inverse, the latter for range(len(self)), each
@@ -42,9 +44,16 @@ class Permutation (Tuple, Cached):
       cycle([by=1]) -- cycle self by the given number of steps
       permute(seq [, seq...]) -- a.k.a. __call__, compose permutations
 
+    Provides class methods:
+      unrank(size, index) -- the permutation of given size and .rank
+
     Provides (class method) iterators:
-      all(size) -- iterate over all permutations of range(size)
+      all(size [, start, stop]) -- iterate over all permutations of range(size)
       fixed(size, fix) -- all(size) limited to those matching fix in its non-None entries
+      rows(size [, start, stop]) -- as all(), but yields one list, re-used
+      heap(size) -- likewise, but in the order of Heap's algorithm
+      survey(size, test [, processes]) -- those all(size) that pass a test,
+                                          checked in parallel
 
     Theory
     ======
@@ -275,6 +284,49 @@ class Permutation (Tuple, Cached):
             q, i = compose(q, self), 1+i
         return i # self == self**(1+i) so self**i is an identity
 
+    @lazyprop
+    def rank(self):
+        """Index of self in the lexicographic order of permutations.
+
+        This is the number of permutations of the same length that
+        .all(len(self)) yields before self; see .unrank() for the reverse.
+        It is read off from self's Lehmer code: each entry's count of smaller
+        entries after it is a digit, in a mixed radix whose digit at i (from
+        the end, counting from 1) has weight i!.  A bit-mask of the entries
+        already seen makes each count a single popcount, so (for lengths up
+        to a machine word or so) this takes O(len(self)) time.\n"""
+        ans, seen, n = 0, 0, len(self)
+        for i, v in enumerate(self):
+            ans = ans * (n - i) + v - bin(seen & ((1 << v) - 1)).count('1')
+            seen |= 1 << v
+        return ans
+
+    @classmethod
+    def unrank(cls, size, index):
+        """The permutation of given size whose .rank is index.
+
+        Required arguments are the size of the permutation and its index in
+        lexicographic order, which must be at least zero and less than
+        factorial(size), else ValueError is raised.\n"""
+        row = cls.__unrank(size, index)
+        if row is None:
+            raise ValueError('No permutation of this size has this index',
+                             size, index)
+        return cls(row)
+
+    @staticmethod
+    def __unrank(size, index):
+        """Lehmer-decodes index, as for .unrank(); returns a list (or None).
+        """
+        if index < 0 or size < 0: return None
+        digits = []
+        for i in range(1, size + 1):
+            index, d = divmod(index, i)
+            digits.append(d)
+        if index: return None
+        values = range(size)
+        return [ values.pop(d) for d in reversed(digits) ]
+
     def cycle(self, by=1):
         return self.identity(len(self), by).permute(self)
 
@@ -338,11 +390,13 @@ class Permutation (Tuple, Cached):
     # for a rather elegant application, see queens.py's derived iterator
     @classmethod
     @iterable
-    def all(cls, size):
+    def all(cls, size, start=0, stop=None):
         """Iterator over permutations of given length.
 
-        Single required argument is the length of the permutations.
-        Illustrative usage::
+        Required argument is the length of the permutations.  Optional
+        arguments start and stop, if given, limit iteration to the
+        permutations whose .rank is at least start and less than stop, much as
+        for a slice; by default, all are yielded.  Illustrative usage::
 
             for it in study.maths.permute.Permutation.all(len(word)):
                 anagram = ''.join(it(word))
@@ -382,19 +436,36 @@ class Permutation (Tuple, Cached):
         entry.  A little thought will reveal that we should swap it with the
         smallest entry in the tail bigger than it, then reverse
         (i.e. forward-sort) the thus-amended tail.  This is the step used by
-        this iterator.\n"""
+        .rows(), on which this iterator is built.\n"""
 
-        if size < 0: raise StopIteration # Nothing to do :-)
+        for row in cls.rows(size, start, stop): yield cls(row)
+
+    @classmethod
+    def rows(cls, size, start=0, stop=None, total=factorial):
+        """Iterator over permutations, as one list re-used at each step.
+
+        Takes the same arguments as .all() and visits the same permutations,
+        in the same order, but each is yielded as the same list, modified in
+        place by the step to the next; the caller must copy it, if it is
+        needed after the next step.  This saves building a new Permutation at
+        each step, when all the caller wants is to look at each in turn.
+        Iteration starts by unranking start (see .unrank()), so a slice of the
+        whole order can be had without stepping through what precedes it.\n"""
+        if size < 0: return # Nothing to do :-)
+        if stop is None or stop > total(size): stop = total(size)
+        if start < 0: start = 0
+        if start >= stop: return
+        row = cls.__unrank(size, start)
+        count = stop - start
 
-        row = range(size)
         while True:
-            yield cls(row)
+            yield row
+            count -= 1
+            if count < 1: return
 
             i = size - 1
             while i > 0 and row[i - 1] > row[i]: i -= 1
-            if i < 1: # row is entirely in decreasing order
-                raise StopIteration # yielded all permutaitons already
-
+            # As count > 0, there is a later permutation, so i > 0
             i, j = i - 1, size - 1
             assert row[i] < row[i + 1]
 
@@ -405,10 +476,84 @@ class Permutation (Tuple, Cached):
             row[j], row[i] = row[i], row[j]
 
             # row[i+1:] is still in decreasing order: reverse it
-            i, j = 1 + i, size - 1
-            while i < j:
+            row[i + 1:] = row[:i:-1]
+
+    @staticmethod
+    def heap(size):
+        """Iterator over permutations, by Heap's algorithm.
+
+        Single argument is the length of the permutations.  As for .rows(),
+        each permutation is yielded as the same list, modified in place at
+        each step; but here each step merely swaps two entries, making this
+        the cheapest way to visit every permutation when their order doesn't
+        matter.  The order is not lexicographic; each permutation appears
+        exactly once.  Uses the iterative form of Heap's algorithm, in which
+        counts[i] tracks how many times the first i+1 entries have been
+        re-arranged, with the last of them fixed.\n"""
+        if size < 0: return
+        row, counts, i = range(size), [0] * size, 1
+        yield row
+        while i < size:
+            if counts[i] < i:
+                if i % 2: j = counts[i]
+                else: j = 0
                 row[j], row[i] = row[i], row[j]
-                i, j = 1 + i, j - 1
+                yield row
+                counts[i] += 1
+                i = 1
+            else:
+                counts[i] = 0
+                i += 1
+
+    @classmethod
+    @iterable
+    def survey(cls, size, test, processes=None, slices=None, total=factorial):
+        """Iterator over the permutations of given size that pass a test.
+
+        Required arguments:
+          size -- length of the permutations
+          test -- function that takes a permutation, as a list, and returns
+                  true if it should be yielded; it must not modify the list.
+
+        Optional arguments:
+          processes -- number of worker processes; default None uses one per
+                       CPU; 1 does all the work in this process
+          slices -- number of slices into which to divide the work; default
+                    is eight per process (with a floor of 64 permutations
+                    per slice).
+
+        Yields the same permutations, in the same order, as .all(size) would
+        yield with .filter(test) applied; but the permutations are given to
+        test via .rows(), so only those that pass are made into Permutation
+        objects, and the range of ranks is split into contiguous slices that
+        are scanned in a pool of processes.  The pool is started by fork, so
+        test may be a lambda or closure, but each worker runs its own copy of
+        it: any side-effects it has are lost.\n"""
+        if size < 0: return
+        count = total(size)
+        if slices is None:
+            if processes is None:
+                from multiprocessing import cpu_count
+                slices = 8 * cpu_count()
+            else: slices = 8 * processes
+        step = max(64, -(-count / slices))
+        tasks = [ (size, i, min(i + step, count))
+                  for i in range(0, count, step) ]
+
+        if processes == 1 or len(tasks) < 2:
+            found = (_survey(t, test) for t in tasks)
+            pool = None
+        else:
+            from multiprocessing import Pool
+            pool = Pool(processes, _prepare, (test,))
+            found = pool.imap(_survey, tasks)
+        try:
+            for rows in found:
+                for row in rows: yield cls(row)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
     # TODO: devise an alternate-order iterator which ensures each index appears
     # in each position roughly once per n steps.  Useful, e.g., for a "taking
@@ -416,7 +561,23 @@ class Permutation (Tuple, Cached):
     # c.f. http://www.chaos.org.uk/~eddy/when/2009/squalor.html
 
     # TODO: add random permutation class method
-del Cached, lazyprop, weakprop, iterable
+del Cached, lazyprop, weakprop, iterable, factorial
+
+# Worker-side state and task for Permutation.survey(); these have to be module
+# globals so that the pool's processes can find them.
+_test = None
+def _prepare(test):
+    global _test
+    _test = test
+
+def _survey((size, start, stop), test=None):
+    """Returns the permutations, with ranks in range(start, stop), that pass.
+
+    Each is returned as a tuple, for the parent process to turn into a
+    Permutation; see Permutation.survey().\n"""
+    test = test or _test
+    return [ tuple(row) for row in Permutation.rows(size, start, stop)
+             if test(row) ]
 
 def Iterator(size, P=Permutation): # backward compatibility
     """Redundant alias for Permutation.all"""
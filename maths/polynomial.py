@@ -3,6 +3,133 @@
 See study.LICENSE for copyright and license information.
 """
 from study.snake.lazy import Lazy
+
+# Tools for multiplying dense coefficient lists:
+
+from study.cache.module import numpy as _numpy
+
+def _school(a, b):
+    """Schoolbook product of two coefficient lists.
+
+    Each entry of the result is a sum of products a[i] * b[j], with i+j equal
+    to its index; sums start from their first term, not from zero.\n"""
+    ans = [None] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            p = x * y
+            if ans[i + j] is None: ans[i + j] = p
+            else: ans[i + j] += p
+    return ans
+
+def _shift(out, row, at, sign=1):
+    # Add (or, if sign < 0, subtract) row into out, starting at offset at;
+    # entries of out that are None are simply replaced.
+    for i, x in enumerate(row):
+        was = out[i + at]
+        if sign < 0: out[i + at] = -x if was is None else was - x
+        else: out[i + at] = x if was is None else was + x
+
+def _karatsuba(a, b, least=24):
+    """Product of two coefficient lists, by Karatsuba's method.
+
+    Only uses +, - and * of the entries (and never presumes their
+    multiplication commutes), so the result is exact whenever the entries'
+    arithmetic is (e.g. for study.maths.ratio.Rational entries).  Lists
+    shorter than least are multiplied by the schoolbook method.\n"""
+    n, m = len(a), len(b)
+    if min(n, m) < least: return _school(a, b)
+    h = max(n, m) // 2
+    if m <= h: # b is short: split only a
+        ans = _karatsuba(a[:h], b, least) + [None] * (n - h)
+        _shift(ans, _karatsuba(a[h:], b, least), h)
+        return ans
+    if n <= h: # likewise, split only b
+        ans = _karatsuba(a, b[:h], least) + [None] * (m - h)
+        _shift(ans, _karatsuba(a, b[h:], least), h)
+        return ans
+
+    lo, hi = _karatsuba(a[:h], b[:h], least), _karatsuba(a[h:], b[h:], least)
+    sa = list(a[:h]) + [None] * (n - 2 * h)
+    _shift(sa, a[h:], 0)
+    sb = list(b[:h]) + [None] * (m - 2 * h)
+    _shift(sb, b[h:], 0)
+    mid = _karatsuba(sa, sb, least)
+    _shift(mid, lo, 0, -1)
+    _shift(mid, hi, 0, -1)
+
+    ans = lo + [None] * (n + m - 1 - len(lo))
+    _shift(ans, mid, h)
+    _shift(ans, hi, 2 * h)
+    return ans
+
+def _kronecker(a, b):
+    """Product of two lists of int coefficients, via one long multiplication.
+
+    Each list is packed into a single long, with each coefficient in its own
+    field of bits, wide enough that no coefficient of the product can spill
+    into its neighbours; python's long multiplication (itself Karatsuba, but
+    in C) then does all the work and the product's coefficients are unpacked
+    from its answer.  Exact.\n"""
+    big = max(abs(x) for x in a) * max(abs(x) for x in b) * min(len(a), len(b))
+    bits = big.bit_length() + 2 # room for a sign bit
+    half, mask = 1 << (bits - 1), (1 << bits) - 1
+
+    def pack(row, n=0):
+        for c in reversed(row): n = (n << bits) + c
+        return n
+
+    n, ans = pack(a) * pack(b), []
+    for i in range(len(a) + len(b) - 1):
+        c = n & mask
+        if c >= half: c -= mask + 1
+        ans.append(c)
+        n = (n - c) >> bits
+    assert n == 0
+    return ans
+
+def _fft(a, b, np):
+    """Product of two lists of float or complex coefficients, using numpy's FFT.
+
+    Returns None (to let the caller fall back on the schoolbook method) if the
+    magnitudes of either's non-zero coefficients span too wide a range: the
+    FFT's rounding errors are proportional to the biggest coefficients, so
+    would swamp any terms in the product much smaller than these.  Entries of
+    the product smaller than the rounding error are returned as zero.\n"""
+    a, b = np.asarray(a), np.asarray(b)
+    eps, span = np.finfo(float).eps, []
+    for row in (a, b):
+        if row.dtype.kind not in 'fc': return None # e.g. huge longs
+        mag = np.absolute(row)
+        top = mag.max()
+        if top * eps ** .5 > mag[mag > 0].min(): return None
+        span.append(top)
+
+    size = len(a) + len(b) - 1
+    n = 1 << (size - 1).bit_length()
+    if a.dtype.kind == 'c' or b.dtype.kind == 'c':
+        ans = np.fft.ifft(np.fft.fft(a, n) * np.fft.fft(b, n))[:size]
+    else: ans = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)[:size]
+
+    ans[np.absolute(ans) < 4 * n.bit_length() * eps * span[0] * span[1]] = 0
+    return ans.tolist()
+
+def _convolve(a, b, kind=type, exact=(int, long),
+              numeric=(int, long, float, complex)):
+    """Product of two dense coefficient lists, by the best available method.
+
+    Lists of int (or long) coefficients are multiplied by _kronecker; lists of
+    plain numbers, including some float or complex, by _fft, if numpy is
+    available; anything else by _karatsuba.  Inexact coefficients that _fft
+    can't handle are multiplied by the schoolbook method, since Karatsuba's
+    subtractions would add to their rounding errors.\n"""
+    kinds = set(kind(x) for x in a).union(kind(x) for x in b)
+    if kinds.issubset(exact): return _kronecker(a, b)
+    if kinds.issubset(numeric):
+        np = _numpy()
+        ans = None if np is None else _fft(a, b, np)
+        return _school(a, b) if ans is None else ans
+    return _karatsuba(a, b)
+
 
 class invalidCoefficient (TypeError): "Invalid coefficient for polynomial"
 class unNaturalPower (TypeError):
@@ -228,13 +355,13 @@ class Polynomial (Lazy):
         anything outside this class) internal coefficients, ignoring the (also
         invisible from outside) denominator that scales them, so anything but
         this class doesn't know what it's scaling by if it does so !\n"""
-        if denom is None: denom = self.__denom
+        if denominator is None: denominator = self.__denom
         if variate is None:
             # Consult self.__dict__, to avoid inheriting from class:
             try: variate = self.__dict__['variablename']
             except KeyError: pass
 
-        return self.fromMap(self.__coefs, denom, variate)
+        return self.fromMap(self.__coefs, denominator, variate)
 
     def ifint(v): # tool for __wholes
         try: i = int(v)
@@ -529,14 +656,37 @@ class Polynomial (Lazy):
     def __sub__(self, other): return self + (- other)
     def __rsub__(self, other): return other + (- self)
 
-    def __mul__(self, other):
-        term = {}
+    def _lazy_get__dense_(self, ignored):
+        """Coefficients of all powers, from 0 to self.rank, as a tuple.
+
+        Used by multiplication; powers absent from self get self._zero as
+        coefficient.  Coefficients are raw, as for __numerator.\n"""
+        row = [ self._zero ] * (1 + self.rank)
+        for k, v in self.__coefs.iteritems(): row[k] = v
+        return tuple(row)
+
+    def __isdense(self, least):
+        # Has self at least least terms, filling a quarter of its span ?
+        return len(self.__coefs) >= max(least, (1 + self.rank) / 4.)
+
+    def __mul__(self, other, least=16, conv=_convolve):
         try: bok, den = other.__coefs, other.__denom
         except AttributeError:
             return self._polynomial_(((key, val * other)
                                       for key, val in self.__coefs.iteritems()),
                                      self.__denom)
 
+        om = self.__denom
+        if den is None: denom = om
+        elif om is None: denom = den
+        else: denom = om * den
+
+        # Long enough dense polynomials multiply faster as coefficient lists:
+        if self.__isdense(least) and other.__isdense(least):
+            return self._polynomial_(enumerate(conv(self._dense, other._dense)),
+                                     denom)
+
+        term = {}
         for key, val in self.__coefs.items():
             for cle, lue in bok.items():
                 tot, prod = key + cle, val * lue
@@ -544,11 +694,6 @@ class Polynomial (Lazy):
                 except KeyError: term[tot] = prod
                 else: term[tot] = was + prod
 
-        om = self.__denom
-        if den is None: denom = om
-        elif om is None: denom = den
-        else: denom = om * den
-
         return self.fromMap(term, denom)
 
     __rmul__ = __mul__ # abelian multiplication
@@ -654,7 +799,7 @@ class Polynomial (Lazy):
             # and, for cubics, pretty accurate:
             rough, tol = cub(*[self.__numerator(i) for i in (3, 2, 1, 0)]), 1e-9
         else:
-            rough, tol = self.Weierstrass(1e-9), 1e-7
+            rough, tol = self.roots_many((self,))[0], 1e-7
 
         # Now try to refine our rough calculation; if any of them is almost an
         # exact rational, check to see if that rational yields a factor; if so,
@@ -665,6 +810,8 @@ class Polynomial (Lazy):
             # Try to approximate v as n / d, with n and d whole:
             try: n, d = rat(v)
             except ValueError: continue # give up on this one
+            # Only worth a trial division if both parts are rational:
+            if n != complex(round(n.real), round(n.imag)): continue
             q, r = divmod(self, self.fromSeq((-n, d)))
             if r.rank < 0:
                 if d == 1: ans.append(n)
@@ -938,6 +1085,11 @@ class Polynomial (Lazy):
             result += self.__numerator(key)
         if top: result *= pow(arg, top)
 
+        return self.__unscale(result)
+
+    def __unscale(self, result):
+        """Divides a result computed from raw coefficients by self's denominator."""
+        om = self.__denom
         if om is not None:
             r = result / om
             if r * om == result: return r
@@ -945,6 +1097,55 @@ class Polynomial (Lazy):
 
         return result
 
+    def evaluate_many(self, xs, numeric=(int, long, float, complex)):
+        """Evaluate self at each of a sequence of inputs.
+
+        Single argument, xs, is a sequence of inputs, each as for calling
+        self.  Returns a list of self's values at these inputs, in the same
+        order; or, if xs is a numpy array, a numpy array of the same shape.
+
+        When numpy is available, self's coefficients are plain numbers and the
+        inputs are all float or complex (or some are, and the rest are
+        int), all inputs are evaluated at once by Horner's method, using
+        numpy's arithmetic; this is much faster than calling self on each, but
+        subject to the usual rounding of floating-point arithmetic.  Otherwise,
+        each input is evaluated by Horner's method in python, which is exact
+        for int, long and study.maths.ratio.Rational inputs and coefficients,
+        giving the same answers self(x) would.\n"""
+        row, np = self._dense, _numpy()
+        if np is not None and all(type(c) in numeric for c in row):
+            arr = np.asarray(xs)
+            if arr.dtype.kind in 'fc' or (
+                arr.dtype.kind in 'iu' and not all(isinstance(c, (int, long))
+                                                   for c in row)):
+                ans = self.__horner(arr, row, np)
+                if ans is not None:
+                    return ans if isinstance(xs, np.ndarray) else ans.tolist()
+
+        ans = []
+        for x in xs:
+            val = row[-1] if row else self._zero
+            for c in reversed(row[:-1]): val = val * x + c
+            ans.append(self.__unscale(val))
+
+        return ans
+
+    def __horner(self, arr, row, np):
+        # Returns None if row's coefficients don't fit in numpy floats.
+        try: cs = np.array(row, dtype=complex if any(
+                    isinstance(c, complex) for c in row) else float)
+        except OverflowError: return None
+        if not np.isfinite(cs).all(): return None
+
+        kind = np.result_type(cs, arr, 1.)
+        if not row: return np.zeros(arr.shape, kind)
+        ans = np.full(arr.shape, cs[-1], kind)
+        for c in cs[-2::-1]:
+            ans *= arr
+            ans += c
+        if self.__denom is not None: ans = ans / self.__denom
+        return ans
+
     # Calling one polynomial with another as input yields the composite of the two;
     # the following explores undoing that:
 
@@ -1098,7 +1299,7 @@ class Polynomial (Lazy):
 
         # Initialize r arbitrarily but reasonably diversely:
         k = (2j -.1) ** (2./self.rank)
-        r = [ k**(2 * i + 1) for k in range(self.rank) ]
+        r = [ k**(2 * i + 1) for i in range(self.rank) ]
         lead = 1. / self.__coefs[self.rank] # Scales self so leading coefficient is 1
 
         # Ensure ensible tol, initialize k so first iteration goes ahead
@@ -1131,6 +1332,78 @@ class Polynomial (Lazy):
 
         return tuple(r)
 
+    @staticmethod
+    def roots_many(polys, steps=8, tol=1e-9):
+        """Seeks the roots of each of many polynomials, all at once.
+
+        Required argument, polys, is a sequence of Polynomial objects, whose
+        coefficients must be convertible to complex.  Optional arguments:
+          steps -- maximum number of Newton-Raphson steps of refinement (8)
+          tol -- relative size of an imaginary part small enough to ignore,
+                 making a root real (1e-9)
+
+        Returns a list with, for each polynomial in polys, a tuple of its
+        roots, repeated according to multiplicity and ordered by real part.
+
+        Each polynomial's roots are the eigenvalues of its companion matrix;
+        numpy's linalg.eigvals finds these for all polynomials of each rank in
+        one call, on a stack of their companion matrices.  The resulting
+        estimates are then refined by Newton-Raphson steps, taken in lock-step
+        for all roots of all polynomials of the rank, with each root only
+        taking the steps that reduce its polynomial's value there.  Unlike
+        .roots, no attempt is made to recognise exact rational roots.  If
+        numpy is unavailable, .Weierstrass() is used instead, on a copy of
+        each polynomial with its coefficients converted to complex (as its
+        arithmetic needs, e.g. when they're Rational).\n"""
+        polys, np = list(polys), _numpy()
+        if np is None:
+            ans = [ Polynomial.fromSeq([ complex(p.__coefs.get(k, 0))
+                                         for k in range(p.rank + 1) ]
+                                       ).Weierstrass(tol)
+                    if p.rank > 0 else () for p in polys ]
+        else:
+            ans, ranks = [ () ] * len(polys), {}
+            for i, p in enumerate(polys):
+                if p.rank > 0: ranks.setdefault(p.rank, []).append(i)
+            for n, ids in ranks.items():
+                for i, rs in zip(ids, Polynomial.__roots_rank(
+                        [ polys[i] for i in ids ], n, steps, np)):
+                    ans[i] = rs
+
+        return [ tuple(sorted((r.real if abs(r.imag) <= tol * abs(r) else r
+                               for r in rs), key=lambda x: (x + 0j).real))
+                 for rs in ans ]
+
+    @staticmethod
+    def __roots_rank(polys, n, steps, np):
+        """Companion-matrix roots, polished, of polynomials all of rank n."""
+        cs = np.array([ [ p.__coefs.get(k, 0) for k in range(n, -1, -1) ]
+                        for p in polys ], dtype=complex) # highest power first
+        cs /= cs[:, :1]
+        mat = np.zeros((len(polys), n, n), complex)
+        mat[:, 0, :] = -cs[:, 1:]
+        mat[:, range(1, n), range(n - 1)] = 1
+        rs = np.linalg.eigvals(mat)
+
+        def horner(x, cs=cs):
+            val, slope = np.repeat(cs[:, :1], n, 1), np.zeros(x.shape, complex)
+            for j in range(1, n + 1):
+                slope = slope * x + val
+                val = val * x + cs[:, j:j+1]
+            return val, slope
+
+        val, slope = horner(rs)
+        for i in range(steps):
+            good = slope != 0
+            new = rs - np.where(good, val / np.where(good, slope, 1), 0)
+            nval, nslope = horner(new)
+            good &= abs(nval) < abs(val)
+            if not good.any(): break
+            rs = np.where(good, new, rs)
+            val, slope = np.where(good, nval, val), np.where(good, nslope, slope)
+
+        return rs.tolist()
+
     def _lazy_get__bigcoef_(self, ignored):
         scale, big = self.__denom, max(abs(i) for i in self.__coefs.values())
         if scale is not None: big *= 1. / scale
@@ -1140,7 +1413,8 @@ class Polynomial (Lazy):
         """Tests whether self and other are equal to within plausible rounding."""
         try: tot, den = other.__coefs, other.__denom
         except AttributeError: tot, den = {0: other}, None
-        bok, siz = self.__coefs, self.__denom
+        bok, siz = self.__coefs, self.__denom or 1
+        if den is None: den = 1
         return (set(tot) == set(bok) and
                 all(abs(me - yo) < tol * (abs(me) + abs(yo))
                     for me, yo in ((bok[k] * den, tot[k] * siz)
@@ -1350,7 +1624,7 @@ class Polynomial (Lazy):
         """Pseudo-constructor using enumerate(seq)."""
         return cls._polynomial_(enumerate(seq), denom, variate)
     @classmethod
-    def fromMap(bok, denom=None, variate=None):
+    def fromMap(cls, bok, denom=None, variate=None):
         """Pseudo-constructor using bok.iteritems()."""
         return cls._polynomial_(bok.iteritems(), denom, variate)
 
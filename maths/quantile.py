@@ -0,0 +1,269 @@
+"""Order statistics: selection, quantiles and a streaming quantile sketch.
+
+Finding the k-th smallest of n values doesn't need them all sorted: splitting
+them about a pivot and looking only in the part that holds index k takes O(n)
+time on average (Hoare's quickselect).  Introselect guards against a run of
+bad pivots by switching, once the parts stop shrinking fast enough, to the
+median of medians of five, which guarantees a pivot with at least three tenths
+of the values on each side.  Several order statistics are found at once by
+looking in each part that holds any of the wanted indices.
+
+When there are too many values to keep, a sketch can stand in for them: this
+module's is that of Karnin, Lang and Liberty (KLL).  It keeps values in a
+stack of levels, each value at level h standing for 2**h of the originals.
+When a level fills up, it is sorted and every other entry (starting at random
+with the first or second) is promoted to the next level, the rest discarded;
+capacities shrink geometrically going down from the top level, so memory
+stays bounded, and the error in the rank of any value is, with high
+probability, a small multiple of n / size for n values and capacity size at
+the top.  Sketches of separate streams can be merged.
+
+Provides:
+  select(seq, k) -- the entry that sorting seq would put at index k
+  ranks(seq, ks) -- likewise, for each index in ks
+  quantiles(seq, ps) -- values below which each fraction in ps of seq lies
+  median(seq) -- the middle entry, or the mean of the middle two
+  Sketch -- a mergeable summary of a stream, for approximate quantiles
+
+When numpy is available and the values are all plain numbers (and no key is
+given), numpy.partition does the selecting.
+
+See study.LICENSE for copyright and license information.
+"""
+
+from study.cache.module import numpy as _numpy
+
+import random
+def _pivot(row, depth, pick=random.sample):
+    """Chooses a pivot in row, a list of at least nine entries.
+
+    While depth is positive, uses the median of nine entries chosen at random;
+    after that, the median of medians of five.\n"""
+    if depth > 0: return sorted(pick(row, 9))[4]
+    meds = [ sorted(row[i:i + 5])[min(2, (len(row) - i - 1) // 2)]
+             for i in range(0, len(row), 5) ]
+    return _select(meds, [len(meds) // 2])[0]
+
+def _select(row, ks, small=16):
+    """The entries that sorting row would put at each of the indices ks.
+
+    Required arguments are a list, which is not modified, and a sorted
+    sequence of distinct valid indices into it.  Returns the list of
+    entries.\n"""
+    out, ks = {}, list(ks)
+    todo = [ (row, 0, ks, 2 * len(row).bit_length()) ]
+    while todo:
+        row, base, part, depth = todo.pop()
+        if len(row) <= small:
+            row = sorted(row)
+            for k in part: out[k] = row[k - base]
+            continue
+
+        pivot = _pivot(row, depth)
+        lo = [ x for x in row if x < pivot ]
+        hi = [ x for x in row if pivot < x ]
+        # A good split leaves at most three quarters in either part:
+        if 4 * max(len(lo), len(hi)) > 3 * len(row): depth -= 1
+        mid, top = base + len(lo), base + len(row) - len(hi)
+
+        below = [ k for k in part if k < mid ]
+        above = [ k for k in part if k >= top ]
+        for k in part:
+            if mid <= k < top: out[k] = pivot
+        if below: todo.append((lo, base, below, depth))
+        if above: todo.append((hi, top, above, depth))
+
+    return [ out[k] for k in ks ]
+
+def ranks(seq, ks, key=None):
+    """The entries that sorting seq would put at each of the indices ks.
+
+    Required arguments are an iterable, seq, of values and a sequence, ks, of
+    indices into the list of them (negative indices count from the end, as
+    usual).  Optional argument, key, is as for sorted(); when it is given,
+    values of equal key are ordered as in seq.  Returns a list of the values
+    found, one per entry in ks, in the same order.  Takes time proportional to
+    len(seq) * log(len(ks)) on average; raises IndexError if any index is out
+    of range.\n"""
+    row = list(seq)
+    n = len(row)
+    want = []
+    for k in ks:
+        if k < 0: k += n
+        if not 0 <= k < n: raise IndexError('Rank out of range', k, n)
+        want.append(k)
+    keys = sorted(set(want))
+
+    np = _numpy() if key is None else None
+    if np is not None and n > 64:
+        arr = np.asarray(row)
+        if arr.ndim == 1 and arr.dtype.kind in 'iuf':
+            got = dict(zip(keys, np.partition(arr, keys)[keys].tolist()))
+            return [ got[k] for k in want ]
+
+    if key is None: got = dict(zip(keys, _select(row, keys)))
+    else:
+        got = _select([ (key(x), i) for i, x in enumerate(row) ], keys)
+        got = dict((k, row[i]) for k, (v, i) in zip(keys, got))
+    return [ got[k] for k in want ]
+
+def select(seq, k, key=None):
+    """The entry that sorting seq would put at index k; see ranks()."""
+    return ranks(seq, (k,), key)[0]
+
+def quantiles(seq, ps):
+    """Values below which the given fractions of seq's entries lie.
+
+    Required arguments are an iterable, seq, of numbers and a sequence, ps, of
+    fractions, each between 0 and 1.  Each fraction p corresponds to position
+    p * (len(seq) - 1) in the sorted list of seq's entries; when this isn't a
+    whole number, the entries either side of it are interpolated linearly.
+    Returns a list of values, one per fraction in ps.\n"""
+    row = list(seq)
+    if not row: raise ValueError('No quantiles of an empty sequence')
+    spots = []
+    for p in ps:
+        if not 0 <= p <= 1: raise ValueError('Fraction out of range', p)
+        h = p * (len(row) - 1)
+        spots.append((int(h), h - int(h)))
+    ks = sorted(set([ i for i, f in spots ] +
+                    [ i + 1 for i, f in spots if f ]))
+    got = dict(zip(ks, ranks(row, ks)))
+    return [ got[i] + f * (got[i + 1] - got[i]) if f else got[i]
+             for i, f in spots ]
+
+def median(seq):
+    """The middle entry of seq, or the mean of the middle two.
+
+    For a sequence of even length, when the two in the middle aren't equal,
+    their mean is used.\n"""
+    row = list(seq)
+    if not row: raise IndexError('empty sequence has no median')
+    n, i = divmod(len(row), 2)
+    if i: return select(row, n)
+    i, j = ranks(row, (n - 1, n))
+    if i == j: return i
+    return 0.5 * (i + j)
+
+class Sketch (object):
+    """A mergeable summary of a stream of values, for approximate quantiles.
+
+    Construct with an optional capacity, size, for the top level (default 200)
+    and an optional seed for the random choices made when compacting a level;
+    see the module doc for how it works.  Memory use is bounded by about three
+    times size, however many values are added.  Methods:
+      add(value) -- add one value
+      extend(seq) -- add every value in an iterable
+      merge(other) -- add all the values summarised by another Sketch
+      weighted() -- sorted list of (value, weight) pairs held
+      rank(value) -- approximately how many values added are <= value
+      quantile(p), quantiles(ps) -- approximate fractiles
+
+    Attribute count is the number of values added (including by merge()); it
+    is also len(self).\n"""
+
+    def __init__(self, size=200, seed=None, rand=random.Random):
+        self.size, self.count = size, 0
+        self.__levels, self.__held = [[]], 0
+        self.__random = rand(seed)
+        self.__plan()
+
+    def __len__(self): return self.count
+
+    def __plan(self, shrink=2./3):
+        """Work out each level's capacity, and their total.
+
+        Must be called whenever a level is added, as the capacities depend on
+        depth below the top level.\n"""
+        top = len(self.__levels) - 1
+        self.__caps = [ max(2, int(self.size * shrink ** (top - h)))
+                        for h in range(top + 1) ]
+        self.__room = sum(self.__caps)
+
+    def __compact(self):
+        """Compact full levels, from the bottom up, until under budget.
+
+        Compacting lazily, only when the total held reaches the sum of the
+        levels' capacities, lets the bottom level soak up values between
+        compactions; the bounds on memory and error are unchanged.\n"""
+        levels = self.__levels
+        for h in range(len(levels)):
+            row = levels[h]
+            if len(row) >= self.__caps[h]:
+                if h + 1 == len(levels):
+                    levels.append([])
+                    self.__plan()
+                row.sort()
+                # Keep the last, if odd, so the promoted weight is exact:
+                keep = row[-1:] if len(row) % 2 else []
+                levels[h + 1].extend(row[self.__random.getrandbits(1)::2]
+                                     [:len(row) // 2])
+                levels[h] = keep
+                self.__held -= len(row) // 2
+                if self.__held < self.__room: break
+
+    def add(self, value):
+        self.__levels[0].append(value)
+        self.count += 1
+        self.__held += 1
+        if self.__held >= self.__room: self.__compact()
+
+    from itertools import islice
+    def extend(self, seq, chop=islice):
+        it = iter(seq)
+        while True:
+            row = self.__levels[0]
+            was = len(row)
+            row.extend(chop(it, max(1, self.__room - self.__held)))
+            if len(row) == was: break
+            self.count += len(row) - was
+            self.__held += len(row) - was
+            if self.__held >= self.__room: self.__compact()
+    del islice
+
+    def merge(self, other):
+        """Fold another Sketch's summary into this one.
+
+        The result summarises all values added to either; other is not
+        changed.\n"""
+        mine, yours = self.__levels, other.__levels
+        while len(mine) < len(yours): mine.append([])
+        self.__plan()
+        for row, more in zip(mine, yours): row.extend(more)
+        self.count += other.count
+        self.__held += other.__held
+        while self.__held >= self.__room: self.__compact()
+
+    def weighted(self):
+        """Sorted list of (value, weight) pairs summarising the stream.
+
+        The weights sum to .count; each is a power of two.\n"""
+        return sorted((x, 1 << h) for h, row in enumerate(self.__levels)
+                      for x in row)
+
+    def rank(self, value):
+        """Approximately how many of the values added are <= value."""
+        return sum(1 << h for h, row in enumerate(self.__levels)
+                   for x in row if not value < x)
+
+    def quantiles(self, ps):
+        """Approximate values below which each fraction in ps lies.
+
+        Each entry in ps should be between 0 and 1; for each, returns the
+        least value held for which the total weight of values held, up to and
+        including it, is at least that fraction of .count.  Raises ValueError
+        if nothing has been added.\n"""
+        pairs = self.weighted()
+        if not pairs: raise ValueError('Empty sketch has no quantiles')
+        want = sorted((p * self.count, i) for i, p in enumerate(ps))
+        out, j, seen = [ None ] * len(want), 0, pairs[0][1]
+        for w, i in want:
+            while seen < w and j + 1 < len(pairs):
+                j += 1
+                seen += pairs[j][1]
+            out[i] = pairs[j][0]
+        return out
+
+    def quantile(self, p): return self.quantiles((p,))[0]
+
+del random
@@ -14,14 +14,26 @@ half turn of the board: [2, 4, 1, 7, 0, 6, 3, 5].
 The problem naturally generalizes to other sizes than 8, although 8 is the
 natural size for a standard chess board.  This module provides a class Solution,
 which extends permute.Permutation; adding a .solve(size) iterator to iterate
-over all solutions of the given size; and adding a .unique(size) to do the same
+over all solutions of the given size; adding a .unique(size) to do the same
 but skip equivalent solutions: two solutions are deemed equivalent if some
-symmetry of the chess board maps one onto another.
+symmetry of the chess board maps one onto another; and adding a .total(size)
+to count the solutions without building them (its .count() is still tuple's,
+counting how often a value appears in a solution).
+
+Rather than filtering all permutations, the search places one queen per row,
+keeping bit-masks of the columns and of the two directions of diagonal that
+earlier queens attack; the free squares in the next row are then simply the
+bits not set in any of these.  The first two rows' placements divide the
+search into independent tasks, that are handed to a pool of processes (for
+boards of at least ten squares on a side).  Even so, this is pure python:
+counting the solutions for a board of sixteen squares on a side takes a few
+minutes of CPU time, so only finishes in seconds given many processes.
 
 See study.LICENSE for copyright and license information.
 """
 from permute import Permutation
-
+from study.snake.sequence import iterable
+
 class Solution (Permutation):
     def __repr__(self):
         try: ans = self.__repr
@@ -31,74 +43,184 @@ class Solution (Permutation):
         return ans
 
     @staticmethod
-    def __peaceful(seq):
-        i = len(seq) - 1
-        while i > 0:
-            j, n = i, seq[i]
-            while j:
-                j -= 1
-                if seq[j] - n in (j - i, i - j): # same diagonal
-                    return False
-            i -= 1
-        return True
+    def __tasks(size, half=False):
+        """Placements of queens in the first two rows, in lexical order.
+
+        If half is true, only placements with the first queen in the left half
+        of the board (including the middle column, if any) are included.\n"""
+        firsts = range((size + 1) / 2 if half else size)
+        if size < 2: return [ (c,) for c in firsts ]
+        return [ (a, b) for a in firsts for b in range(size)
+                 if abs(a - b) > 1 ]
+
+    @staticmethod
+    def __search(size, tasks, work, processes):
+        """Run tasks in a pool (unless small or processes is 1).
+
+        Returns an iterator over work's results on the tasks, in order.\n"""
+        jobs = [ (size, t) for t in tasks ]
+        if processes == 1 or size < 10:
+            return (work(j) for j in jobs), None
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        return pool.imap(work, jobs), pool
 
     @classmethod
-    def solve(cls, size):
+    @iterable
+    def solve(cls, size, processes=None):
         """Iterates over all solutions to the `n queens' problem.
 
         They are explored in lexical order.  Value yielded at each step is a
         Solution object - this is a Permutation with a custom repr() as a
-        picture.\n"""
-        return cls.all(size).filter(cls.__peaceful)
+        picture.  Optional argument processes is the number of worker
+        processes to use; default None uses one per CPU; 1 does all the work
+        in this process (as is always done for boards smaller than 10).\n"""
+        if size < 1:
+            if size == 0: yield cls(())
+            return
+        found, pool = cls.__search(size, cls.__tasks(size), _solutions,
+                                   processes)
+        try:
+            for rows in found:
+                for row in rows: yield cls(row)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
     @classmethod
-    def unique(cls, size):
-        """Like all, q.v., but skips essentially equivalent solutions.
+    @iterable
+    def unique(cls, size, processes=None):
+        """Like solve, q.v., but skips essentially equivalent solutions.
 
         Reflecting or rotating the board doesn't give an interestingly different
-        solution.\n"""
-        old = set()
-        for r in cls.solve(size):
-            if r not in old:
-                yield r
-                cls.__add_equivalents(old, r, size)
-
-    def rectangle(seen, r, flip): # tool used by __add_equivalents
-        """Record horizontal and vertical reflections, plus half-turn.
-
-        These are the symmetries of a rectangle.  Arguments are the set to which
-        to add equivalents of r, the permutation r and a function, flip, that
-        does top-bottom reflection in the same sense that reversed() does
-        left-right reflection.  Note that neither of these operations can give
-        the permutation we started with (aside from the () and (0,) trivial
-        cases), although perhaps their combination (half turn) could.\n"""
-        seen.add(r)
-        m = flip(r) # top-bottom reflection
-        assert m in ((), (0,)) or m not in seen
-        seen.add(m)
-        m = reversed(m) # left-right reflection
-        if m != r: # half-turn might have taken us back to r
-            assert m not in seen
-            seen.add(m)
-            seen.add(flip(m)) # top-bottom reflection
-            # The last's reversed() is the r we started with
+        solution.  Of each family of equivalent solutions, only the first in
+        lexical order is yielded.  Since reflecting a solution left-right
+        turns its first entry i into size-1-i, that first one always has its
+        first queen in the left half of the board; so the search is confined
+        to that half and, at each solution found, checks it against its
+        reflections and rotations (see .equivalents()), keeping it if it is
+        the least of them.\n"""
+        if size < 1:
+            if size == 0: yield cls(())
+            return
+        found, pool = cls.__search(size, cls.__tasks(size, True), _uniques,
+                                   processes)
+        try:
+            for rows in found:
+                for row in rows: yield cls(row)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    @classmethod
+    def total(cls, size, processes=None):
+        """Counts the solutions to the `n queens' problem.
+
+        Takes the same arguments as solve(), q.v.; returns the number of
+        solutions it would yield, without building any of them.  Only
+        solutions with the first queen in the left half of the board are
+        searched for, those with it in the middle column (if size is odd)
+        being counted once and the rest counted twice, as each has a mirror
+        image with the first queen in the right half.  Time grows roughly
+        five-fold with each extra square of size: size 14 takes a few seconds
+        in one process, size 16 a few minutes.\n"""
+        if size < 1: return 1 if size == 0 else 0
+        tasks = cls.__tasks(size, True)
+        found, pool = cls.__search(size, tasks, _count, processes)
+        try:
+            return sum(n if 2 * t[0] + 1 == size else 2 * n
+                       for t, n in zip(tasks, found))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
     @staticmethod
-    def __add_equivalents(seen, r, n, add=rectangle):
-        """Grind through the equivalents of r, adding them to seen.
-
-        This function looks after the diagonal reflection that, with the other
-        symmetries of a rectangle, generates the full set.\n"""
-        assert r not in seen
-        def flip(seq, m=n-1): return seq.map(lambda i, k=m: k - i)
-        add(seen, r, flip)
-        if n > 1: # trivial otherwise
-            i = r.inverse # diagonal reflection
-            if i not in seen: add(seen, i, flip)
-
-    del rectangle
-
-del Permutation
+    def equivalents(row):
+        """Returns the set of rows equivalent to row.
+
+        Single argument is a solution, as a sequence; returns a set of tuples,
+        row's images under the eight symmetries of the board, generated by
+        left-right reflection, top-bottom reflection and diagonal reflection
+        (i.e. transposition).  The set includes tuple(row).\n"""
+        n = len(row)
+        inverse = [ None ] * n
+        for i, v in enumerate(row): inverse[v] = i
+        ans = set()
+        for r in (tuple(row), tuple(inverse)):
+            flip = tuple(n - 1 - v for v in r)
+            ans.update((r, flip, r[::-1], flip[::-1]))
+        return ans
+
+del Permutation, iterable
+
+# Worker-side tasks for Solution's searches; these have to be module globals so
+# that the pool's processes can find them.
+def _board(size, head):
+    """Bit-masks of the squares attacked after placing head in the top rows.
+
+    Returns None if the queens in head attack one another; else a triple of
+    masks: of the columns occupied, and of the squares of the next row that are
+    attacked along each direction of diagonal.\n"""
+    cols = left = right = 0
+    for c in head:
+        bit = 1 << c
+        if bit & (cols | left | right): return None
+        cols, left, right = cols | bit, (left | bit) << 1, (right | bit) >> 1
+    return cols, left, right
+
+def _count((size, head)):
+    """Number of solutions that start with the placements in head.
+
+    Each placement computes the next row's free squares before recursing, so
+    dead ends and the last row cost no call.\n"""
+    full, board = (1 << size) - 1, _board(size, head)
+    if board is None: return 0
+    def place(cols, left, right, free, todo): # free non-empty, todo > 1
+        count = 0
+        while free:
+            bit = free & -free
+            free ^= bit
+            c, l, r = cols | bit, (left | bit) << 1, (right | bit) >> 1
+            ahead = ~(c | l | r) & full
+            if not ahead: continue
+            if todo == 2: count += 1
+            else: count += place(c, l, r, ahead, todo - 1)
+        return count
+
+    cols, left, right = board
+    todo, free = size - len(head), ~(cols | left | right) & full
+    if todo < 2: return 1 if todo == 0 or free else 0
+    return place(cols, left, right, free, todo)
+
+def _solutions((size, head), keep=None):
+    """Solutions, as tuples in lexical order, that start with head.
+
+    If keep is given, only those solutions for which it returns true are
+    included.\n"""
+    full, board = (1 << size) - 1, _board(size, head)
+    if board is None: return []
+    row, found = list(head), []
+    def place(cols, left, right):
+        if cols == full:
+            if keep is None or keep(row): found.append(tuple(row))
+            return
+        free = ~(cols | left | right) & full
+        while free:
+            bit = free & -free
+            free ^= bit
+            row.append(bit.bit_length() - 1)
+            place(cols | bit, (left | bit) << 1, (right | bit) >> 1)
+            row.pop()
+    place(*board)
+    return found
+
+def _uniques(task, every=Solution.equivalents):
+    """As for _solutions, but keeping only the least of each family."""
+    return _solutions(task, lambda row: tuple(row) == min(every(row)))
+
 # backwards compatibility:
 def Iterator(size=8): return Solution.solve(size)
 def Unique(size=8): return Solution.unique(size)
@@ -2,6 +2,7 @@
 
 Exports:
   Rational(n, d) -- represents the ratio n / d without rounding artefacts
+  RationalArray(ns, ds) -- many rationals, for arithmetic on all at once
   approximate(val [, tol, chatty [, assess]]) -- approximate val with a Rational
   refine(val [, best]) -- improve on an earlier approximation to val
 
@@ -29,18 +30,35 @@ def intsplitfrac(val):
 
     return res, val - res
 
-from study.cache.property import Cached, lazyprop
-
-class Rational (Cached):
-    def __init__(self, numer, denom=1):
+class Rational (object):
+    """Ratio of two numbers, normally integers, without rounding.
+
+    Constructed from a numerator and an optional denominator (default: 1),
+    either of which may itself be a Rational.  Reduction to lowest terms is
+    lazy, for integer numerator and denominator: arithmetic on small ones just
+    combines them, leaving the cost of finding their highest common factor
+    until something needs lowest terms - comparison, hashing, display,
+    rounding or asking for .numerator or .denominator.  Arithmetic whose
+    operands aren't all small integers reduces them first, so that big numbers
+    don't grow needlessly (and the types of results are as if reduction were
+    eager).  Values of other types (e.g. float) are reduced on
+    construction.\n"""
+
+    __slots__ = ('__num', '__den', '__low', 'error')
+    def __init__(self, numer, denom=1, whole=(int, long)):
         if isinstance(numer, Rational):
             numer, denom = numer.numerator, denom * numer.denominator
         if isinstance(denom, Rational):
             numer, denom = numer * denom.denominator, denom.numerator
-        self.__ratio = self.__coprime(numer, denom)
-        assert self.__ratio[1] > 0
+        if type(numer) in whole and type(denom) in whole:
+            if not denom:
+                raise ZeroDivisionError('Rational with zero denominator', numer)
+            self.__num, self.__den, self.__low = numer, denom, False
+        else:
+            self.__num, self.__den = self.__coprime(numer, denom)
+            self.__low = True
+            assert self.__den > 0
 
-    from natural import hcf
     def asint(v, isf=intsplitfrac): # tool function, not method
         try: a = isf(v)[0]
         except TypeError: pass
@@ -48,14 +66,47 @@ class Rational (Cached):
             if a == v: return a
         return v
 
+    from fractions import gcd
     @staticmethod
-    def __coprime(n, d, clean=asint, gcd=hcf):
-        n, d = clean(n), clean(d)
-        i = gcd(n, d)
+    def __coprime(n, d, clean=asint, gcd=gcd, whole=(int, long)):
+        if type(n) in whole and type(d) in whole: n, d = int(n), int(d)
+        else: n, d = clean(n), clean(d)
+        i = gcd(abs(n), abs(d))
         if i * d < 0: i = -i
         return n/i, d/i
 
-    del asint, hcf
+    del asint, gcd
+
+    def __lowest(self):
+        """Reduces self to lowest terms, if not already; returns (num, den)."""
+        if not self.__low:
+            self.__num, self.__den = self.__coprime(self.__num, self.__den)
+            self.__low = True
+        return self.__num, self.__den
+    __ratio = property(__lowest)
+
+    def __both(self, other, lim=1 << 31):
+        """Numerators and denominators of self and other, for arithmetic.
+
+        When all four are ints of modest size, so that combining them can't
+        overflow, they are returned as they stand; otherwise, self and (if
+        it's a Rational) other are reduced first.  Returns None if other is a
+        RationalArray, which does its own arithmetic.\n"""
+        num, den = self.__num, self.__den
+        if isinstance(other, Rational): p, q = other.__num, other.__den
+        else: p, q = other, 1
+        if (type(num) is type(den) is type(p) is type(q) is int and
+            -lim < num < lim and -lim < den < lim and
+            -lim < p < lim and -lim < q < lim):
+            return num, den, p, q
+
+        if isinstance(other, RationalArray): return None
+        num, den = self.__ratio
+        if isinstance(other, Rational): p, q = other.__ratio
+        return num, den, p, q
+
+    def __reduce__(self): return self.__class__, self.__ratio
+
     from continued import rationalize, real_continued
     __continue = rationalize, real_continued
     del rationalize, real_continued
@@ -100,21 +151,21 @@ class Rational (Cached):
     @property
     def numerator(self): return self.__ratio[0]
 
-    @lazyprop
+    @property
     def floor(self): # round down (towards -infinity)
         num, den = self.__ratio
         rat = int(num // den)
         assert num >= rat * den
         return rat
 
-    @lazyprop
+    @property
     def ceil(self): # round up (towards +infinity)
         num, den = self.__ratio
         rat = int(num / den)
         if num > rat * den: return rat + 1
         return rat
 
-    @lazyprop
+    @property
     def nearint(self): # round to nearest int, preferring even when ambiguous
         num, den = self.__ratio
         q = int(divmod(2 * num + den, 2 * den)[0])
@@ -124,7 +175,7 @@ class Rational (Cached):
         if q % 2 and 2 * r in (den, -den): q += cmp(r, 0)
         return q
 
-    @lazyprop
+    @property
     def truncate(self): # round towards zero
         num, den = self.__ratio
         assert den > 0
@@ -147,7 +198,7 @@ class Rational (Cached):
             val = seq[i] + val
         return val
 
-    @lazyprop
+    @property
     def real(self, ingest=continual, digest=discontinue, tol=1e-6, count=4):
         num, den = self.__ratio
         try: return float(num) / den
@@ -168,7 +219,7 @@ class Rational (Cached):
     def _rational_(cls, num, den):
         return cls(num, den)
 
-    def __nonzero__(self): return self.__ratio[0] != 0
+    def __nonzero__(self): return self.__num != 0
     def __pos__(self): return self
     def __neg__(self):
         num, den = self.__ratio
@@ -191,49 +242,49 @@ class Rational (Cached):
         return format(str(self), fmt)
 
     def __add__(self, other):
-        num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
+        terms = self.__both(other)
+        if terms is None: return NotImplemented
+        num, den, p, q = terms
         return self._rational_(num * q + p * den, den * q)
 
     __radd__ = __add__
 
     def __sub__(self, other):
-        num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
+        terms = self.__both(other)
+        if terms is None: return NotImplemented
+        num, den, p, q = terms
         return self._rational_(num * q - p * den, den * q)
 
     def __rsub__(self, other):
-        num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
+        terms = self.__both(other)
+        if terms is None: return NotImplemented
+        num, den, p, q = terms
         return self._rational_(den * p - q * num, q * den)
 
     def __mul__(self, other):
-        num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
+        terms = self.__both(other)
+        if terms is None: return NotImplemented
+        num, den, p, q = terms
         return self._rational_(num * p, den * q)
 
     __rmul__ = __mul__
 
     def __truediv__(self, other):
-        num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
+        terms = self.__both(other)
+        if terms is None: return NotImplemented
+        num, den, p, q = terms
         return self._rational_(num * q, den * p)
     __div__ = __truediv__
 
     def __rtruediv__(self, other):
-        num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
+        terms = self.__both(other)
+        if terms is None: return NotImplemented
+        num, den, p, q = terms
         return self._rational_(p * den, q * num)
     __rdiv__ = __rtruediv__
 
-    def __floordiv__(self, other): return self.__truediv(other).floor
-    def __mod__(self, other): self - self.__floordiv__(other) * other
+    def __floordiv__(self, other): return self.__truediv__(other).floor
+    def __mod__(self, other): return self - self.__floordiv__(other) * other
     def __divmod__(self, other):
         rat = self.__floordiv__(other)
         return rat, self - rat * other
@@ -246,9 +297,8 @@ class Rational (Cached):
 
     def __cmp__(self, other):
         num, den = self.__ratio
-        try: p, q = other.__ratio
-        except AttributeError: p, q = other, 1
-        assert den > 0 and q > 0, 'else sort order messed up'
+        if isinstance(other, Rational): p, q = other.__ratio
+        else: p, q = other, 1
         return cmp(num * q, den * p)
 
     def __hash__(self):
@@ -270,7 +320,208 @@ class Rational (Cached):
         elif den[-1].upper() != 'L': return num + ' / ' + den + '.'
         else: return num + ' * 1. / ' + den
 
-del Cached, lazyprop
+from fractions import gcd
+def _lowest(num, den, lim=1 << 31, gcd=gcd):
+    """Reduces parallel numerators and denominators to lowest terms.
+
+    Takes two lists, or two numpy arrays of 64-bit integers, of equal length;
+    returns a pair of the same length, with all denominators positive.  When
+    numpy is available and every entry in the result is less than lim in
+    magnitude, the result is a pair of numpy arrays; otherwise, of lists.
+    Raises ZeroDivisionError if any denominator is zero.\n"""
+    np = _numpy()
+    if getattr(np, 'gcd', None) is None: np = None # missing or too old
+    if np is not None and isinstance(num, list) and num:
+        if max(max(num), -min(num), max(den), -min(den)) < 1 << 62:
+            num, den = np.array(num, np.int64), np.array(den, np.int64)
+
+    if isinstance(num, list):
+        if 0 in den: raise ZeroDivisionError('Rational with zero denominator')
+        tops, bots = [], []
+        for n, d in zip(num, den):
+            i = gcd(abs(n), abs(d))
+            if d < 0: i = -i
+            tops.append(n / i)
+            bots.append(d / i)
+        num, den = tops, bots
+        if np is not None and num and max(max(num), -min(num), max(den)) < lim:
+            num, den = np.array(num, np.int64), np.array(den, np.int64)
+    else:
+        if not den.all(): raise ZeroDivisionError('Rational with zero denominator')
+        i = np.gcd(num, den)
+        i = np.where(den < 0, -i, i)
+        num, den = num // i, den // i
+        if len(num) and max(abs(num).max(), den.max()) >= lim:
+            num, den = num.tolist(), den.tolist()
+    return num, den
+
+def _small(row, lim=1 << 31):
+    """Whether arithmetic on row can be done in numpy without overflow.
+
+    RationalArray only holds numpy arrays when all their entries are less than
+    lim in magnitude; so products of two such entries, and sums of two such
+    products, fit in 64 bits.  Single integers must likewise be small; lists
+    never count as small.\n"""
+    if isinstance(row, list): return False
+    if isinstance(row, (int, long)): return -lim < row < lim
+    return True
+
+def _column(row, n):
+    """A list of n entries from row: a list, numpy array or single integer."""
+    if isinstance(row, list): return row
+    try: return row.tolist()
+    except AttributeError: return [ row ] * n
+
+class RationalArray (object):
+    """A sequence of rationals, held as parallel numerators and denominators.
+
+    Constructed from a sequence of integer numerators and an optional sequence,
+    of the same length, of integer denominators (default: all 1); see
+    fromValues() to construct from a sequence of Rationals and integers.
+    Entries are held in lowest terms, with positive denominators.
+
+    Arithmetic (+, -, *, / with another RationalArray of the same length, a
+    Rational or an integer; negation, abs() and integer powers) acts on all
+    entries at once.  When numpy is available and all the numerators and
+    denominators involved are small enough that the arithmetic can't overflow
+    64-bit integers, numpy does it, along with the reduction to lowest terms;
+    otherwise, python's unbounded integers are used, one entry at a time.
+    Either way, results are exact.
+
+    Indexing yields a Rational or, for a slice, a RationalArray; iterating
+    yields Rationals.  Other attributes:
+      numerators, denominators -- lists of ints, in lowest terms
+      real -- list of the entries' values as floats
+      sum() -- the total of the entries, as a Rational\n"""
+
+    __slots__ = ('__num', '__den')
+    from operator import index
+    def __init__(self, numerators, denominators=None, whole=index):
+        num = [ whole(n) for n in numerators ]
+        if denominators is None: den = [ 1 ] * len(num)
+        else: den = [ whole(d) for d in denominators ]
+        if len(num) != len(den):
+            raise ValueError('Need as many denominators as numerators',
+                             len(num), len(den))
+        self.__num, self.__den = _lowest(num, den)
+
+    @classmethod
+    def fromValues(cls, seq):
+        """Constructs from a sequence of Rationals and integers."""
+        pairs = [ (x.numerator, x.denominator) if isinstance(x, Rational)
+                  else (x, 1) for x in seq ]
+        return cls([ n for n, d in pairs ], [ d for n, d in pairs ])
+
+    @classmethod
+    def __fresh(cls, num, den):
+        ans = cls.__new__(cls)
+        ans.__num, ans.__den = num, den
+        return ans
+
+    def __reduce__(self):
+        return self.__class__, (self.numerators, self.denominators)
+
+    def __len__(self): return len(self.__num)
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.__fresh(self.__num[key], self.__den[key])
+        return Rational(int(self.__num[key]), int(self.__den[key]))
+
+    def __iter__(self):
+        for n, d in zip(self.numerators, self.denominators):
+            yield Rational(n, d)
+
+    def __repr__(self):
+        return 'RationalArray(%s, %s)' % (self.numerators, self.denominators)
+
+    @property
+    def numerators(self): return list(_column(self.__num, 0))
+    @property
+    def denominators(self): return list(_column(self.__den, 0))
+
+    @property
+    def real(self):
+        num, den = self.__num, self.__den
+        if isinstance(num, list):
+            return [ Rational(n, d).real for n, d in zip(num, den) ]
+        return (num.astype(float) / den).tolist()
+
+    def sum(self, gcd=gcd):
+        num, den = self.numerators, self.denominators
+        every = 1 # least common multiple of denominators
+        for d in set(den): every *= d / gcd(every, d)
+        return Rational(sum(n * (every / d) for n, d in zip(num, den)), every)
+
+    def __operand(self, other, whole=index):
+        """Numerators and denominators of other, for arithmetic with self.
+
+        If other is a RationalArray, its length must match self's; its
+        numerators and denominators are returned.  Otherwise, other must be a
+        Rational or an integer; its numerator and denominator are
+        returned.\n"""
+        if isinstance(other, RationalArray):
+            if len(other) != len(self):
+                raise ValueError('Mismatched lengths', len(self), len(other))
+            return other.__num, other.__den
+        if isinstance(other, Rational):
+            return whole(other.numerator), whole(other.denominator)
+        return whole(other), 1
+    del index
+
+    def __apply(self, other, func, swap=False):
+        """Combines self with other, entry by entry.
+
+        Required arguments are other (see __operand) and a function taking
+        numerator and denominator of a left operand, then those of a right
+        operand, and returning numerator and denominator of the result.  If
+        swap is true, self is the right operand; else the left.\n"""
+        ends = (self.__num, self.__den) + self.__operand(other)
+        if swap: ends = ends[2:] + ends[:2]
+        if all(_small(e) for e in ends): num, den = func(*ends)
+        else:
+            rows = [ func(*t) for t in zip(*[ _column(e, len(self))
+                                              for e in ends ]) ]
+            num, den = [ n for n, d in rows ], [ d for n, d in rows ]
+        return self.__fresh(*_lowest(num, den))
+
+    def plus(a, b, c, d): return a * d + c * b, b * d
+    def minus(a, b, c, d): return a * d - c * b, b * d
+    def times(a, b, c, d): return a * c, b * d
+    def over(a, b, c, d): return a * d, b * c
+
+    def __add__(self, other, f=plus): return self.__apply(other, f)
+    __radd__ = __add__
+    def __sub__(self, other, f=minus): return self.__apply(other, f)
+    def __rsub__(self, other, f=minus): return self.__apply(other, f, True)
+    def __mul__(self, other, f=times): return self.__apply(other, f)
+    __rmul__ = __mul__
+    def __truediv__(self, other, f=over): return self.__apply(other, f)
+    __div__ = __truediv__
+    def __rtruediv__(self, other, f=over): return self.__apply(other, f, True)
+    __rdiv__ = __rtruediv__
+    del plus, minus, times, over
+
+    def __pos__(self): return self
+    def __neg__(self):
+        num = self.__num
+        if isinstance(num, list): num = [ -n for n in num ]
+        else: num = -num
+        return self.__fresh(num, self.__den)
+
+    def __abs__(self):
+        num = self.__num
+        if isinstance(num, list): num = [ abs(n) for n in num ]
+        else: num = abs(num)
+        return self.__fresh(num, self.__den)
+
+    def __pow__(self, count):
+        num, den = self.numerators, self.denominators
+        if count < 0: num, den, count = den, num, -count
+        return self.__fresh(*_lowest([ n ** count for n in num ],
+                                     [ d ** count for d in den ]))
+
+del gcd
+
 
 # TODO: re-work the following to exploit continued.rationalize().
 prior = {}
@@ -370,3 +621,5 @@ def refine(val, best=None, old=prior, isf=intsplitfrac):
     print 'Not as good: %g error from' % gap, new
 
 del prior, intsplitfrac
+
+from study.cache.module import numpy as _numpy
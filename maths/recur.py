@@ -0,0 +1,211 @@
+"""Linear recurrences with constant coefficients, computed by doubling.
+
+A sequence k satisfying k[n+d] = c[0]*k[n] +c[1]*k[n+1] +...+c[d-1]*k[n+d-1],
+for every n, is determined by its first d entries.  Stepping along it one entry
+at a time takes n steps to reach k[n]; but k[n] = sum(r[i]*k[i] for i in
+range(d)), where r is the remainder of x**n on division by the recurrence's
+characteristic polynomial, x**d -c[d-1]*x**(d-1) -... -c[1]*x -c[0], and x**n
+can be computed by repeated squaring, in about log(n) steps.  When only k[n] %
+m is wanted, all arithmetic can be done modulo m, so that the numbers involved
+never grow much bigger than m*m.
+
+Provides:
+  Recurrence -- a linear recurrence with given coefficients and initial entries
+  lucas(n, P, Q [, mod]) -- the Lucas sequences U(P, Q) and V(P, Q) at n
+
+For order two, the doubling formulae are simple enough to write out, which
+lucas() does; Fibonacci's sequence is U(1, -1) and the Lucas numbers are V(1,
+-1).  See study.maths.Fibonacci and study.maths.Perrin for the sequences these
+serve.
+
+See study.LICENSE for copyright and license information.
+"""
+
+from study.maths.natural import Euclid
+
+def _inverse(a, mod, solve=Euclid):
+    """Multiplicative inverse of a, modulo mod (or exactly, if mod is None).
+
+    Raises ValueError if there is no such inverse.\n"""
+    if mod:
+        i, j = solve(a % mod, mod)
+        if (a * i) % mod == 1 % mod: return i % mod
+    elif a in (1, -1): return a
+    raise ValueError('Not invertible', a, mod)
+
+class Recurrence (object):
+    """A linear recurrence with constant integer coefficients.
+
+    Constructed from a sequence c of coefficients and a sequence of the same
+    number of initial entries, k[:len(c)], of the sequence k described by k[n
+    +len(c)] = sum(c[i] * k[n+i] for i in range(len(c))).  Method entry(n,
+    mod) returns k[n], or k[n] % mod if mod is given, for any integer n;
+    negative n are only supported if c[0] is invertible (modulo mod, if
+    given; else exactly, so it must be 1 or -1).
+
+    Each entry is computed from the remainder of x**n modulo the
+    characteristic polynomial, by running through the bits of n from the top:
+    each bit squares the remainder so far and, if the bit is set, multiplies
+    by x, which just shifts the remainder and subtracts one multiple of the
+    characteristic polynomial.  Squaring dominates the cost; for orders two
+    and three, it is written out in full, rather than done by loops.\n"""
+
+    def __init__(self, coefficients, initial):
+        self.__c, self.__k = tuple(coefficients), tuple(initial)
+        if not self.__c or len(self.__c) != len(self.__k):
+            raise ValueError('Need as many initial entries as coefficients',
+                             coefficients, initial)
+        try: self.__square = self.__squares[len(self.__c)](*self.__c)
+        except KeyError: pass
+
+    @staticmethod
+    def __square2(p, q):
+        # x*x = p + q*x
+        def square(row, mod):
+            a, b = row
+            b, c = 2 * a * b, b * b
+            a, b = a * a + p * c, b + q * c
+            if mod: return [a % mod, b % mod]
+            return [a, b]
+        return square
+
+    @staticmethod
+    def __square3(p, q, r):
+        # x**3 = p + q*x + r*x*x
+        def square(row, mod):
+            a, b, c = row
+            d, e = 2 * b * c, c * c
+            a, b, c = a * a, 2 * a * b, b * b + 2 * a * c
+            b, c, d = b + p * e, c + q * e, d + r * e
+            a, b, c = a + p * d, b + q * d, c + r * d
+            if mod: return [a % mod, b % mod, c % mod]
+            return [a, b, c]
+        return square
+
+    __squares = { 2: __square2.__func__, 3: __square3.__func__ }
+    del __square2, __square3
+
+    @property
+    def order(self): return len(self.__c)
+
+    def __reduce(self, row, mod):
+        """Reduces a polynomial modulo the characteristic polynomial.
+
+        Takes a list of coefficients, constant term first, which it consumes;
+        returns a list of len(.__c) coefficients.\n"""
+        c, d = self.__c, len(self.__c)
+        i = len(row)
+        while i > d:
+            i -= 1
+            top = row.pop()
+            if top:
+                i -= d
+                for a in c:
+                    row[i] += a * top
+                    i += 1
+        if mod: row = [r % mod for r in row]
+        return row
+
+    def __square(self, row, mod):
+        d = len(row)
+        out = [0] * (2 * d - 1)
+        for i, a in enumerate(row):
+            if a:
+                out[2 * i] += a * a
+                a += a
+                for j in range(i + 1, d): out[i + j] += a * row[j]
+        return self.__reduce(out, mod)
+
+    def __times(self, row, other, mod):
+        out = [0] * (len(row) + len(other) - 1)
+        for i, a in enumerate(row):
+            if a:
+                for j, b in enumerate(other): out[i + j] += a * b
+        return self.__reduce(out, mod)
+
+    def __shift(self, row, mod):
+        """Multiplies a reduced polynomial by x."""
+        top = row[-1]
+        row = [0] + row[:-1]
+        if top:
+            row = [r + a * top for r, a in zip(row, self.__c)]
+            if mod: row = [r % mod for r in row]
+        return row
+
+    def power(self, n, mod=None):
+        """The remainder of x**n modulo the characteristic polynomial.
+
+        Returns a list r of len(c) coefficients, constant term first, for
+        which k[n] = sum(r[i] * k[i] for i in range(len(c))), where c and k
+        are the recurrence's coefficients and sequence; if mod is given, each
+        r[i] is reduced modulo it.  See Recurrence's documentation for
+        negative n.\n"""
+        d = len(self.__c)
+        if d == 1: # x is c[0]
+            if n < 0: base, n = _inverse(self.__c[0], mod), -n
+            else: base = self.__c[0]
+            if mod: return [ pow(base, n, mod) ]
+            return [ base ** n ]
+
+        if n < 0:
+            # x * (x**(d-1) -c[d-1]*x**(d-2) -... -c[1]) = c[0]:
+            inv = _inverse(self.__c[0], mod)
+            base = [ -a * inv for a in self.__c[1:] ] + [ inv ]
+            if mod: base = [ b % mod for b in base ]
+            step, n = lambda r, m: self.__times(r, base, m), -n
+        else: step = self.__shift
+
+        row = [1] + [0] * (d - 1)
+        if mod: row = [ r % mod for r in row ]
+        for bit in bin(n)[2:]:
+            row = self.__square(row, mod)
+            if bit == '1': row = step(row, mod)
+        return row
+
+    def entry(self, n, mod=None):
+        """Returns k[n], or k[n] % mod if mod is given."""
+        if 0 <= n < len(self.__k): ans = self.__k[n]
+        else: ans = sum(r * k for r, k in zip(self.power(n, mod), self.__k))
+        if mod: return ans % mod
+        return ans
+
+    def __getitem__(self, n): return self.entry(n)
+
+def _lucas(n, P, Q, mod):
+    """Returns U(P, Q) at n and n+1, for natural n.
+
+    Uses U[2*k] = U[k] * (2 * U[k+1] -P * U[k]) and U[2*k+1] = U[k+1]**2 -Q *
+    U[k]**2, so needs no division (unlike doubling V, which needs to halve
+    things, which doesn't work modulo an even mod).\n"""
+    u, v = 0, 1 # U[k], U[k+1] for k = 0
+    for bit in bin(n)[2:]:
+        u, v = u * (2 * v - P * u), v * v - Q * u * u
+        if bit == '1': u, v = v, P * v - Q * u
+        if mod: u, v = u % mod, v % mod
+    return u, v
+
+def lucas(n, P, Q, mod=None):
+    """The Lucas sequences U(P, Q) and V(P, Q) at n.
+
+    Required arguments are the index, n, and the integer parameters P and Q;
+    optional argument mod, if given, is a modulus to which to reduce the
+    answers.  The sequences are defined by U[0] = 0, U[1] = 1, V[0] = 2, V[1]
+    = P and, for both, S[n+2] = P * S[n+1] -Q * S[n].  Returns the twople
+    U[n], V[n], computed in about log(n) steps.  Negative n are supported
+    when Q is invertible (modulo mod, if given; else exactly, so Q must be 1
+    or -1), via U[-n] = -U[n] / Q**n and V[-n] = V[n] / Q**n.
+
+    Fibonacci's sequence is U(1, -1) and the Lucas numbers are V(1, -1).\n"""
+    if n < 0:
+        inv = _inverse(Q, mod)
+        u, v = lucas(-n, P, Q, mod)
+        if mod: q = pow(inv, -n, mod)
+        else: q = inv ** -n
+        u, v = -u * q, v * q
+    else:
+        u, v = _lucas(n, P, Q, mod)
+        v = 2 * v - P * u
+    if mod: return u % mod, v % mod
+    return u, v
+
+del Euclid
@@ -14,6 +14,62 @@ See study.LICENSE for copyright and license information.
 import natural, permute
 from study.snake.lazy import Lazy
 
+from study.cache.module import numpy as _numpy
+
+def _primes(top=1 << 31, cache=[]):
+    """Iterates primes below top (default: 2**31), in decreasing order.
+
+    Primality is tested by Miller-Rabin with bases 2, 3, 5 and 7, which is
+    deterministic below 3215031751.  Primes found are remembered, so later
+    calls (with the same top) need not find them again.  Do not pass cache.\n"""
+    assert top <= 3215031751
+    for p in cache: yield p
+    n = cache[-1] if cache else top
+    while n > 2:
+        n -= 1
+        if n % 2 == 0: continue
+        d, s = n - 1, 0
+        while d % 2 == 0: d, s = d / 2, s + 1
+        for a in (2, 3, 5, 7):
+            if a % n == 0: continue
+            x = pow(a, d, n)
+            if x in (1, n - 1): continue
+            for i in range(s - 1):
+                x = x * x % n
+                if x == n - 1: break
+            else: break # a witnesses n composite
+        else:
+            cache.append(n)
+            yield n
+
+def _garner(residues, np):
+    """Chinese remainder theorem, applied entry-wise.
+
+    Takes a list of (p, arr) pairs, with the p distinct primes and each arr a
+    one-dimensional numpy array of int64 entries modulo its p; all arrays
+    have the same length.  Returns the list of integers, each of least
+    magnitude, congruent to each of the given arrays' matching entries
+    modulo the matching p.  Garner's algorithm builds mixed-radix digits
+    using only numpy arithmetic on int64; only the final assembly of each
+    result uses python's long integers.\n"""
+    digits = []
+    for i, (p, arr) in enumerate(residues):
+        # Find digit d with sum(digits[j] * prod(primes before j)) + d *
+        # prod(primes before i) congruent to arr, modulo p:
+        val, scale = np.zeros(arr.shape, np.int64), 1
+        for j in range(i):
+            q = residues[j][0]
+            val = (val + digits[j] * scale) % p
+            scale = scale * q % p
+        digits.append((arr - val) % p * pow(scale, p - 2, p) % p)
+
+    top, ans = 1, np.zeros(len(residues[0][1]), object)
+    for (p, arr), d in zip(residues, digits):
+        ans += d.astype(object) * top
+        top *= p
+    half = top / 2
+    return [ v - top if v > half else v for v in ans.tolist() ]
+
 class System (Lazy):
     """Analyzer for integer-valued linear systems.
 
@@ -67,7 +123,15 @@ class System (Lazy):
     integer-valued problems can perfectly readilly imply solutions involving
     rationals, so it makes sense to support the converse case. The crucial thing
     is that all arithmetic is approached from an exact integer perspective,
-    rather than using floating-point approximations.\n"""
+    rather than using floating-point approximations.
+
+    The solution is computed by fraction-free (Bareiss) Gauss-Jordan
+    elimination on rows stored sparsely, choosing pivots so as to limit
+    fill-in; for a big, dense, square system that proves regular, numpy is
+    used (when available) to solve it modulo each of enough primes and the
+    answers are combined by the Chinese remainder theorem.  Either way, the
+    rows of .available, .recipe and .kernel are scaled to have no common
+    factor and a positive first non-zero entry.\n"""
 
     def __init__(self, n, *rows):
         """Prepare to analyze an integer-valued linear system.
@@ -163,10 +227,7 @@ class System (Lazy):
     def _lazy_get_recipe_(self,    ig): return self.solution[1]
     def _lazy_get_kernel_(self,    ig): return self.solution[2]
     def _lazy_get_solution_(self,  ig):
-        self.__setup()
-        self.__upper()
-        self.__diag()
-        return self.__tidy()
+        return self.__tidy(*(self.__modular() or self.__eliminate()))
 
     def freeze(row): return tuple(tuple(r) for r in row) # local function, del'd later
 
@@ -177,9 +238,9 @@ class System (Lazy):
 
         dim, ava = self.__ca
         i, j, k, co = 0, 0, 0, []
-        while i < dim and j < len(can):
-            row = can[j]
-            if row[i]:
+        while i < dim:
+            row = can[j] if j < len(can) else ()
+            if row and row[i]:
                 j += 1
                 how[i].append(row[i])
                 f = gcd(*how[i])
@@ -305,38 +366,37 @@ class System (Lazy):
 
     # The actual analysis of the problem:
 
-    def __tidy(self, order=permute.order, shuffle=permute.permute, safe=freeze):
-        """Tidy-up after attempted diagonalization.
+    def __tidy(self, rows, degen, order=permute.order, shuffle=permute.permute,
+               safe=freeze, gcd=natural.hcf):
+        """Tidy-up after elimination.
 
-        We have .__matrix as near as we can hope for to diagonal form, albeit as
-        seen through the distorting lens of .__column; we need to extract from
-        it, and from the accompanying .__result, the information we were looking
-        for.\n"""
+        Takes a list of (matrix, recipe) pairs of dicts, mapping column index
+        to non-zero entry, one pair per row that survived elimination, and a
+        list of recipe dicts for the rows that eliminated to zero.  Each
+        recipe, as a combination of available vectors, yields its matrix, as
+        a combination of the canonical basis.  Scales each row to have no
+        common factor, making its first non-zero entry positive, converts it
+        to a tuple and sets .available, .recipe and .kernel.\n"""
 
-        avail, recip, degen = self.__matrix, self.__result, []
-        del self.__matrix, self.__result, self.__column
+        def scale(row):
+            f = gcd(*row)
+            if [v for v in row if v][0] < 0: f = -f
+            if f != 1: row = [v / f for v in row]
+            return row
 
-        # Purge any zero rows:
-        i = len(avail)
-        assert i == len(recip)
-        while i > 0:
-            i -= 1
-            # avail[i] != zero implies recip[i] != zero
-            if any(avail[i]): assert any(recip[i])
-            else:
-                if any(recip[i]): degen.append(recip[i])
-                del avail[i], recip[i]
+        dim, ava = self.__ca
+        avail, recip, indent = [], [], []
+        for mat, rec in rows:
+            row = scale([mat.get(j, 0) for j in range(dim)] +
+                        [rec.get(j, 0) for j in range(ava)])
+            avail.append(row[:dim])
+            recip.append(row[dim:])
+            indent.append(min(mat))
 
-        self.kernel = safe(degen)
+        self.kernel = safe(scale([rec.get(j, 0) for j in range(ava)])
+                           for rec in degen)
 
         # Order rows by increasing length of initial sequence of zeros:
-        indent, i = [], 0
-        while i < len(avail):
-            j, row = 0, avail[i]
-            while not row[j]: j += 1 # we know row has at least one non-zero entry.
-            indent.append(j)
-            i += 1
-
         perm = order(indent)
         assert len(avail) == len(perm) == len(recip)
         self.available = safe(shuffle(avail, perm))
@@ -346,144 +406,136 @@ class System (Lazy):
 
     del freeze
 
-    def scaling(row):
-        nul, ans, i = ( 0, ) * len(row), [], 0
-        while i < len(row):
-            it = list(nul)
-            it[i] = row[i]
-            ans.append(it)
-            i += 1
-
-        return ans
-
-    def __setup(self, diag=scaling):
-        """Prepare for analysis of our linear system.
-
-        Uses .problem's denominators as diagonal entries for (otherwise zero)
-        .__result and the rest of .problem as .__matrix; sets up __column as the
-        identity permutation.
-
-        When computation is trying to make it be upper triangular and, later,
-        diagonal, .__matrix only appears so (in so far as we succeed) when
-        viewed via the permutation of its columns encoded in .__column; this
-        view of .__matrix is what .__entry() implements.
-
-        If we multiply .__matrix on its right by a column whose entries are the
-        members of our canonical basis, the result is a column of vectors.  If
-        we multiply .__result on its right by a column whose entries are our
-        initial available vectors, we get the same column of vectors.  This
-        column is initially just the available vectors, scaled if necessary to
-        have integer components.  Note that it is this column of vectors that is
-        permuted by .__swap(), not the basis or availables.\n"""
-
-        self.__matrix = [list(r[:-1]) for r in self.problem]
-        self.__result = diag([r[-1] for r in self.problem])
-        self.__column = range(self.__ca[0])
+    def __eliminate(self):
+        """Fraction-free Gauss-Jordan elimination on sparse rows.
+
+        Each row of the augmented matrix - the integer part of a row of
+        .problem, alongside a recipe that initially just has that row's
+        denominator in that row's own position - is held as a pair of dicts
+        mapping column index to (non-zero) entry.  Each step picks a pivot,
+        by Markowitz's criterion restricted to the live (not yet used as
+        pivot) row with fewest entries: the entry of that row whose column
+        has fewest other entries, preferring small entries among these, so as
+        to limit fill-in.  Every other row with an entry in the pivot's column
+        is then combined with the pivot row to clear that entry.
+
+        Combinations follow Bareiss: each replaces a row by the pivot times
+        it, minus its entry in the pivot column times the pivot row, all
+        divided exactly by the prior pivot, so that entries stay integers
+        (each is a minor of the augmented matrix) without needing any gcd.
+        Rows not involved in a step would, in Bareiss's scheme, be scaled by
+        the ratio of new to prior pivot; instead, each row remembers the
+        pivot as of when it was last updated, and catches up only when next
+        used.
+
+        Returns as .__tidy() wants its arguments.\n"""
 
-    del scaling
-
-    def __entry(self, i, j): return self.__matrix[i][self.__column[j]]
-
-    def __diag(self):
-        """Reduce .__matrix from upper triangular form to diagonal form."""
-
-        i, ava = self.__ca
-        if i > ava: i = ava
-        while i > 0:
-            i -= 1
-            num = self.__entry(i, i)
-            if not num: continue # can't change anything usefully
-
-            j = ava
-            while j > 0:
-                j -= 1
-                if j == i: continue # leave that row itself alone !
-
-                n = self.__entry(j, i)
-                if n:
-                    assert j > self.__ca[0] or j < i, ('expected zeros', i)
-                    self.__take(i, n, j, num)
-
-    def __upper(self):
-        """Reduce .__matrix to upper triangular form."""
         dim, ava = self.__ca
-        if dim > ava: dim = ava
-        i = 0
-        while i < dim:
-            self.__select(i)
-            key = self.__entry(i, i)
-            if not key:
-                break # Remainder of .__matrix is zero, so upper triangular already
-
-            # Use .__matrix[i] to clear .__entry(j, i) for all j > i:
-            j = i + 1
-            while j < ava:
-                q = self.__entry(j, i)
-                if q: # else: nothing to do
-                    self.__take(i, q, j, key)
-                    assert not self.__entry(j, i), ('Bad arithmetic', i, self.__entry(j, i))
-
-                j += 1
-            i += 1
-
-    # TODO: study choices for peak; natural.lcm, number of non-zero entries ...
-    def __select(self, i, peak=lambda rs: max(abs(r) for r in rs)):
-        """Find a good candidate for self.__entry(i, i).
-
-        This prefers a row with low, but non-zero, peak entry; and selects a
-        smallest non-zero entry in this row to be the nominal i-th entry on the
-        diagonal of __matrix.\n"""
+        mats, recs, since, where = [], [], [1] * ava, {}
+        for i, r in enumerate(self.problem):
+            mat = dict((j, v) for j, v in enumerate(r[:-1]) if v)
+            for j in mat: where.setdefault(j, set()).add(i)
+            mats.append(mat)
+            recs.append({i: r[-1]})
+
+        live, rows, det = set(range(ava)), [], 1
+        while True:
+            k = [ i for i in live if mats[i] ]
+            if not k: break
+            k = min(k, key=lambda i: (len(mats[i]), i))
+            mat, rec, s = mats[k], recs[k], since[k]
+            c = min(mat, key=lambda j: (len(where[j]), abs(mat[j]), j))
+            live.discard(k)
+            rows.append(k)
+            if s != det: # catch up
+                mat = mats[k] = dict((j, v * det / s) for j, v in mat.items())
+                rec = recs[k] = dict((j, v * det / s) for j, v in rec.items())
+            key = mat[c]
+
+            for i in where[c]:
+                if i == k: continue
+                s, a = since[i], mats[i][c]
+                for seq, top in ((mats, mat), (recs, rec)):
+                    row = dict((j, v * key) for j, v in seq[i].iteritems())
+                    for j, v in top.iteritems(): row[j] = row.get(j, 0) - a * v
+                    seq[i] = dict((j, v / s) for j, v in row.iteritems() if v)
+
+                for j in mats[i]: where[j].add(i)
+                since[i] = key
+
+            for j in mat:
+                where[j] = set(i for i in where[j] if j in mats[i])
+            since[k], det = key, key
+
+        return [ (mats[i], recs[i]) for i in rows ], [ recs[i] for i in live ]
+
+    def __modular(self, least=24, np=None):
+        """Multi-modular solution of a big, dense, square, regular system.
+
+        For such a system, the solution is unique: each available row is a
+        multiple of a canonical basis vector and its recipe is the matching
+        row of the inverse of .problem, suitably scaled.  We compute the
+        determinant and adjugate of the integer part of .problem modulo each
+        of enough primes (using numpy), combine these by the Chinese
+        remainder theorem and scale the adjugate by .problem's denominators.
+        Returns None if the system is too small, too sparse or apparently
+        singular, or if numpy isn't available; else, returns as .__tidy()
+        wants its arguments.\n"""
 
         dim, ava = self.__ca
-
-        # Find row with smallest peak, swap it into row i:
-        j, k, m = i+1, i, peak(self.__matrix[i])
-        while j < ava and m != 1:
-            n = peak(self.__matrix[j])
-            if n and (not m or n < m):
-                k, m = j, n
-            j += 1
-
-        if not m: return # all remaining entries are zero !
-        if k != i: self.__swap(i, k)
-
-        # Find smallest non-zero entry in row, swap it into virtual column i
-        j, k, m = i+1, i, abs(self.__entry(i, i))
-        while j < dim and m != 1:
-            n = abs(self.__entry(i, j))
-            if n and (not m or n < m):
-                k, m = j, n
-            j += 1
-
-        assert m, 'How did we find a non-zero lcm of this row, to like ?'
-        if k != i:
-            col = self.__column
-            col[k], col[i] = col[i], col[k]
-
-    def __swap(self, i, j):
-        """Swap rows i and j of the system."""
-        for seq in self.__matrix, self.__result:
-            seq[i], seq[j] = seq[j], seq[i]
-
-    def __take(self, i, ni, j, nj, gcd=natural.hcf):
-        """Replace row j of system by a linear combination with row i."""
-
-        for seq in self.__matrix, self.__result:
-            top, row = seq[i], seq[j]
-            k = len(row)
-            while k > 0:
-                k -= 1
-                row[k] = row[k] * nj - top[k] * ni
-
-        f = gcd(* self.__matrix[j] + self.__result[j])
-        r = [i for i in self.__matrix[j] if i]
-        if r and r[0] < 0: f = -f
-        if f > 1 or f < 0:
-            mat, row = self.__matrix[j], self.__result[j]
-            k = len(row)
-            while k > 0:
-                k -= 1
-                row[k] /= f
-                mat[k] /= f
+        if dim != ava or dim < least: return None
+        mat = [ r[:-1] for r in self.problem ]
+        if 2 * sum(1 for r in mat for v in r if v) < dim * dim: return None
+        if np is None: np = _numpy()
+        if np is None: return None
+
+        # Hadamard's bound on the determinant bounds all minors, too:
+        bits = 2 + sum((sum(v * v for v in r).bit_length() + 1) // 2
+                       for r in mat)
+        got, misses, primes = [], 0, _primes()
+        while sum(p.bit_length() - 1 for p, d, a in got) < bits:
+            p = primes.next()
+            here = self.__adjugate(mat, p, np)
+            if here is not None: got.append((p,) + here)
+            elif not got: # p may merely be a factor of the determinant
+                misses += 1
+                if misses > 2: return None # but is probably zero
+
+        det = _garner([ (p, np.array([d])) for p, d, a in got ], np)[0]
+        adj = _garner([ (p, a.ravel()) for p, d, a in got ], np)
+        dens = [ r[-1] for r in self.problem ]
+        return [ ({i: det}, dict((j, v * dens[j]) for j, v in
+                                 enumerate(adj[i * dim : (i + 1) * dim]) if v))
+                 for i in range(dim) ], []
+
+    @staticmethod
+    def __adjugate(mat, p, np):
+        """Determinant and adjugate of mat modulo prime p, or None if singular.
+        """
+        n = len(mat)
+        try: aug = np.array(mat, dtype=np.int64) % p
+        except OverflowError:
+            aug = np.array([ [ v % p for v in r ] for r in mat ], dtype=np.int64)
+        aug = np.hstack((aug, np.identity(n, dtype=np.int64)))
+        det = 1
+        for k in range(n):
+            nz = np.flatnonzero(aug[k:, k])
+            if not len(nz): return None
+            r = k + nz[0]
+            if r != k:
+                aug[[k, r]] = aug[[r, k]]
+                det = -det
+            key = int(aug[k, k])
+            det = det * key % p
+            # Earlier columns are already cleared, so only work on the rest:
+            rest = aug[:, k:]
+            rest[k] = rest[k] * pow(key, p - 2, p) % p
+            col = rest[:, 0].copy()
+            col[k] = 0
+            # Entries and products are below 2**62, so don't overflow int64:
+            rest -= np.outer(col, rest[k])
+            rest %= p
+
+        return det, aug[:, n:] * det % p
 
 del Lazy, permute, natural
@@ -1,9 +1,160 @@
 """Solving an equation in one dimension.
 
+Provides:
+  bracket -- widen an interval until a function changes sign across it
+  solve -- find a root of a function, given an interval bracketing it
+  solve_many -- solve many such equations at once, in lock-step
+  Search -- searching for roots of a real function, by assorted means
+
+Both solve() and solve_many() use Chandrupatla's method, which (like Brent's)
+keeps a bracket round the root, shrinking it each step by inverse quadratic
+interpolation where that can be trusted and by bisection otherwise; so it is
+guaranteed to converge, yet usually does so about as fast as the secant
+method.  Its choice between the two is a simple test on the last three points,
+which makes it easy to apply, element-wise, to numpy arrays: solve_many() uses
+this to solve many independent equations with a single call to the function
+per step.
+
 See search.Search for 2 dimensions (represented by complex).
 See study.LICENSE for copyright and license information.
 """
 from study.cache.property import Cached, lazyprop
+
+def bracket(func, lo, hi, grow=1.6, limit=50):
+    """Widen an interval until func changes sign across it.
+
+    Required arguments are a real function, func, and the two ends, lo and
+    hi, of an initial interval; they should differ.  Optional arguments:
+      grow -- factor by which to widen the interval each time (default 1.6)
+      limit -- maximum number of times to widen it (default 50)
+
+    Each time func has the same sign at both ends, the end at which func's
+    value is smaller (so, presumably, closer to a root) is moved away from the
+    other by grow times the interval's width.  Returns a tuple (lo, hi, flo,
+    fhi) of the ends of the interval and func's values at them; raises
+    ValueError if func still has the same sign at both ends after limit
+    widenings.\n"""
+    flo, fhi = func(lo), func(hi)
+    while (flo < 0) == (fhi < 0) and flo and fhi:
+        if limit < 1: raise ValueError('Failed to bracket a root', lo, hi)
+        limit -= 1
+        if abs(flo) < abs(fhi):
+            lo += grow * (lo - hi)
+            flo = func(lo)
+        else:
+            hi += grow * (hi - lo)
+            fhi = func(hi)
+    return lo, hi, flo, fhi
+
+def solve(func, lo, hi, xtol=2e-12, rtol=8.9e-16, limit=100, expand=50):
+    """Find a root of a real function by Chandrupatla's method.
+
+    Required arguments are the function, func, and two inputs, lo and hi, to
+    it.  Optional arguments:
+      xtol, rtol -- absolute and relative tolerance on the root
+      limit -- maximum number of steps to take (default 100)
+      expand -- maximum number of widenings (see bracket()) to take if func
+                doesn't change sign between lo and hi (default 50)
+
+    Returns an input at which func is zero or, failing that, the one of the
+    two at the ends of the final bracket, at most xtol + 2 * rtol * abs(root)
+    apart, at which abs(func) is smaller.  Raises ValueError if no bracket is
+    found.  After limit steps, gives up and returns the best found so
+    far.\n"""
+    if expand: b, a, fb, fa = bracket(func, lo, hi, limit=expand)
+    else:
+        b, a, fb, fa = lo, hi, func(lo), func(hi)
+        if (fa < 0) == (fb < 0) and fa and fb:
+            raise ValueError('No sign change in interval', lo, hi)
+    if not fb: return b
+    c, fc, t = a, fa, .5
+    while True:
+        x = a + t * (b - a)
+        fx = func(x)
+        if (fx < 0) == (fa < 0): c, fc = a, fa
+        else: c, b, fc, fb = b, a, fb, fa
+        a, fa = x, fx
+
+        if abs(fa) < abs(fb): x, fx = a, fa
+        else: x, fx = b, fb
+        tlim = (2 * rtol * abs(x) + xtol) / abs(b - c)
+        if not fx or tlim > .5 or limit < 1: return x
+        limit -= 1
+
+        xi, phi = (a - b) / (c - b), (fa - fb) / (fc - fb)
+        if phi * phi < xi and (1 - phi)**2 < 1 - xi: # inverse quadratic
+            t = (fa / (fb - fa) * fc / (fb - fc) +
+                 (c - a) / (b - a) * fa / (fc - fa) * fb / (fc - fb))
+        else: t = .5
+        t = min(1 - tlim, max(tlim, t))
+
+def solve_many(func, lo, hi, xtol=2e-12, rtol=8.9e-16, limit=100, expand=50):
+    """Solve many independent real equations in lock-step.
+
+    Takes the same arguments as solve(), save that lo and hi are sequences
+    (or numpy arrays) of equal length, and func (if numpy is available) is
+    called with a numpy array of inputs, one per equation still being solved,
+    and should return the array of its values at these; each equation uses
+    the matching entries of lo and hi.  Returns a numpy array of roots, with
+    nan for each equation for which no bracket was found.
+
+    Without numpy, simply returns a list of solve()'s results for each pair of
+    entries in lo and hi, raising ValueError if any fails to find a
+    bracket.\n"""
+    np = _numpy()
+    if np is None:
+        return [ solve(func, a, z, xtol, rtol, limit, expand)
+                 for a, z in zip(lo, hi) ]
+
+    b, a = np.array(lo, dtype=float), np.array(hi, dtype=float)
+    b, a = np.broadcast_arrays(b, a)
+    b, a = b.copy(), a.copy()
+    fb, fa = [ np.asarray(func(x), dtype=float) for x in (b, a) ]
+
+    with np.errstate(all='ignore'):
+        # Widen brackets, as bracket() does:
+        grow, count = 1.6, expand
+        while count > 0:
+            i = np.flatnonzero(((fa < 0) == (fb < 0)) & (fa != 0) & (fb != 0))
+            if not i.size: break
+            count -= 1
+            low = abs(fb[i]) < abs(fa[i])
+            b[i], a[i] = (np.where(low, b[i] + grow * (b[i] - a[i]), b[i]),
+                          np.where(low, a[i], a[i] + grow * (a[i] - b[i])))
+            fx = np.asarray(func(np.where(low, b[i], a[i])), dtype=float)
+            fb[i], fa[i] = np.where(low, fx, fb[i]), np.where(low, fa[i], fx)
+
+        found = ((fa < 0) != (fb < 0)) | (fa == 0) | (fb == 0)
+        root = np.where(fb == 0, b, np.where(found, a, np.nan))
+        live = found & (fb != 0) & (fa != 0)
+        c, fc, t = a.copy(), fa.copy(), np.full(a.shape, .5)
+
+        while limit >= 0:
+            i = np.flatnonzero(live)
+            if not i.size: break
+            limit -= 1
+            ai, bi, ci, fai, fbi, fci = a[i], b[i], c[i], fa[i], fb[i], fc[i]
+            x = ai + t[i] * (bi - ai)
+            fx = np.asarray(func(x), dtype=float)
+            same = (fx < 0) == (fai < 0)
+            ci, fci = np.where(same, ai, bi), np.where(same, fai, fbi)
+            bi, fbi = np.where(same, bi, ai), np.where(same, fbi, fai)
+            ai, fai = x, fx
+            a[i], b[i], c[i], fa[i], fb[i], fc[i] = ai, bi, ci, fai, fbi, fci
+
+            near = abs(fai) < abs(fbi)
+            x, fx = np.where(near, ai, bi), np.where(near, fai, fbi)
+            root[i] = x
+            tlim = (2 * rtol * abs(x) + xtol) / abs(bi - ci)
+            live[i] = (fx != 0) & (tlim <= .5)
+
+            xi, phi = (ai - bi) / (ci - bi), (fai - fbi) / (fci - fbi)
+            iqi = (phi * phi < xi) & ((1 - phi)**2 < 1 - xi)
+            step = (fai / (fbi - fai) * fci / (fbi - fci) +
+                    (ci - ai) / (bi - ai) * fai / (fci - fai) * fbi / (fci - fbi))
+            t[i] = np.minimum(1 - tlim, np.maximum(tlim, np.where(iqi, step, .5)))
+
+    return root
 
 class Search (Cached):
     """Searching for roots of a real function.
@@ -17,13 +168,14 @@ class Search (Cached):
         self.func(guess)
         assert self.__best[0] is not None, "Whacky goal function you've got there ..."
 
-    from study.cache.mapping import LazyFunc
+    from study.cache.mapping import LazyFunc, LeastRecent
     @staticmethod
-    def __wrap(func, notice, w=LazyFunc.wrap):
+    def __wrap(func, notice, w=LazyFunc, b=LeastRecent):
         def check(val, f=func, n=notice):
             return n(val, f(val))
-        return w(check)
-    del LazyFunc
+        # Bounded, so that long searches don't accumulate evaluations:
+        return w(check, b(256))
+    del LazyFunc, LeastRecent
 
     def __notice(self, val, ans):
         score = self.goal(ans)
@@ -38,6 +190,19 @@ class Search (Cached):
     def gradient(self, S=Single): return S(self.__func)
     del Single
 
+    def solve(self, lo=None, hi=None, xtol=2e-12, rtol=8.9e-16, limit=100,
+              expand=50, tool=solve):
+        """Find a root by bracketing; see the module function solve().
+
+        Optional arguments lo and hi are the ends of the initial interval,
+        default .best -/+ abs(.stride); the rest are as for solve(), save that
+        tool should not be passed.  Evaluations go via .func(), so are
+        remembered (up to a bound) and update .best.  Returns the root found;
+        raises ValueError if no bracket is found.\n"""
+        if lo is None: lo = self.best - abs(self.stride)
+        if hi is None: hi = self.best + abs(self.stride)
+        return tool(self.func, lo, hi, xtol, rtol, limit, expand)
+
     def __getattr__(self, key):
         if key == 'best': return self.__best[0]
         if key == 'score': return self.__best[1]
@@ -134,3 +299,5 @@ class Search (Cached):
         self.__flush(16)
 
 del Cached, lazyprop
+
+from study.cache.module import numpy as _numpy
@@ -102,49 +102,27 @@ def logrange(a, b=None, c=None):
 
     return result
 
-def median(seq, fn=None):
+from study.maths.quantile import ranks
+from functools import cmp_to_key
+def median(seq, fn=None, rank=ranks, key=cmp_to_key):
     """Find the median of a sequence.
 
     Required first argument, seq, is an iterable of values.  Optional second
     argument, fn, is a comparison function or None (the default) to use the
     built-in comparison, cmp().  Doesn't go to all the trouble of sorting (a
-    copy of) the sequence, just moves the middle element or two to the
-    middle.\n"""
+    copy of) the sequence, just selects the middle element or two (see
+    study.maths.quantile.ranks).  For even length, the two in the middle are
+    averaged, exactly when their sum is even.\n"""
     seq = list(seq) # always gets a copy; and iterate only once
     if not seq: raise IndexError, 'empty sequence has no median'
 
-    # Adapted from Wirth's "Data Structures + Algorithms = Programs"
-    def split(L, R, m, s=seq, cmp=fn or cmp):
-        """Move the m-th highest entry in seq to index m.
-
-        This actually works for any m; it requires that we know the m-th
-        highest is actually no earlier than index L and no later than
-        index R, with m lying between L and R.  In O(R-L) steps, it
-        shuffles the m-th entry to position s[m], then returns.\n"""
-
-        while L < R:
-            x, i, j = s[m], L, R
-            while True:
-                while cmp(s[i], x) < 0: i += 1
-                while cmp(s[j], x) > 0: j -= 1
-
-                if i > j: break
-                elif i < j:
-                    s[i], s[j] = s[j], s[i]
-                i += 1
-                j -= 1
-                if i > j: break
-
-            if j < m: L = i
-            if m < i: R = j
-
     mid, bit = divmod(len(seq), 2)
-    split(0, len(seq) - 1, mid)
-    if bit: return seq[mid]
-    split(0, mid, mid-1)
-    q, r = divmod(seq[mid] + seq[mid-1], 2)
-    if r: return (seq[mid] + seq[mid-1]) * .5
+    if bit: return rank(seq, (mid,), fn and key(fn))[0]
+    lo, hi = rank(seq, (mid - 1, mid), fn and key(fn))
+    q, r = divmod(hi + lo, 2)
+    if r: return (hi + lo) * .5
     return q
+del ranks, cmp_to_key
 
 def gradients(fn, arg, *deltas):
     if len(deltas) == 1 and isinstance(deltas[0], (tuple, list)):
@@ -58,6 +58,9 @@ class Vector (Tuple):
       dot(other, [n=1, out=True]) -- contract with other on self's right
       rdot(other, [n=1, out=True]) -- contract with other on self's left
 
+    Class method contract((tensor, pattern), ...) generalises tau to several
+    tensors, contracting them without forming their full product.
+
     Arithmetic operations allow the other operand to be vectors - for addition
     and subtraction, they should have the same .dimension - or sequences that
     are acceptable to the constructor.  Its indexing accepts a tuple, applying
@@ -543,7 +546,7 @@ class Vector (Tuple):
 
     def __add__(self, other):
         assert len(other) == len(self)
-        return self._add_type_()(x + y for x, y in zip(self, other))
+        return self._add_type_(type(other))(x + y for x, y in zip(self, other))
 
     __radd__ = __add__
     def __neg__(self):
@@ -551,11 +554,12 @@ class Vector (Tuple):
 
     def __sub__(self, other):
         assert len(other) == len(self)
-        return self._sub_type_()(x - y for x, y in zip(self, other))
+        return self._sub_type_(type(other))(x - y for x, y in zip(self, other))
 
     def __rsub__(self, other):
         assert len(other) == len(self)
-        return self._rsub_type_()(y - x for x, y in zip(self, other))
+        return self._rsub_type_(type(other))(
+            y - x for x, y in zip(self, other))
 
     def __mul__(self, other):
         if not (self.__isnumeric(other) or
@@ -870,25 +874,34 @@ class Vector (Tuple):
           out -- when n > 1, determines how ranks of self are matched up with
                  ranks of other; see below.
 
-        This method first computes self * other, then traces away some ranks
-        from the product.  If n is 1, the last rank from self is traced with
-        the first of out.  When n > 1, if out is true, ranks of self are
-        matched with ranks of other starting 'where they meet', with self's
-        last and other's first, and 'working outwards from there', so self's
-        last-but-one rank is contracted with others second rank, and so on,
-        until self's last-but-(n-1) rank is contracted with other's n-th
-        rank.  If out is false, self's last rank is contracted with other's
-        n-th rank; self's last-but-i rank is contracted with other's (n-i)-th
-        rank and so on, until self's last-but-(n-1) rank is contracted with
-        other's first rank.
+        The result is what you would get by computing self * other, then
+        tracing away some ranks from the product; but it is computed without
+        forming that product (see .contract()).  If n is 1, the last rank from
+        self is traced with the first of out.  When n > 1, if out is true,
+        ranks of self are matched with ranks of other starting 'where they
+        meet', with self's last and other's first, and 'working outwards from
+        there', so self's last-but-one rank is contracted with others second
+        rank, and so on, until self's last-but-(n-1) rank is contracted with
+        other's n-th rank.  If out is false, self's last rank is contracted
+        with other's n-th rank; self's last-but-i rank is contracted with
+        other's (n-i)-th rank and so on, until self's last-but-(n-1) rank is
+        contracted with other's first rank.
 
         Returns what's left of the product after all this tracing has been
         applied.\n"""
-        # TODO: can this be more efficient ?
-        # __mul__ is quite heavy-weight; can we short-cut it ?
-        # Probably yes to both: but is it worth it ?
-        # For now, at least it provides an easy way to test permutrace() ;-)
-        return (self * other).permutrace((), *self.__derange(out, n, self.rank))
+        if not isinstance(other, Vector): other = self.fromSeq(other)
+        return self.__dot(other, n, out)
+
+    def __dot(self, other, n, out):
+        r, q = self.rank, other.rank
+        if not 0 <= n <= min(r, q):
+            raise ValueError('Cannot contract that many ranks', n, r, q)
+        mine = range(r - n) + [ None ] * n
+        yours = [ None ] * n + range(r - n, r + q - 2 * n)
+        for j, i in self.__derange(out, n, r):
+            mine[j] = yours[i - r] = (j, i)
+
+        return self.__einsum(((self, mine), (other, yours)), r + q - 2 * n)
 
     @staticmethod
     def __derange(out, n, r):
@@ -913,11 +926,10 @@ class Vector (Tuple):
 
         Takes the same arguments as .dot(); the effect is exactly as if self
         and other were swapped, save that other need not actually be a Vector
-        (or Tensor) for it to work; indeed, the implementation expects that it
-        is not (so is mildly less efficient than other.dot(self) when other is
-        a Vector or Tensor).\n"""
-        prod = other * self
-        return prod.permutrace((), *self.__derange(out, n, prod.rank - self.rank))
+        (or Tensor) for it to work; it need only be acceptable to
+        .fromSeq().\n"""
+        if not isinstance(other, Vector): other = self.fromSeq(other)
+        return other.__dot(self, n, out)
 
     def tau(self, pattern):
         """Generalised trace-permutation operator.
@@ -956,35 +968,9 @@ class Vector (Tuple):
             s[pattern[a]] for each index a into pattern.
 
         The final result is not, however, computed as inefficiently as this
-        would imply.  Contrast .permutrace().\n"""
-
-        stub, pairs, bok, n = [ None ] * len(pattern), [], {}, []
-        for i, a in enumerate(pattern):
-            if isinstance(a, basestring):
-                try: j = bok[a]
-                except KeyError: bok[a] = i
-                else:
-                    bok[a] = None
-                    if j is None: raise ValueError(
-                        'Trace marker appears more than twice', a, pattern)
-                    if self.dimension[i] != self.dimension[j]:
-                        raise ValueError(
-                            'Can only trace between ranks of equal dimension',
-                            (j, i), self.dimension, a, pattern)
-                    pairs.append((j, i))
-            else:
-                stub[i] = a
-                if a+1 > len(n): n += range(len(n), a+1)
-                if n[a] is None:
-                    raise ValueError('Permutation index repeated', a, pattern)
-                assert n[a] == a
-                n[a] = None
-
-        # Check everything in n did get used up:
-        if [ a for a in n if a is not None ]:
-            raise ValueError('Incomplete permutation', tuple(n), pattern)
-
-        return self.__trace_permute(stub, pairs)
+        would imply; see .contract(), of which this is the single-tensor case.
+        Contrast .permutrace().\n"""
+        return self.contract((self, pattern))
 
     def permutrace(self, shuffle, *pairs):
         """Alternate trace-permute operation.
@@ -1037,7 +1023,7 @@ class Vector (Tuple):
                 if i not in bok: raise ValueError(
                     "Rank neither traced nor permuted", i, shuffle, pairs)
             else:
-                if n[a] is None: bad.append[a]
+                if n[a] is None: bad.append(a)
                 n[a] = None
         if bad:
             raise ValueError("Not a permutation", bad, shuffle)
@@ -1045,118 +1031,105 @@ class Vector (Tuple):
         if bad:
             raise ValueError("Incomplete permutation", bad, shuffle)
 
-        return self.__trace_permute(shuffle, pairs)
+        # Label each traced rank by its pair, each other by where it goes:
+        labels = list(shuffle) + [ None ] * (self.rank - len(shuffle))
+        for p in pairs: labels[p[0]] = labels[p[1]] = tuple(p)
+        n = len(shuffle) - len([ x for x in shuffle if x is None ])
+        for i in range(len(shuffle), self.rank):
+            if labels[i] is None: labels[i], n = n, n + 1
 
-    # Implementation of __trace_permute:
-    def __listify(self):
-        if self.rank < 2: return list(self)
-        return [ x.__listify() for x in self ]
+        return self.__einsum(((self, labels),), n)
 
     @classmethod
-    def __ranger(cls, ms):
-        """Iterator over index tuples.
-
-        Single argument, ms, is an iterator over dimensions.  Yields every
-        tuple s, of the same length as ms, for which, for every 0 <= i <
-        len(ms), 0 <= s[i] < ms[i].\n"""
-
-        try: m = ms.next()
-        except StopIteration: yield ()
-        else:
-            for s in cls.__ranger(ms):
-                i = m
-                while i > 0:
-                    i -= 1
-                    yield (i,) + s
-
-    def __summands(self, tmpl, pairs):
-        """Fill in None entries of tmpl from self's ranks given by pairs.
-
-        Iterates the indexes s into self that match tmpl's non-None entries and
-        have s[i] == s[j] for each (i, j) in pairs (given that tmple[i] and
-        tmpl[j] are both None for each (i, j) in pairs).\n"""
-        try: i, j = pairs.next()
-        except StopIteration: yield tuple(tmpl)
-        else:
-            assert tmpl[i] is None is tmpl[j]
-            assert self.dimension[i] == self.dimension[j]
-            if i > j: i, j = j, i
-            for s in self.__summands(tmpl, pairs):
-                m = self.dimension[i]
-                while m > 0:
-                    m -= 1
-                    yield s[:i] + (m,) + s[i+1:j] + (m,) + s[j+1:]
-
-    def __lookup_check(self, entry, pairs):
-        # Major over-kill: checks each entry in each rank, where entries at a
-        # given rank shall typically all be of the same kind, so if one works
-        # all shall.
-        all(self[entry[:i]]._check_contract_(self[entry[:j]]) for i, j in pairs)
-        return self[entry]
-
-    def __total(self, tmpl, pairs):
-        es, get = self.__summands(tmpl, iter(pairs)), self.__lookup_check
-        tot = get(es.next(), pairs)
-        for e in es: tot += get(e, pairs)
-        return tot
-
-    def setcell(grid, key, val): # tool function for __trace_permute
-        old = key.next()
-        for it in key: grid, old = grid[old], it
-        assert grid[old] is None
-        grid[old] = val
-
-    def __trace_permute(self, shuffle, pairs, store=setcell):
-        """Implementation of tau and permutrace, q.v.
-
-        Takes two arguments, a permutation optionally padded with None
-        entries and a sequence of pairs of indices to trace.\n"""
-
-        assert not any(x == y for x, y in pairs)
-        ns, i = [ x for x in shuffle if x is not None ], len(shuffle)
-        # Assert: ns is a permutation of range(len(ns))
-        if ns: j = max(ns) + 1
-        else: j = 0
-        assert all(n in range(j) for n in ns) and all(n in ns for n in range(j))
-
-        if pairs:
-            # Pad shuffle with None entries at every pair's indices, with
-            # entries between them extending permutation as identity:
-            ns = reduce(lambda x, y: x + y, pairs, ()) # each entry in each pair
-            n, shuffle = max(ns), list(shuffle)
-            while i <= n:
-                if i in ns: shuffle.append(None)
-                else:
-                    shuffle.append(j)
-                    j += 1
-                i += 1
-        shuffle = tuple(shuffle) # we're done modifying it
-
-        # Construct reverse-lookup for shuffle:
-        rev = [ None ] * j # map each output rank to input rank that it came from
-        while i > 0:
-            i -= 1
-            if shuffle[i] is not None:
-                assert rev[shuffle[i]] is None
-                rev[shuffle[i]] = i
-        assert None not in rev, (rev, shuffle)
+    def contract(cls, *terms):
+        """Contract several tensors with one another, einsum-style.
+
+        Each argument is a (tensor, pattern) twople; each pattern is as for
+        .tau(), except that its strings need only appear twice among all the
+        patterns (not necessarily both in the same one) and that the whole
+        numbers 0 through n-1, for some natural n, must appear once each among
+        all the patterns.  Any ranks of a tensor beyond the length of its
+        pattern are treated as if its pattern were extended with the further
+        whole numbers n, n+1 and so on, taken in turn by each tensor's surplus
+        ranks.
+
+        Returns what .tau() would return, given the product of all the
+        tensors, in the order given, and the concatenation of their (extended)
+        patterns; but without ever forming that product.  Only the entries of
+        the result are computed; when more than two tensors are given, they
+        are contracted a pair at a time, in whichever order keeps the
+        intermediate results smallest.  For example,
+          Vector.contract((a, (0, 'i')), (b, ('i', 'j')), (c, ('j', 1)))
+        is the matrix product of a, b and c.  See study.maths.contract for
+        details, including use of numpy when it's available and all entries
+        are float or complex.\n"""
+        terms = [ (t if isinstance(t, Vector) else cls.fromSeq(t), p)
+                  for t, p in terms ]
+        bok, used = {}, set()
+        for t, pattern in terms:
+            if len(pattern) > t.rank:
+                raise ValueError('Pattern longer than rank', pattern, t.rank)
+            for a in pattern:
+                if isinstance(a, basestring):
+                    if bok.get(a, 0) > 1: raise ValueError(
+                        'Trace marker appears more than twice', a, pattern)
+                    bok[a] = bok.get(a, 0) + 1
+                elif a in used:
+                    raise ValueError('Permutation index repeated', a, pattern)
+                else: used.add(a)
 
-        # Perform contraction:
-        slab, total = (None,) * len(shuffle), self.__total
-        if rev:
-            dim = tuple(self.dimension[r] for r in rev) # output .dimension
-            grid = self.xerox(dim, None).__listify()
+        n = len(used)
+        if used != set(range(n)):
+            raise ValueError('Incomplete permutation', tuple(sorted(used)))
+        bad = [ a for a, k in bok.items() if k != 2 ]
+        if bad: raise ValueError('Trace marker appears only once', bad)
 
-            for s in self.__ranger(iter(dim)): # each index into output grid
-                tmpl = list(slab) # input indices corresponding to s in output
-                for i, a in enumerate(rev): tmpl[a] = s[i]
-                store(grid, iter(s), total(tmpl, pairs))
+        labels = []
+        for t, pattern in terms:
+            m = t.rank - len(pattern)
+            labels.append((t, tuple(pattern) + tuple(range(n, n + m))))
+            n += m
 
-            # Don't pass dim; may lack a tail of self.dimension:
-            return self.fromSeq(grid)
+        return cls.__einsum(labels, n)
 
-        return total(slab, pairs)
-    del setcell
+    @classmethod
+    def __einsum(cls, terms, count):
+        """Implementation of contract(), dot(), tau() and permutrace().
+
+        Required arguments are a sequence of (tensor, labels) twoples, where
+        labels has an entry for each rank of tensor, and the rank of the
+        result.  Each whole number less than count must appear once among all
+        the labels, where it marks which rank of the result that rank of its
+        tensor becomes; each other label must appear twice, marking ranks to
+        be traced out.\n"""
+        bok = {}
+        for k, (t, labels) in enumerate(terms):
+            for i, a in enumerate(labels):
+                try: h, j = bok[a]
+                except KeyError: bok[a] = k, i
+                else:
+                    u = terms[h][0]
+                    if u.dimension[j] != t.dimension[i]: raise ValueError(
+                        'Can only trace between ranks of equal dimension',
+                        a, u.dimension, t.dimension)
+                    # Entries at a given rank shall typically all be of the
+                    # same kind, so checking one of each suffices:
+                    u[(0,) * j]._check_contract_(t[(0,) * i])
+
+        from study.maths.contract import contract
+        ans = contract([ t._table_(labels) for t, labels in terms ],
+                       range(count))
+        return ans.unflat(cls._vector_)
+
+    def _table_(self, labels):
+        """Returns self's leaves, as a study.maths.contract.Table.
+
+        Single argument, labels, has an entry for each rank of self, to be
+        used as the labels of the Table.  Derived classes that hold their
+        leaves in some more convenient form can over-ride this to save the
+        cost of flattening self.\n"""
+        from study.maths.contract import Table
+        return Table.nested(labels, self)
 
     # Further implementation details
     from study.maths.ratio import Rational
@@ -1165,7 +1138,7 @@ class Vector (Tuple):
     del Rational
 
     from study.maths.permute import Permutation
-    @staticmethod
+    @classmethod
     def __perm_average(cls, dims, ranks, func,
                        gen=Permutation.fixed):
         """Average over permutations, needed by (anti-)symmetrise()
@@ -1410,6 +1383,15 @@ class Namely (Vector):
         """Create the instance.
 
         See class doc-string for details.\n"""
+        return Vector.__new__(cls, cls._components_(args, kw))
+
+    @classmethod
+    def _components_(cls, args, kw):
+        """Sort out the components of a new instance.
+
+        Takes the tuple of positional arguments and the mapping of keyword
+        arguments passed to the constructor; returns the tuple of components
+        they specify, in order, with zero for any not given.\n"""
         if len(args) > len(cls._component_names_):
             raise ValueError('Too many components in vector', args, cls._component_names_)
 
@@ -1445,9 +1427,9 @@ class Namely (Vector):
                 assert all(val * 0 == zero for val in given[1:])
             else: zero = 0 # ddefault to scalar zero
             # replace each None with zero:
-            args = (zero if val is None else val for val in args)
+            args = tuple(zero if val is None else val for val in args)
 
-        return Vector.__new__(cls, args)
+        return args
 
     @classmethod
     def _vector_(cls, seq): return cls(*cls._unique_(seq))
@@ -8,35 +8,57 @@ See study.LICENSE for copyright and license information.
 """
 from study.maths.vector import Vector
 
+from array import array
+from study.cache.module import numpy as _numpy
+
 class Catchment (set):
     """Subdivide space according to which of a set of points is nearest.
 
     This is Voronoi's decomposition of the space; see class Voronoi for the
     description of the regions into which the space is thus decomposed.  Records
     the result of ingesting its constructor's argument (see .__init__()) as
-    .centres; has one method, .nearest(vec [, elide]), that finds the nearest in
-    .centres (but not in elide, if passed) to the given vec.\n"""
-
-    def __new__(cls, centres, count=1):
+    .centres; has methods to find the entries in .centres nearest a given point:
+      nearest(vec [, elide]) -- the nearest, not in elide if passed
+      nearest_k(vec, k [, elide]) -- the k nearest, nearest first
+      within(vec, r [, elide]) -- all within distance r, nearest first
+      nearest_many(vecs [, k, elide]) -- nearest_k for each of many vecs
+
+    The points are held in a k-d tree, built in one go: each node of the tree
+    covers a contiguous run of the points (in the tree's order), which is split
+    at its median on the co-ordinate in which its points are most spread out,
+    so that the tree is balanced; a node with few enough points is a leaf.
+    When numpy is available (and the co-ordinates are real), it is used to
+    find each node's spread and median while building.  The
+    tree is held in arrays, indexed by node: .__axis (-1 for a leaf), .__cut
+    (the median), .__left (the left child; the right is the next node),
+    .__lo and .__hi (the run of points).  Queries descend the tree, nearer
+    side first, skipping any sub-tree whose box is further off than the
+    furthest candidate answer found so far; so each takes time logarithmic in
+    the number of points.  Points added after building are kept in a list,
+    that each query scans, until there are enough of them to be worth
+    rebuilding the tree; discarded points are likewise merely marked as
+    gone, until they're numerous.\n"""
+
+    def __new__(cls, centres, count=8):
         if count < 1: raise ValueError('Demanding unrealistic subdivision', count)
         return set.__new__(cls, (cls.__vectorise(c) for c in centres))
 
     __upinit = set.__init__
-    def __init__(self, centres, count=1):
+    def __init__(self, centres, count=8):
         """Set up data for computation of catchment-regions.
 
         Required first argument, centres, should be an iterable, whose entries
         are points in some vector space; if they are not Vector instances, they
         should be sequences acceptable to Vector.fromSeq().  Optional second
         argument, count, is an upper bound on the number of points to include in
-        each leaf of the bisection tree built internally; it must be at least 1
-        - its default (and recommended) value.
+        each leaf of the k-d tree built internally; it must be at least 1 and
+        defaults to 8, which suits most uses.
 
         Stores, in self as a set, Vector (see study.maths.vector) instances
         (made using Vector.fromSeq where needed) representing the entries in
         centres.\n"""
 
-        self.__upinit(centres)
+        self.__upinit(self.__vectorise(c) for c in centres)
 
         # Check all in the same space:
         each = iter(self)
@@ -47,293 +69,169 @@ class Catchment (set):
             d = it.dimension
             if len(d) != len(dims) or d != dims:
                 raise ValueError('Mismatched dimension', dims, d, it)
-        self.__dim = tuple(dims)
-        self.__root, self.__ineach = self.__btree(tuple(self), count), count
+        self.__dim, self.__ineach = tuple(dims), count
+        self.__build()
 
     @staticmethod
     def __vectorise(val, V=Vector):
         return val if isinstance(val, V) else V.fromSeq(val)
-
-    # Support for .__btree()
-    class BTree (object):
-        """Bisection tree.
-
-        A coordinate-aligned cuboid box that knows how to be split in two.  Has,
-        as its .box attribute, a pair of vectors (low, high); the cuboid it
-        describes has .box[0][ind] <= vec[ind] <= .box[1][ind] for each vec in
-        the cuboid and each full-rank index, ind.  Supports 'vec in self'
-        testing based on this.
-
-        If it's been .split(), it has child notes .left and .rite and its .cut
-        records the coordinate at their boundary; otherwise these attributes are
-        unset.  The value of .cut (when set) is a twople whose first entry is
-        the index of the coordinate and whose sencond entry is the value of this
-        coordinate at the boundary between the two child nodes.
-
-        Has .parent set to the node whose .split() created it as .left or .rite,
-        if this is how it was created; otherwise, doesn't have .parent set (so
-        AttributeError is the easy way out of traversal up the .parent
-        hierarchy).  Methods:
-
-          .split() -- bisect self on a suitable coordinate plane.
-          .locate(vec) -- find which cell a given vec is in
-          .distance(vec) -- range of distance between vec and points in self.box
-
-        Our one client, Catchment, shall set .points to a list of points in the
-        box (but no method of this class pays any attention to .points).\n"""
-        def __init__(self, lo, hi, up=None):
-            self.box = lo, hi
-            if up is not None: self.parent = up
-        # TODO: make parent a weak attribute, so that garbage collection is happy.
-
-        # Tools for use by split():
-        def __child(self, lo, hi): return self.__class__(lo, hi, self)
-
-        @staticmethod
-        def __split(deep, lo, hi, only=Vector.delta):
-            """Finds the right index and mid-value on which to split a box.
-
-            Uses deep (from __depth(), below) to determine how recently each
-            index has been split on; amongst the least recently used, finds the
-            one for which hi-lo has the largest component, i.e. the box's width
-            is biggest.  Returns a twople of this index with the vector that's
-            half the box's width in this direction.\n"""
-            dex, was = (hi - lo).iteritems(), 0
-            while not was:
-                try: big, was = dex.next()
-                except StopIteration: # lo == hi
-                    raise ValueError('Empty box', lo, hi)
-                assert was >= 0
-            at = deep(big)
-
-            for ind, val in dex:
-                assert val >= 0
-                if val: # don't try to cut on a zero-width direction !
-                    dp = deep(ind)
-                    if at < dp or (dp == at and val < was):
-                        at, was, big = dp, val, ind
-
-            gap = hi[big] - lo[big]
-            assert gap > 0
-            q, r = divmod(gap, 2)
-            if r: q = gap * .5 # but prefer an int if we got one
-            return big, only(hi.dimension, big) * q
-
-        def __depth(self):
-            """Returns a function to compute depth below last split on an index.
-
-            The returned function returns one more than self's depth in the tree
-            when we haven't yet split on the index given.\n"""
-            up, prior = self, []
-            try:
-                while True:
-                    up = up.parent # AttributeError at root
-                    assert hasattr(up, 'cut')
-                    prior.append(up.cut[0])
-            except AttributeError: pass
-
-            def deep(ind, p=prior):
-                try: return p.index(ind)
-                except ValueError: return len(p)
-
-            return deep
-
-        def split(self):
-            """Split self in half in one coordinate direction.
-
-            The chosen coordinate direction is the least recently used, among
-            splits in the tree down to self, preferring those with bigger width
-            among those on which we haven't split previously.\n"""
-
-            lo, hi = self.box
-            ind, half = self.__split(self.__depth(), lo, hi)
-            assert len(hi) == len(half), (half, ind, hi, lo)
-            self.left, self.rite = self.__child(lo, hi - half), self.__child(lo + half, hi)
-            self.cut = ind, self.left.box[1][ind]
-            assert self.cut[1] == self.rite.box[0][ind]
-            return self.left, self.rite
-
-        def __contains__(self, vec):
-            lo, hi = self.box
-            return not vec.pointwise(lambda v, L, H: v < L or H < v, None, lo, hi)
-
-        def locate(self, vec):
-            """Returns the leaf node containing a given vector.
-
-            Identifies the leaf node, in the tree under self, in which vec
-            appears; or the one closest to vec, if vec is not in self.\n"""
-
-            here = self
-            while True:
-                try: ind, cut = here.cut
-                except AttributeError: break
-                here = here.rite if vec[ind] > cut else here.left
-                # For vec in self, this is equivalent to, but cheaper than:
-                # here = left if vec in left else rite
-
-            assert vec in here or not vec in self
-            return here
-
-        def distance(self, vec):
-            """Returns the range of distances, in self's box, from a given vector.
-
-            Required argument, vec, is the vector to measure from.  Returns a
-            twople of the distances from vec to its nearest and furthest points
-            in self.\n"""
-            lo, hi = self.box
-            off = vec.pointwise(lambda v, L, H: L - v if v <= L else H -v if v >= H else 0,
-                                 None, lo, hi)
-            far = vec.pointwise(lambda v, L, H: H - v if 2 * v < L + H else L - v,
-                                 None, lo, hi)
-            return off.squaresum ** .5, far.squaresum ** .5
-
-    @classmethod
-    def __btree(cls, ps, n=1, Tree=BTree):
-        """Builds a BTree with at most n of the ps in each leaf of the tree.
-
-        Saves, as each node's .points, the list of entries from ps that are in
-        the node.  Points on boundaries are placed in one of the adjacent nodes,
-        at each split; clients should make no assumption about which.\n"""
-        root = Tree(ps[0].pointwise(lambda *xs: min(xs), None, *ps[1:]),
-                    ps[0].pointwise(lambda *xs: max(xs), None, *ps[1:]))
-        cls.__split(root, ps, n)
-        return root
-    del BTree
 
-    @staticmethod
-    def __split(root, ps, each):
-        live = [ ( root, ps ) ]
-        while live:
-            tree, ps = live.pop()
-            assert all(p in tree for p in ps)
-            tree.points = frozenset(ps)
-
-            if len(ps) > each: # else we can let tree be a leaf
-                left, rite = tree.split()
-                ind, cut = tree.cut
-                ls, rs = [], []
-                for p in ps: (rs if p[ind] > cut else ls).append(p)
-                live += [ (left, tuple(ls)), (rite, tuple(rs)) ]
-
-    # Critique: self.__root.points is a set with the same membership as self
-    # (just lacking the extra methods of Catchment).  This strongly hints that
-    # self and self.__root could be unified in some way, with each sub-tree as a
-    # subset.  It would change the semantics of __contains__(); rename the
-    # geometric one to encloses().
-
+    def __flat(self, vec):
+        """The co-ordinates of a vector (or tensor), as a flat tuple."""
+        if len(self.__dim) == 1: return tuple(vec)
+        return tuple(x for i, x in vec.iteritems())
+
+    def __build(self):
+        """(Re)builds the k-d tree from the present members of self."""
+        pts = list(self)
+        xs = [ self.__flat(p) for p in pts ]
+        dims, each = range(len(xs[0])), self.__ineach
+        axis, cut, left = array('l', [-1]), [None], array('l', [0])
+        lo, hi = array('l', [0]), array('l', [len(pts)])
+        todo, np = [ 0 ], _numpy()
+        if np is not None:
+            grid = np.array(xs)
+            if grid.dtype.kind not in 'fiu': np = None
+        if np is None: order = range(len(pts))
+        else: order = np.arange(len(pts))
+
+        while todo:
+            node = todo.pop()
+            a, b = lo[node], hi[node]
+            if b - a <= each: continue # leaf
+            mid = (a + b) / 2
+
+            if np is None:
+                run, best, wide = order[a:b], None, None
+                for d in dims:
+                    col = [ xs[i][d] for i in run ]
+                    spread = max(col) - min(col)
+                    if wide is None or spread > wide: best, wide = d, spread
+                if not wide: continue # all points coincide (on every axis)
+                run.sort(key=lambda i, d=best: xs[i][d])
+                order[a:b] = run
+            else:
+                run = order[a:b]
+                spread = np.ptp(grid[run], axis=0)
+                best = int(spread.argmax())
+                if not spread[best]: continue
+                run = run[np.argpartition(grid[run, best], mid - a)]
+                order[a:b] = run
+            axis[node], cut[node], left[node] = best, xs[order[mid]][best], len(axis)
+            for m, n in ((a, mid), (mid, b)):
+                todo.append(len(axis))
+                axis.append(-1)
+                cut.append(None)
+                left.append(0)
+                lo.append(m)
+                hi.append(n)
+
+        self.__axis, self.__cut, self.__left = axis, cut, left
+        self.__lo, self.__hi = lo, hi
+        self.__pts, self.__xs = [ pts[i] for i in order ], [ xs[i] for i in order ]
+        self.__extra, self.__gone = [], set()
+
     # API of set:
     __upadd = set.add
     def add(self, point):
-        if point.dimension != iter(self).next().dimension:
+        point = self.__vectorise(point)
+        if point.dimension != self.__dim:
             raise ValueError('Incompatible dimension', point.dimension)
+        if point in self: return
         self.__upadd(point)
-
-        if point in self.__root:
-            # We can insert it into the existing BTree:
-            tree = self.__root.locate(point)
-            self.__split(tree, tree.points.union((point,)), self.__ineach)
-
-            while True: # run up to root, adding point to .points of each node:
-                try: tree = tree.parent
-                except AttributeError: break
-                tree.points = tree.points.union((point,))
-
-        else: # Need a new BTree:
-            self.__root = self.__btree(tuple(self), self.__ineach)
+        if point in self.__gone: self.__gone.discard(point)
+        else: self.__extra.append(point)
+        if len(self.__extra) ** 2 > len(self.__pts): self.__build()
 
     __uprm = set.discard
     def discard(self, point):
         if point not in self: return
         self.__uprm(point)
-        self.__rm(point, self.__root)
+        self.__forget(point)
 
-    @staticmethod
-    def __rm(point, root):
-        assert point in root.points # which is what we need to fix
-        tree, point = root.locate(point), set((point,))
-        while True:
-            tree.points -= point
-            # TODO: unsplit if one child is empty and the other a leaf.
-            try: tree = tree.parent
-            except AttributeError: break
+    def __forget(self, point):
+        try: self.__extra.remove(point)
+        except ValueError:
+            self.__gone.add(point)
+            if self and 2 * len(self.__gone) > len(self.__pts): self.__build()
 
     __uppop = set.pop
     def pop(self): # ... or suppress this method as a silly one to use ?
         ans = self.__uppop()
-        self.__rm(ans, self.__root)
+        self.__forget(ans)
         return ans
 
-    # Support for .nearest()
-    from itertools import chain
-    @staticmethod
-    def __nearleaves(where, tree, elide, byturns=chain):
-        """Find the leaf nodes in which the closest point to where could lie.
+    # Queries:
+    def __search(self, where, k, reach, elide):
+        """The core of each query.
 
         Arguments:
-          where -- the point;
-          tree -- the tree to traverse;
-          elide -- collection of points to ignore, in .points attributes.
-
-        Expands each split in tree so as to discard (without splitting) every
-        box whose nearest point to where is further than the furthest point of
-        some other box; repeatedly splits the box, whose furthest point from
-        where is nearer than that of any other, so as to be able to discard as
-        many futher boxes as soon as possible.  Each box retained, at the end,
-        is a leaf with at least some point in it closer to where than the
-        furthest point of every retained box.  The return is an iterator over
-        the points in the boxes retained; these are the points that might be
-        nearest to where.\n"""
-
-        near, best = tree.distance(where)
-        live, more = [ ( tree, near ) ], False
-        if elide: empty = lambda ps, ig=elide: not [ p for p in ps if p not in ig ]
-        else: empty = lambda ps: not ps
-        if empty(tree.points):
-            raise ValueError('Ignoring all points leaves none to be nearest', elide)
-
-        # Invariants: best is the max distance from where of any point in tree's
-        # box; tree is the live BTree node for which this is least, among those
-        # we've seen; more is true when we've split a node since last our
-        # scanning showed us tree.  We loop over the live BTree nodes, splitting
-        # those we can and eliminating those in which the nearest point can't
-        # be.  There are no empty() entries in live.
-        while True:
-            here, near = live.pop()
-            if near > best: continue # we can ignore this sub-tree
-
-            try: pair = here.left, here.rite
-            except AttributeError:
-                live.insert(0, (here, near)) # Move to the back of the queue
-                if here is tree: # Are we done yet ?
-                    if more: more = False
-                    else: break # no further refinement possible
-
-            else: # split node
-                more, shift = True, here is tree
-                for here in pair:
-                    # if it's a leaf with no points, ignore it:
-                    if empty(here.points): continue
-
-                    near, far = here.distance(where)
-                    if near < best: # else ignore here
-                        # When splitting tree itself (shift is true), one of its
-                        # children must be at least as good as it and we must
-                        # switch to using that as tree, so that the "Are we done
-                        # yet ?" does get triggered.  If splitting some other
-                        # node equals tree, but doesn't beat it, then we'll
-                        # still be done when we get back to tree in the loop, so
-                        # no need to change which node we think is best.
-                        if (far <= best if shift else far < best):
-                            # Improvement (or replacing tree with equal child):
-                            best, tree = far, here
-                            # Reprocess promptly, as splitting it is apt to improve best:
-                            live.append((here, near))
-                        else: live.insert(0, (here, near)) # Back of the queue.
-
-        assert live
-        # Remaining leaves overlap, need to check all points in them.
-        return byturns(*tuple(it[0].points for it in live))
-    del chain
+          where -- flat tuple of co-ordinates of the point to search from;
+          k -- maximum number of points wanted, or None for no limit;
+          reach -- squared distance beyond which points are of no interest,
+                   or None for no limit;
+          elide -- collection of points to ignore.
+
+        Returns a list of (squared distance, point) twoples, nearest first.\n"""
+        from heapq import heappush, heapreplace
+        axis, cut, left = self.__axis, self.__cut, self.__left
+        lo, hi, xs, pts = self.__lo, self.__hi, self.__xs, self.__pts
+        gone = self.__gone
+        if gone and elide: skip = lambda p: p in gone or p in elide
+        elif gone or elide: skip = (gone or elide).__contains__
+        else: skip = None
+
+        found, worst = [], reach # found is a max-heap, via negated distances
+        def offer(rr, p):
+            if worst is not None and rr > worst: return worst
+            if k is None: found.append((-rr, p))
+            elif len(found) < k: heappush(found, (-rr, p))
+            else: heapreplace(found, (-rr, p))
+            if k is not None and len(found) == k: return -found[0][0]
+            return worst
+
+        for p in self.__extra:
+            if skip is None or not skip(p):
+                rr = sum((x - y) ** 2 for x, y in zip(self.__flat(p), where))
+                worst = offer(rr, p)
+
+        stack = [ (0, 0) ]
+        while stack:
+            node, bound = stack.pop()
+            if worst is not None and bound > worst: continue
+            a = axis[node]
+            if a < 0:
+                for i in xrange(lo[node], hi[node]):
+                    rr = 0
+                    for x, y in zip(xs[i], where): rr += (x - y) ** 2
+                    if worst is not None and rr > worst: continue
+                    if skip is None or not skip(pts[i]):
+                        worst = offer(rr, pts[i])
+            else:
+                gap = where[a] - cut[node]
+                near = left[node]
+                if gap < 0: far = near + 1
+                else: near, far = near + 1, near
+                # The far side's points are at least |gap| away:
+                stack.append((far, max(bound, gap * gap)))
+                stack.append((near, bound))
+
+        found.sort(reverse=True)
+        return [ (-rr, p) for rr, p in found ]
+
+    def nearest_k(self, where, k, elide=()):
+        """Find the k nearest entries in self to where.
+
+        Required arguments are where, a vector (or tensor, with the same
+        .dimension as the members of self), and the number k of points
+        wanted.  Optional third argument, elide, is a container (we must be
+        able to do 'p in elide' tests) of points in self to ignore.  Returns a
+        list of up to k twoples (p, d), nearest first, with p in self and d
+        its distance from where; no entry of self outside the list is nearer
+        than any in it.\n"""
+        if k < 1: return []
+        where = self.__flat(self.__vectorise(where))
+        return [ (p, rr ** .5) for rr, p in self.__search(where, k, None, elide) ]
 
     def nearest(self, where, elide=()):
         """Find a nearest entry in self to where.
@@ -344,18 +242,37 @@ class Catchment (set):
         to ignore when searching for the one nearest to where; defaults to
         ().  Returns a twople (p, d) where p is in self and d*d ==
         (where-p).squaresum is minimal among relevant p (in self but not in
-        elide) - although there is no guarantee this is unique.\n"""
-
-        ps = self.__nearleaves(self.__vectorise(where), self.__root, elide)
-        centre = ps.next()
-        sumsqr = (centre - where).squaresum
-        for p in ps:
-            if p in elide: continue
-            rr = (p - where).squaresum
-            if rr < sumsqr: centre, sumsqr = p, rr
+        elide) - although there is no guarantee this is unique.  Raises
+        ValueError if elide leaves no candidates.\n"""
+        ans = self.nearest_k(where, 1, elide)
+        if not ans:
+            raise ValueError('Ignoring all points leaves none to be nearest', elide)
+        return ans[0]
+
+    def within(self, where, radius, elide=()):
+        """Find all entries in self within a given distance of where.
+
+        Required arguments are where, a vector (or tensor, with the same
+        .dimension as the members of self), and the distance, radius;
+        optional third argument, elide, is as for .nearest_k().  Returns a
+        list of twoples (p, d), nearest first, with p in self and d <= radius
+        its distance from where.\n"""
+        if radius < 0: return []
+        where = self.__flat(self.__vectorise(where))
+        return [ (p, rr ** .5) for rr, p in
+                 self.__search(where, None, radius * radius, elide) ]
+
+    def nearest_many(self, wheres, k=1, elide=()):
+        """Batched form of .nearest_k(), for many points at once.
+
+        Required argument, wheres, is an iterable over points; optional k and
+        elide are as for .nearest_k(), with k defaulting to 1.  Returns a list
+        with, for each point in wheres, the list .nearest_k(point, k, elide)
+        would return.\n"""
+        search, flat, vec = self.__search, self.__flat, self.__vectorise
+        return [ [ (p, rr ** .5) for rr, p in search(flat(vec(w)), k, None, elide) ]
+                 for w in wheres ]
 
-        return centre, sumsqr ** .5
-
 class Voronoi (object):
     # TODO: boundary-representation of the convex hulls, one per point.
     pass
@@ -16,13 +16,7 @@ Sub-package:
 
 See study.LICENSE for copyright and license information.
 """
-import decorate
-import error
-import infinite
-import lazy
-import prodict
-import property
-import regular
-import row
-import sequence
-import show
+from study.cache.module import Package
+Package.install(__name__, ('decorate', 'error', 'infinite', 'lazy', 'prodict',
+                           'property', 'regular', 'row', 'sequence', 'show'))
+del Package
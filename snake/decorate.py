@@ -42,10 +42,42 @@ See also:
 See study.LICENSE for copyright and license information.
 """
 
+# Importing inspect (which imports tokenize, which compiles many regexes) costs
+# more than importing most modules that use this one, so only do that for the
+# hard cases (tuple parameters, callables not implemented in python):
+from types import FunctionType, MethodType
+def argspec(function, plain=FunctionType, bound=MethodType):
+    if isinstance(function, bound): function = function.im_func
+    if isinstance(function, plain):
+        code = function.func_code
+        i = code.co_argcount
+        args = code.co_varnames[:i]
+        if not any(a.startswith('.') for a in args):
+            varargs = varkw = None
+            if code.co_flags & 4: varargs, i = code.co_varnames[i], i + 1
+            if code.co_flags & 8: varkw = code.co_varnames[i]
+            return list(args), varargs, varkw, function.func_defaults
+
+    from inspect import getargspec
+    return getargspec(function) # TypeError if function is a built-in :-(
+
+def argformat(args, varargs, varkw, defaults, formatvalue):
+    if any(isinstance(a, list) for a in args):
+        from inspect import formatargspec
+        return formatargspec(args, varargs, varkw, defaults,
+                             formatvalue=formatvalue)
+
+    first = len(args) - len(defaults or ())
+    specs = [a + formatvalue(defaults[i - first]) if i >= first else a
+             for i, a in enumerate(args)]
+    if varargs is not None: specs.append('*' + varargs)
+    if varkw is not None: specs.append('**' + varkw)
+    return '(' + ', '.join(specs) + ')'
+del FunctionType, MethodType
+
 # Note: all of these are wrapped, below, to hide their tunnelled args !
-import inspect
 def wrapas(function, prototype,
-           fetch=inspect.getargspec, format=inspect.formatargspec, isfunc=inspect.isroutine,
+           fetch=argspec, format=argformat, isfunc=callable,
            valfmt='=__default_arg_%x', fname='__implementation',
            skip=lambda x: ''):
     """Masks the signature of a function.
@@ -70,7 +102,7 @@ def wrapas(function, prototype,
         format(n, a, k, d, formatvalue=skip))
     # print 'Wrapping %s as "%s" using globals' % (function.__name__, text), glob.keys()
     return eval(text, glob)
-del inspect
+del argspec, argformat
 
 def labelas(function, original):
     """Transcribe superficial details from original to function.
@@ -3,11 +3,23 @@
 This isn't *quite* as simple as just reduce(join, map(xfrm, data)), since the
 map needn't produce only one output per input and its outputs are expected to be
 key-value pairs; the reduce then combines values from all instances of each key,
-associating the combined value with that key.  This implementation is not meant
-to be especially performant: it exists for the pedagogic purpose of illustrating
-what MapReduce does.
+associating the combined value with that key.
+
+Provides:
+  MapReduceDict -- the simplest possible implementation, for illustration
+  MapReduce -- a parallel engine, that can spill to disk, for real use
+  throttled -- a pool's imap, but reading only a few inputs ahead of results
+
+MapReduceDict is not meant to be especially performant: it exists for the
+pedagogic purpose of illustrating what MapReduce does.  MapReduce takes the
+same each and join callbacks but maps chunks of its input in a pool of
+processes, hash-partitions the results and spills these partitions to
+temporary files when they exceed a memory budget, then reduces the partitions
+in parallel.
+
+See study.LICENSE for copyright and license information.
 """
-
+
 def MapReduceDict(src, each=lambda x: (x,), join=lambda v, p=(): p + (v,)):
     """Simplest possible pythonic MapReduce.
 
@@ -25,15 +37,262 @@ def MapReduceDict(src, each=lambda x: (x,), join=lambda v, p=(): p + (v,)):
     return.  Defaults are provided for each and join: the default for each uses
     each item in src as a single key-value pair to use; that for join collects
     up all of the values seen into a tuple.  Returns the resulting mapping from
-    keys to the result of joining values.\n"""
+    keys to the result of joining values.  See MapReduce for a more efficient
+    implementation.\n"""
 
     bok = {}
     for item in src:
         for key, value in each(item):
-            try: prior = bok.get(key)
-            except KeyError: bok[key] = value
+            try: prior = bok[key]
+            except KeyError: bok[key] = join(value)
             else: bok[key] = join(value, prior)
 
     return bok
-
-# TODO: think of a way to pipeline it through iterables all the way.
+
+def throttled(pool, func, seq, ahead, ordered=True):
+    """Like pool.imap(func, seq), but with at most ahead tasks in flight.
+
+    The pool's imap (and imap_unordered) hands every item of seq to its
+    workers as fast as it can read them, so a long (or endless) input gets
+    read into memory far ahead of the results being consumed.  This only
+    lets the pool read another item from seq once a result has been taken.
+    Pass ordered=False to use imap_unordered.  Callers should .close() the
+    returned generator before terminating the pool, lest the pool's thread
+    that reads seq be left waiting for room.\n"""
+    from threading import Semaphore
+    room, stop, it = Semaphore(ahead), [], iter(seq)
+    def feed():
+        while True:
+            room.acquire()
+            if stop: return
+            yield it.next()
+
+    try:
+        for out in (pool.imap if ordered else pool.imap_unordered)(func, feed()):
+            room.release()
+            yield out
+    finally:
+        stop.append(True)
+        room.release()
+
+# Worker-side state and tasks for MapReduce; these have to be module globals so
+# that the pool's processes can find them.
+_job = None
+def _prepare(each, join, merge):
+    global _job
+    _job = each, join, merge
+
+def _mapchunk(chunk, job=None):
+    """Map a chunk of input to a dict of per-key contributions.
+
+    With a merge callback, each key's values from this chunk are combined
+    (using join) into one partial result; otherwise, the values are simply
+    collected in a list, in order.\n"""
+    each, join, merge = job or _job
+    bok = {}
+    if merge is None or join is None:
+        for item in chunk:
+            for key, value in each(item):
+                try: bok[key].append(value)
+                except KeyError: bok[key] = [value]
+    else:
+        for item in chunk:
+            for key, value in each(item):
+                try: prior = bok[key]
+                except KeyError: bok[key] = join(value)
+                else: bok[key] = join(value, prior)
+    return bok
+
+def _reducepart(task, job=None, load=None):
+    """Reduce one partition to a dict from keys to final values.
+
+    The task is a twople: the name of the partition's spill file, or None,
+    and a dict holding any of its contributions still in memory.  Each maps
+    keys to lists of contributions, from successive chunks, in order.\n"""
+    each, join, merge = job or _job
+    path, tail = task
+    bok = {}
+    def absorb(part):
+        for key, seq in part.iteritems():
+            try: bok[key].extend(seq)
+            except KeyError: bok[key] = list(seq)
+
+    if path is not None:
+        if load is None: from cPickle import load
+        with open(path, 'rb') as fd:
+            while True:
+                try: absorb(load(fd))
+                except EOFError: break
+    absorb(tail)
+
+    if merge is not None and join is not None:
+        for key, seq in bok.iteritems():
+            bok[key] = reduce(merge, seq)
+    else:
+        for key, seq in bok.iteritems():
+            # Each entry in seq is itself a list of raw values:
+            vals = [v for part in seq for v in part]
+            if join is None: bok[key] = tuple(vals)
+            else:
+                ans = join(vals[0])
+                for v in vals[1:]: ans = join(v, ans)
+                bok[key] = ans
+    return bok
+
+class MapReduce (object):
+    """Parallel, disk-spilling MapReduce.
+
+    Instances are callable on an iterable; they return the same mapping
+    MapReduceDict would, given the same each and join.  Method items() gives
+    the same (key, value) pairs without collecting them into one mapping.
+
+    The input is consumed in chunks, that are mapped in a pool of worker
+    processes.  The resulting per-key contributions are hash-partitioned by
+    key; once more than a budgeted number of values are held in memory, all
+    partitions are appended to temporary files.  Finally, each partition is
+    reduced in the pool.  Contributions are always kept in input order, so
+    join sees values in the same order MapReduceDict would show them to it.
+
+    Since they must be shared with the worker processes, each, join and merge
+    are handed over when the pool starts (which uses fork, so lambdas are
+    fine); but input items, keys and values are pickled to pass them between
+    processes, so must be picklable.  Only a few chunks per process are read
+    ahead of the mapping, so the input need not fit in memory.\n"""
+
+    def __init__(self, each=lambda x: (x,), join=None, merge=None,
+                 processes=None, chunk=1024, budget=1 << 20, partitions=16,
+                 spool=None):
+        """Set up a MapReduce engine.
+
+        All arguments are optional:
+          each -- map each entry in the input to an iterable over key-value
+                  pairs; by default, each entry is taken to be such a pair
+          join -- as for MapReduceDict; called as join(value) on the first
+                  value for each key and as join(value, prior) thereafter.  If
+                  None (the default), all values for each key are collected
+                  into a tuple (without the quadratic cost of doing that by
+                  adding tuples).
+          merge -- if given, merge(prior, later) must combine two joined
+                   values, computed from earlier and later runs of values
+                   for the same key; it enables combining within each chunk
+                   before the shuffle, greatly reducing the data to shuffle
+                   when there are few distinct keys.
+          processes -- number of worker processes; default None uses one per
+                       CPU; 1 does all the work in this process
+          chunk -- number of input items to map in each task; default 1024
+          budget -- number of values (or, with merge, partial results) to
+                    hold in memory before spilling to disk; default 2**20
+          partitions -- number of partitions of the key-space; default 16
+          spool -- directory in which to make temporary spill files; default
+                   None lets tempfile decide.\n"""
+        assert chunk > 0 and partitions > 0 and budget > 0
+        self.__job = each, join, merge
+        self.__procs, self.__chunk, self.__budget = processes, chunk, budget
+        self.__parts, self.__spool = partitions, spool
+
+    def __call__(self, src):
+        bok = {}
+        for key, value in self.items(src): bok[key] = value
+        return bok
+
+    def items(self, src):
+        """Iterate the (key, value) pairs of the MapReduce of src.
+
+        Pairs are yielded a partition at a time, so only one partition's
+        results need be held in memory at once (when processes is 1; a pool
+        may have reduced several partitions by the time they're wanted).\n"""
+        pool = self.__pool()
+        try:
+            for bok in self.__reduce(pool, self.__shuffle(pool, src)):
+                for pair in bok.iteritems(): yield pair
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def __pool(self):
+        if self.__procs == 1: return None
+        from multiprocessing import Pool
+        return Pool(self.__procs, _prepare, self.__job)
+
+    @staticmethod
+    def __chunks(src, size):
+        from itertools import islice
+        it = iter(src)
+        while True:
+            chunk = list(islice(it, size))
+            if not chunk: break
+            yield chunk
+
+    def __shuffle(self, pool, src):
+        """Map src and partition the results.
+
+        Returns a twople: a list, with one entry per partition, of (path,
+        dict) twoples as required by _reducepart; and the directory holding
+        spill files, or None if nothing was spilled.\n"""
+        count, held = self.__parts, 0
+        parts = [{} for i in range(count)]
+        spill = None
+        chunks = self.__chunks(src, self.__chunk)
+        if pool is None:
+            job = self.__job
+            mapped = (_mapchunk(c, job) for c in chunks)
+        else:
+            from multiprocessing import cpu_count
+            ahead = 2 * (self.__procs or cpu_count())
+            mapped = throttled(pool, _mapchunk, chunks, ahead)
+
+        try:
+            for bok in mapped:
+                for key, value in bok.iteritems():
+                    part = parts[hash(key) % count]
+                    try: part[key].append(value)
+                    except KeyError: part[key] = [value]
+                    held += len(value) if isinstance(value, list) else 1
+
+                if held > self.__budget:
+                    if spill is None: spill = self.__spillto()
+                    self.__spill(spill, parts)
+                    held = 0
+
+            if spill is None: return [(None, p) for p in parts], None
+            if held: self.__spill(spill, parts)
+            return [(self.__part(spill, i), {}) for i in range(count)], spill
+        except:
+            if spill is not None: self.__tidy(spill)
+            raise
+        finally: mapped.close()
+
+    def __spillto(self):
+        from tempfile import mkdtemp
+        return mkdtemp(prefix='mapreduce-', dir=self.__spool)
+
+    @staticmethod
+    def __part(spill, i):
+        import os
+        return os.path.join(spill, 'part%d' % i)
+
+    def __spill(self, spill, parts, dump=None):
+        if dump is None: from cPickle import dump
+        for i, part in enumerate(parts):
+            if part:
+                with open(self.__part(spill, i), 'ab') as fd: dump(part, fd, 2)
+                part.clear()
+            else: # ensure the file exists, so the reducer can open it:
+                open(self.__part(spill, i), 'ab').close()
+
+    @staticmethod
+    def __tidy(spill):
+        from shutil import rmtree
+        rmtree(spill, True)
+
+    def __reduce(self, pool, shuffled):
+        tasks, spill = shuffled
+        try:
+            if pool is None:
+                job = self.__job
+                for task in tasks: yield _reducepart(task, job)
+            else:
+                for bok in pool.imap_unordered(_reducepart, tasks): yield bok
+        finally:
+            if spill is not None: self.__tidy(spill)
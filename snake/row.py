@@ -57,12 +57,7 @@ def median(seq):
 
     Returns the formal median of the sequence; if the sequence were sorted, this
     would be the one in the middle.  For a sequence of even length, when the two
-    in the middle aren't equal, their mean is used.\n"""
-    row = list(seq)
-    row.sort()
-    n, i = divmod(len(row), 2)
-    if i: return row[n]
-    i, j = row[n], row[n-1]
-    if i == j: return i
-    return 0.5 * (i+j)
-
+    in the middle aren't equal, their mean is used.  The sequence isn't actually
+    sorted; see study.maths.quantile.median.\n"""
+    from study.maths.quantile import median
+    return median(seq)
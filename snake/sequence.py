@@ -3,6 +3,7 @@
 Classes:
   Iterable -- mix-in to enrich iterable classes with functional tools
   WrapIterable -- simple wrapper to add Iterable's methods to an iterable
+  Pipeline -- fused (and optionally batched or parallel) map/filter chains
   ReadSeq -- mix-in extending Iterable to support most tuple methods
   Tuple -- mixes ReadSeq and tuple suitably
   Dict -- dict with its sequence and iterator methods suitably wrapped
@@ -209,6 +210,15 @@ class Iterable (object):
             if all((p if t is None else t(p)) for t in tests):
                 yield p
 
+    def pipeline(self, batch=None):
+        """Start a fused pipeline of map and filter stages on self.
+
+        Optional argument, batch, is the number of entries to process at a
+        time; see Pipeline (below) for details.  Chaining .map() and .filter()
+        calls on the result builds up a single loop that applies all of them,
+        instead of wrapping a further generator round self for each.\n"""
+        return Pipeline(self, batch=batch)
+
     @iterinstance
     def enumerate(self):
         i = 0
@@ -227,32 +237,20 @@ class Iterable (object):
     def reversed(self):
         return self.__reversed__()
 
+    import itertools # not from ... import product, which would hide ours
     @staticmethod
-    def __descartes(o, r=((),)): # helper for __renee()
-        """Iterate over product of o with r.
-
-        Required argument, o, is an iterable (and not an iterator).  Optional
-        argument, r, defaults to ((),), a sequence whose sole entry is the empty
-        tuple; if given, it should be an iterable (it may be an iterator: it is
-        fully iterated exactly once) over tuples.  For each tuple in r, this
-        method yields each result of adding an entry in o to the start of the
-        tuple.  Thus the default for r yields one-tuples, wrapping each entry of
-        o in one such tuple.\n"""
-        for em in r:
-            for it in o:
-                yield (it,) + em
-
-    @classmethod
-    def __renee(cls, func, one, *rest): # helper for cartesian()
-        """Raw cartesian product of iterators.
-
-        Has to be separate from .__descartes() since its recursive call to
-        itself needs it to be a function, not a generator.  Is separate from
-        cartesian so as to use raw tuples as keys for efficiency in the
-        recursion, leaving cartesian to Tuple()ify the final results.\n"""
-        if func is not None: one = func(one)
-        if rest: return cls.__descartes(one, cls.__renee(func, *rest))
-        return cls.__descartes(one)
+    def __descartes(func, whom, mix=itertools.product): # for cartesian()
+        """Raw cartesian product of iterables.
+
+        Uses itertools.product, so no recursion is needed; since that varies
+        its last input fastest, and cartesian() varies its first fastest, the
+        inputs are reversed going in and each yielded tuple reversed coming
+        out.  Produces raw tuples, leaving cartesian to Tuple()ify the final
+        results.\n"""
+        seqs = [w if func is None else func(w) for w in whom]
+        seqs.reverse()
+        for it in mix(*seqs): yield it[::-1]
+    del itertools
 
     @classmethod
     def cartesian(cls, func, *whom):
@@ -277,7 +275,8 @@ class Iterable (object):
         length five (there were five 4s), whose entries are in range(4);
         Iterable.cartesian(range, *((n,)*m)) yields every tuple, of length m,
         whose entries are drawn from range(n).\n"""
-        return cls._iterable_(cls.__renee(func, *whom)).map(Tuple)
+        assert whom, 'Cartesian product of nothing'
+        return cls._iterable_(cls.__descartes(func, whom)).map(Tuple)
 
 class WrapIterable (Iterable):
     # For when you aren't defining a class to mix in with:
@@ -287,8 +286,167 @@ class WrapIterable (Iterable):
         self.__seq = iter(seq)
     def __getattr__(self, key): return self.__get(key)
     def next(self): return self.__seq.next()
+    def _iterator_(self):
+        """The wrapped iterator, for use by Pipeline."""
+        return self.__seq
+    @classmethod
+    def _iterable_(cls, what): return cls(what)
+
+# Worker-process side of Pipeline.parallel(); module global, so the pool's
+# processes can find it:
+_stages = None
+def _runbatch(batch):
+    run, funcs = _stages
+    return run(batch, *funcs)
+
+class Pipeline (Iterable):
+    """A fused chain of map and filter stages over an iterable.
+
+    Obtain one from an Iterable's .pipeline() method.  Its .map() and
+    .filter() methods (which take the same arguments as Iterable's) return a
+    new Pipeline with the extra stages appended, rather than wrapping a
+    generator round a generator.  Iterating the pipeline runs all the stages
+    in one loop (compiled on first use, once per sequence of stage kinds),
+    so each entry costs one python-level loop iteration instead of one
+    generator resumption per stage.  Everything else Iterable provides
+    (reduce, sum, mean, ...) iterates this fused loop.
+
+    If a batch size is given (see .batched()), entries are taken from the
+    source that many at a time and each batch is passed through the stages
+    in a single call, which returns a list of the survivors; this spares the
+    consumer any generator overhead between entries.  Batches can also be
+    processed in a pool of threads or processes; see .parallel().\n"""
+
+    def __init__(self, src, stages=(), batch=None, pool=None):
+        """Internal constructor: use Iterable.pipeline() instead."""
+        if isinstance(src, WrapIterable): src = src._iterator_()
+        self.__src, self.__stages = src, tuple(stages)
+        self.__batch, self.__pool = batch, pool
+
     @classmethod
     def _iterable_(cls, what): return cls(what)
+
+    def __derive(self, stages=(), **what):
+        kw = { 'batch': self.__batch, 'pool': self.__pool }
+        kw.update(what)
+        return self.__class__(self.__src, self.__stages + tuple(stages), **kw)
+
+    def map(self, *funcs):
+        return self.__derive(('map', f) for f in funcs if f is not None)
+    map.__doc__ = Iterable.map.__doc__
+
+    def filter(self, *tests):
+        return self.__derive(('test', t) for t in tests)
+    filter.__doc__ = Iterable.filter.__doc__
+
+    def mapwith(self, func, *others):
+        # Has to pair up entries in the output, so can't be fused:
+        return Pipeline(Iterable.mapwith(self, func, *others),
+                        batch=self.__batch, pool=self.__pool)
+    mapwith.__doc__ = Iterable.mapwith.__doc__
+
+    def batched(self, size):
+        """Returns a copy of self that works on size entries at a time.
+
+        Pass None to get a copy that works one entry at a time.\n"""
+        assert size is None or size > 0
+        return self.__derive(batch=size)
+
+    def parallel(self, workers=None, processes=False, ordered=True):
+        """Returns a copy of self that processes batches in a pool.
+
+        All arguments are optional:
+          workers -- number of threads or processes; default None uses as
+                     many as there are CPUs
+          processes -- if true, use processes; default False, use threads
+          ordered -- if true (the default) output is in the order of the
+                     source; else in whatever order batches get finished.
+
+        Threads are only worth using when the stages release the GIL (e.g. do
+        I/O or call into C extensions); processes can run python code in
+        parallel, but each batch's entries and results must be picklable.
+        Since the pool is started by forking, the stages themselves need
+        not be picklable.  If self has no batch size, 256 is used.  Only two
+        batches per worker are read from the source ahead of the consumer.\n"""
+        batch = self.__batch or 256
+        return self.__derive(batch=batch, pool=(workers, processes, ordered))
+
+    def __iter__(self):
+        funcs = tuple(f for k, f in self.__stages if f is not None)
+        if self.__batch is None:
+            return self.__compile(self.__kinds(), False)(self.__src, *funcs)
+        return self.__batches(self.__compile(self.__kinds(), True), funcs)
+
+    def __kinds(self):
+        # Filter stages with None test need no function; distinguish them:
+        return tuple('true' if k == 'test' and f is None else k
+                     for k, f in self.__stages)
+
+    @staticmethod
+    def __compile(kinds, batch, cache={}):
+        """Generate a function running the given sequence of stages.
+
+        The stages' functions are passed as parameters after the source; the
+        batch form takes a list and returns a list, the other is a generator.
+        Do not pass a value for cache.\n"""
+        try: return cache[kinds, batch]
+        except KeyError: pass
+
+        names, body, i = [], [], 0
+        for kind in kinds:
+            if kind == 'true': body.append('if not p: continue')
+            else:
+                name = 's%d' % i
+                i += 1
+                names.append(name)
+                if kind == 'map': body.append('p = %s(p)' % name)
+                else: body.append('if not %s(p): continue' % name)
+        body.append('append(p)' if batch else 'yield p')
+
+        text = 'def run(src%s):\n' % ''.join(', ' + n for n in names)
+        if batch: text += ' out = []\n append = out.append\n'
+        text += ' for p in src:\n' + ''.join('  %s\n' % b for b in body)
+        if batch: text += ' return out\n'
+        glob = {}
+        exec text in glob
+        cache[kinds, batch] = ans = glob['run']
+        return ans
+
+    def __batches(self, run, funcs):
+        from itertools import islice
+        src, size = iter(self.__src), self.__batch
+        chunks = iter(lambda: list(islice(src, size)), [])
+        if self.__pool is None:
+            for chunk in chunks:
+                for it in run(chunk, *funcs): yield it
+            return
+
+        from study.snake.mapreduce import throttled
+        from multiprocessing import cpu_count
+        workers, processes, ordered = self.__pool
+        if processes:
+            from multiprocessing import Pool
+            pool = Pool(workers, self.__install, (run, funcs))
+            each = _runbatch
+        else:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(workers)
+            each = lambda chunk: run(chunk, *funcs)
+
+        outs = throttled(pool, each, chunks,
+                         2 * (workers or cpu_count()), ordered)
+        try:
+            for out in outs:
+                for it in out: yield it
+        finally:
+            outs.close()
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def __install(run, funcs):
+        global _stages
+        _stages = run, funcs
 
 class ReadSeq (Iterable):
     """Mix-in class extending Iterable to support most tuple methods.
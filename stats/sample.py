@@ -11,6 +11,19 @@ from study.cache.property import lazyprop
 from study.snake.sequence import Tuple
 
 class Sample (Tuple):
+    @classmethod
+    def fromSketch(cls, sketch, size=None):
+        """Representative Sample of the values summarised by a sketch.
+
+        Required argument, sketch, is a study.maths.quantile.Sketch; optional
+        size is the number of values to return, defaulting to the number the
+        sketch holds.  The i-th value returned is the sketch's estimate of the
+        (i + .5) / size quantile, so each stands for an equal share of the
+        values summarised; niles() and the like, on the result, approximate
+        those of all the values the sketch has seen, in bounded memory.\n"""
+        if size is None: size = len(sketch.weighted())
+        return cls(sketch.quantiles([(i + .5) / size for i in range(size)]))
+
     @lazyprop
     def span(self):
         full = self.sorted
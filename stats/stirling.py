@@ -53,9 +53,14 @@ def asreal(val):
     return val
 del postcompose
 
-from Pascal import factorial
+from study.maths.Pascal import factorial
 
-def lnfactorial(n, log=math.log):
+def lnfactorial(n, log=math.log, lgamma=math.lgamma):
+    """Natural logarithm of n!, computed as a sum of logarithms.
+
+    The sum takes O(n) time, so large n instead use math.lgamma(n+1), which is
+    quicker than even looking up a remembered answer.\n"""
+    if n > 0x1000: return lgamma(n + 1)
     result = 0.
     while n > 1: result, n = result + log(n), n-1
 
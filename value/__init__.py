@@ -11,5 +11,7 @@ Fragments:
 
 See study.LICENSE for copyright and license information.
 """
-import quantity
-import SI
+from study.cache.module import Package
+Package.install(__name__, ('archaea', 'bigfloat', 'object', 'quantity',
+                           'sample', 'SI', 'units'))
+del Package